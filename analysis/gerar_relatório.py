@@ -7,15 +7,24 @@ Código python para:
 - aplicar filtros básicos
 - remover outliers por Linha usando IQR (Quilometragem e Duracao_s)
 - gerar relatório analise_viagens.txt com as seções solicitadas
+- opcionalmente (--streaming), ler o CSV em partes com quantis aproximados e memória limitada
 """
 
 from pathlib import Path
+import argparse
+import importlib.util
 import re
 import math
+import sys
 import numpy as np
 import pandas as pd
 from datetime import timedelta
 
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from metricas import Metricas, adicionar_argumentos, fase
+
 # --- Configuração / constantes ---
 INPUT_FILES = ["viagens.csv", "viagens.xlsx", "viagens.xls"]
 OUTPUT_TXT = "analise_viagens2.txt"
@@ -50,13 +59,32 @@ def find_input_file():
             return p
     raise FileNotFoundError("Nenhum dos arquivos de entrada foi encontrado na pasta atual: " + ", ".join(INPUT_FILES))
 
+# Colunas de identificação, lidas sempre como texto
+ID_COLS = ["Viacao", "Linha", "Carro"]
+
+# Número simples (sem unidade), convertido direto sem passar pelas regras de parse
+NUMERO_SIMPLES = r"-?\d+(?:\.\d+)?"
+
+def id_dtypes(columns):
+    """dtype texto para as colunas (com o nome original) que viram Viacao, Linha ou Carro."""
+    padrao = standardize_columns(pd.DataFrame(columns=columns)).columns
+    return {orig: str for orig, nome in zip(columns, padrao) if nome in ID_COLS}
+
 def safe_read(file_path: Path):
-    """Lê CSV ou Excel automaticamente."""
+    """
+    Lê CSV ou Excel automaticamente, com as colunas de identificação como texto.
+    Colunas numéricas ficam com o tipo inferido pelo leitor (sem conversão linha a linha).
+    """
     if file_path.suffix.lower() in [".xls", ".xlsx"]:
-        return pd.read_excel(file_path)
+        # calamine (se instalado) lê planilhas muito mais rápido que o openpyxl
+        engine = "calamine" if importlib.util.find_spec("python_calamine") else None
+        columns = pd.read_excel(file_path, nrows=0, engine=engine).columns
+        return pd.read_excel(file_path, dtype=id_dtypes(columns), engine=engine)
     else:
-        # tenta autodetectar separador comum
-        return pd.read_csv(file_path)
+        # leitor multi-thread do pyarrow, se disponível
+        engine = "pyarrow" if importlib.util.find_spec("pyarrow") else None
+        columns = pd.read_csv(file_path, nrows=0).columns
+        return pd.read_csv(file_path, dtype=id_dtypes(columns), engine=engine)
 
 # Função para padronizar nomes de colunas
 def standardize_columns(df: pd.DataFrame):
@@ -80,7 +108,7 @@ def standardize_columns(df: pd.DataFrame):
             new_cols[col] = "Linha"
         elif re.search(r"carro|veiculo", col_ascii, re.IGNORECASE):
             new_cols[col] = "Carro"
-        elif re.search(r"quilom|km\b|quil", col_ascii, re.IGNORECASE):
+        elif re.search(r"quilom|kilom|km\b|quil", col_ascii, re.IGNORECASE):
             new_cols[col] = "Quilometragem"
         elif re.search(r"dura|tempo", col_ascii, re.IGNORECASE):
             new_cols[col] = "Duracao"
@@ -158,28 +186,197 @@ def parse_duration_to_seconds(x):
             return np.nan
     return np.nan
 
+def grouped_quantile(ordenados, inicio, contagem, q):
+    """
+    Quantil q de cada grupo, com os valores já ordenados por (grupo, valor).
+    Mesma interpolação linear de Series.quantile (np.quantile, method='linear').
+    """
+    if len(ordenados) == 0:
+        return np.full(len(contagem), np.nan)
+    n = np.maximum(contagem, 1)
+    virtual = (n - 1) * q
+    anterior = np.floor(virtual).astype(np.int64)
+    proximo = np.minimum(anterior + 1, n - 1)
+    gamma = virtual - anterior
+    # grupos vazios apontam para um valor qualquer (o resultado deles não é usado)
+    a = ordenados[np.minimum(inicio + anterior, len(ordenados) - 1)]
+    b = ordenados[np.minimum(inicio + proximo, len(ordenados) - 1)]
+    diff = b - a
+    return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+def text_cells(col: pd.Series):
+    """Máscara das células com texto (as demais são números ou vazias)."""
+    if col.dtype == object:
+        return col.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    return col.notna().to_numpy()
+
+def numeric_cells(col: pd.Series, texto):
+    """Série float com os valores das células numéricas (NaN nas de texto e nas vazias)."""
+    out = pd.Series(np.nan, index=col.index)
+    if col.dtype == object and (~texto).any():
+        out[~texto] = pd.to_numeric(col[~texto], errors="coerce").astype(float)
+    return out
+
+def parse_speed_values(col: pd.Series):
+    """Versão vetorizada de parse_speed_to_float."""
+    texto = text_cells(col)
+    out = numeric_cells(col, texto)
+    s = col[texto].astype(object)
+    simples = s.str.fullmatch(NUMERO_SIMPLES).astype(bool)
+    out[s.index[simples]] = s[simples].astype(float)
+    # só as células com unidade (ex: "30 km/h") passam pelas substituições
+    resto = s[~simples]
+    resto = (resto.str.replace(" ", "", regex=False).str.lower()
+             .str.replace("km/h", "", regex=False).str.replace(",", ".", regex=False)
+             .str.replace(r"[^0-9\.\-]", "", regex=True))
+    out[resto.index] = pd.to_numeric(resto, errors="coerce")
+    return out
+
+
+DURATION_UNITS = r"(\d+(\.\d+)?)(\s*)(h|hr|hrs|hora|horas|m|min|mins|minuto|minutos|s|sec|segs|segundo|segundos)\b"
+
+def parse_duration_values(col: pd.Series):
+    """Versão vetorizada de parse_duration_to_seconds."""
+    texto = text_cells(col)
+    out = numeric_cells(col, texto)
+    s = col[texto].astype(object).str.strip()
+    s = s[s != ""].str.replace(",", ".", regex=False)
+
+    simples = s.str.fullmatch(NUMERO_SIMPLES).astype(bool)
+    out[s.index[simples]] = s[simples].astype(float)
+    s = s[~simples]
+
+    # caso padrão HH:MM:SS ou MM:SS
+    hms = s.str.fullmatch(r"\d+:\d{1,2}(:\d{1,2})?").astype(bool)
+    if hms.any():
+        partes = s[hms].str.split(":", expand=True).astype(float)
+        if partes.shape[1] == 3:
+            tres = partes[2].notna()
+            h = partes[0].where(tres, 0.0)
+            m = partes[1].where(tres, partes[0])
+            sec = partes[2].where(tres, partes[1])
+        else:
+            h, m, sec = 0.0, partes[0], partes[1]
+        out[partes.index] = h * 3600 + m * 60 + sec
+    s = s[~hms]
+
+    # unidades explícitas: soma, na ordem, número x unidade de cada ocorrência
+    ocorrencias = s.str.extractall(DURATION_UNITS, flags=re.IGNORECASE)
+    com_unidade = ocorrencias.index.get_level_values(0).unique()
+    if len(com_unidade):
+        unidade = ocorrencias[3].str.lower()
+        fator = np.where(unidade.str.startswith("h"), 3600, np.where(unidade.str.startswith("m"), 60, 1))
+        parcela = ocorrencias[0].astype(float) * fator
+        total = pd.Series(0.0, index=com_unidade)
+        for _, p in parcela.groupby(level="match"):
+            p = p.droplevel("match")
+            total[p.index] += p
+        out[com_unidade] = total
+
+    # se for número simples, assume segundos (ou minutos? escolhi segundos)
+    sem_unidade = s[~s.index.isin(com_unidade)]
+    digits = sem_unidade.str.replace(r"[^\d\.\-]", "", regex=True)
+    out[digits.index] = pd.to_numeric(digits, errors="coerce")
+    return out
+
+def parse_km_values(col: pd.Series):
+    """Limpa vírgulas e unidades da quilometragem (só nas células que não são número simples)."""
+    s = col.astype(str).str.replace(",", ".", regex=False)
+    simples = s.str.fullmatch(NUMERO_SIMPLES).fillna(False).astype(bool)
+    s = s.where(simples, s[~simples].str.replace(r"[^\d\.\-]", "", regex=True))
+    return pd.to_numeric(s, errors="coerce")
+
+def parse_distinct(col: pd.Series, parser):
+    """
+    Aplica `parser` só aos valores distintos da coluna e espalha o resultado.
+    Colunas de texto com unidades repetem poucos valores (ex: "18 km/h").
+    """
+    codigos, unicos = pd.factorize(col)
+    # o código -1 (célula vazia) cai no NaN acrescentado no fim
+    valores = np.append(parser(pd.Series(unicos, dtype=object)).to_numpy(dtype=float), np.nan)
+    return pd.Series(valores[codigos], index=col.index)
+
+def parse_speed_column(col: pd.Series):
+    """Velocidade em float: direto se a coluna já é numérica, senão pelas regras de parse_speed_to_float."""
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(float)
+    return parse_distinct(col, parse_speed_values)
+
+def parse_km_column(col: pd.Series):
+    """Quilometragem numérica: direto se a coluna já é numérica, senão limpando o texto."""
+    if pd.api.types.is_numeric_dtype(col):
+        return col
+    return parse_distinct(col, parse_km_values)
+
+def parse_duration_column(col: pd.Series):
+    """Duração em segundos: direto se a coluna já é numérica, senão pelas regras de parse_duration_to_seconds."""
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(float)
+    return parse_distinct(col, parse_duration_values)
+
 def iqr_filter_groupwise(df, group_col, cols_to_check, k=1.5):
-    # Remove outliers por grupo usando IQR
-    df = df.copy()
-    mask_keep = pd.Series(True, index=df.index)
-    grouped = df.groupby(group_col)
-    for name, group in grouped:
-        idx = group.index
-        for col in cols_to_check:
-            # se a coluna não existir ou tiver poucos valores, pule
-            series = group[col].dropna().astype(float)
-            if series.shape[0] < 4:
-                # se poucos dados, não remover por IQR (evita apagar quase tudo)
-                continue
-            q1 = series.quantile(0.25)
-            q3 = series.quantile(0.75)
-            iqr = q3 - q1
-            low = q1 - k * iqr
-            high = q3 + k * iqr
-            # marcar como keep False para outliers
-            outlier_idx = series[(series < low) | (series > high)].index
-            mask_keep.loc[outlier_idx] = False
-    return df[mask_keep].copy()
+    # Remove outliers por grupo usando IQR, com os quartis de todos os grupos
+    # calculados de uma vez por coluna (sem laço em Python sobre os grupos)
+    codigos, grupos = pd.factorize(df[group_col])
+    n_grupos = len(grupos)
+    mask_keep = np.ones(len(df), dtype=bool)
+    for col in cols_to_check:
+        valores = df[col].to_numpy(dtype=float, na_value=np.nan)
+        # valores ausentes (ou sem grupo) não contam nem são removidos
+        validos = (codigos >= 0) & ~np.isnan(valores)
+        c = codigos[validos]
+        v = valores[validos]
+
+        ordenados = v[np.lexsort((v, c))]
+        contagem = np.bincount(c, minlength=n_grupos)
+        inicio = np.zeros(n_grupos, dtype=np.int64)
+        inicio[1:] = np.cumsum(contagem)[:-1]
+
+        q1 = grouped_quantile(ordenados, inicio, contagem, 0.25)
+        q3 = grouped_quantile(ordenados, inicio, contagem, 0.75)
+        iqr = q3 - q1
+        low = q1 - k * iqr
+        high = q3 + k * iqr
+        # se poucos dados, não remover por IQR (evita apagar quase tudo)
+        poucos = contagem < 4
+        low[poucos] = -np.inf
+        high[poucos] = np.inf
+
+        # marcar como keep False para outliers
+        outlier = np.zeros(len(df), dtype=bool)
+        outlier[validos] = (v < low[c]) | (v > high[c])
+        mask_keep &= ~outlier
+    return df[mask_keep]
+
+# Dimensões do cubo de agregação usado nas seções do relatório
+CUBE_DIMENSIONS = ["Linha", "Viacao", "Carro"]
+
+def build_cube(df, dimensions=CUBE_DIMENSIONS):
+    """
+    Calcula, com um único groupby por dimensão, todas as métricas do relatório:
+    viagens (contagem de Carro), soma e mediana da quilometragem e mediana da velocidade.
+    Retorna {dimensão: DataFrame indexado pela chave}.
+    """
+    cube = {}
+    for dim in dimensions:
+        cube[dim] = df.groupby(dim).agg(
+            viagens=("Carro", "count"),
+            soma_km=("Quilometragem", "sum"),
+            mediana_km=("Quilometragem", "median"),
+            mediana_vel=("Velocidade_Media", "median"),
+        )
+    return cube
+
+def export_cube(cube, path):
+    """Grava o cubo em formato longo (dimensao, chave, métricas) em .parquet ou .csv."""
+    path = Path(path)
+    table = pd.concat([c.rename_axis("chave").reset_index().assign(dimensao=dim) for dim, c in cube.items()],
+                      ignore_index=True)
+    table = table[["dimensao", "chave"] + [c for c in table.columns if c not in ("dimensao", "chave")]]
+    if path.suffix.lower() == ".parquet":
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
 
 def top_n_series(s: pd.Series, n=10, ascending=False):
     """Retorna a dulpa index, valor do top n da série (ordenada por valor)"""
@@ -195,115 +392,316 @@ def format_top_list(pairs):
         lines.append(f"{i:2d}. {k} — {v}")
     return "\n".join(lines)
 
-# --- Pipeline principal ---
-def main():
-    try:
-        input_path = find_input_file()
-    except FileNotFoundError as e:
-        print(str(e))
-        return
-
-    print(f"Lendo arquivo: {input_path}")
-    df = safe_read(input_path)
-
-    # Padroniza nomes das colunas
-    df = standardize_columns(df)
-
-    # Verifica presença das colunas esperadas
+def warn_missing_columns(df):
+    """Avisa se alguma coluna esperada não foi encontrada (o relatório continua mesmo assim)."""
     expected = ["Viacao", "Linha", "Carro", "Quilometragem", "Duracao", "Velocidade_Media"]
     missing = [c for c in expected if c not in df.columns]
     if missing:
         print("Aviso: as seguintes colunas esperadas não foram encontradas automaticamente:", missing)
         print("Colunas detectadas:", list(df.columns))
-        # Continua mesmo se faltar alguma coluna
 
-    # Normaliza e cria as colunas desejadas
+def prepare_frame(df):
+    """
+    Normaliza as colunas (Quilometragem, Velocidade_Media e Duracao_s) de um DataFrame
+    com nomes já padronizados e remove as linhas sem Linha e sem Carro.
+    """
     # Quilometragem
     if "Quilometragem" in df.columns:
         # tentar converter limpando vírgulas e pontos
-        df["Quilometragem"] = pd.to_numeric(df["Quilometragem"].astype(str).str.replace(",", ".").str.replace(r"[^\d\.\-]", "", regex=True), errors="coerce")
+        df["Quilometragem"] = parse_km_column(df["Quilometragem"])
     else:
         df["Quilometragem"] = np.nan
 
     # Velocidade_Media (limpar " km/h")
     if "Velocidade_Media" in df.columns:
-        df["Velocidade_Media"] = df["Velocidade_Media"].apply(parse_speed_to_float)
+        df["Velocidade_Media"] = parse_speed_column(df["Velocidade_Media"])
     else:
         df["Velocidade_Media"] = np.nan
 
     # Duracao -> Duracao_s em segundos
     if "Duracao" in df.columns:
-        df["Duracao_s"] = df["Duracao"].apply(parse_duration_to_seconds)
+        df["Duracao_s"] = parse_duration_column(df["Duracao"])
     elif "Duracao_s" in df.columns:
         df["Duracao_s"] = pd.to_numeric(df["Duracao_s"], errors="coerce")
     else:
         df["Duracao_s"] = np.nan
 
     # Remover linhas totalmente vazias essenciais
-    df = df.dropna(subset=["Linha", "Carro"], how="all")
-    # Filtros básicos para descartar viagens inválidas
-    before_count = len(df)
+    return df.dropna(subset=["Linha", "Carro"], how="all")
+
+def basic_filter(df):
+    """Filtros básicos para descartar viagens inválidas."""
     filt_basic = (
         (df["Quilometragem"].fillna(-1) > 1) &
         (df["Duracao_s"].fillna(-1) > 60) &
         (df["Velocidade_Media"].fillna(-1) >= 10)
     )
-    df = df[filt_basic].copy()
-    after_basic_count = len(df)
+    return df[filt_basic].copy()
+
+# Colunas em que os outliers são removidos, por Linha
+COLS_FOR_IQR = ["Quilometragem", "Duracao_s"]
+IQR_K = 1.5
+
+def exact_cube(input_path):
+    """
+    Modo padrão: carrega o arquivo inteiro, limpa e calcula o cubo com valores exatos.
+    Retorna (cube, contagens).
+    """
+    with fase('ler'):
+        df = safe_read(input_path)
+
+    with fase('limpar'):
+        # Padroniza nomes das colunas
+        df = standardize_columns(df)
+        warn_missing_columns(df)
+
+        # Normaliza e cria as colunas desejadas
+        df = prepare_frame(df)
+        before_count = len(df)
+        df = basic_filter(df)
+        after_basic_count = len(df)
     print(f"Linhas antes dos filtros básicos: {before_count}, após filtros básicos: {after_basic_count}")
 
     # Remoção de outliers por Linha (IQR) nas colunas Quilometragem e Duracao_s
-    cols_for_iqr = ["Quilometragem", "Duracao_s"]
-    df_clean = iqr_filter_groupwise(df, group_col="Linha", cols_to_check=cols_for_iqr, k=1.5)
+    with fase('iqr'):
+        df_clean = iqr_filter_groupwise(df, group_col="Linha", cols_to_check=COLS_FOR_IQR, k=IQR_K)
     after_iqr_count = len(df_clean)
     print(f"Linhas após remoção de outliers por Linha (IQR): {after_iqr_count}")
 
-    # A partir daqui, todos os cálculos são feitos em df_clean
-    dfc = df_clean.copy()
-
-    # Funções para gerar rankings por mediana / soma / count
-    def group_stats(groupby_cols, value_col, agg="median"):
-        g = dfc.groupby(groupby_cols)[value_col]
-        if agg == "median":
-            return g.median().sort_values(ascending=False)
-        elif agg == "sum":
-            return g.sum().sort_values(ascending=False)
-        elif agg == "count":
-            return g.count().sort_values(ascending=False)
-        elif agg == "median_asc":
-            return g.median().sort_values(ascending=True)
-        else:
-            raise ValueError("agg unknown")
+    # Todas as métricas por Linha, Viacao e Carro, em um único groupby por dimensão
+    with fase('agregar'):
+        cube = build_cube(df_clean)
+    return cube, (before_count, after_basic_count, after_iqr_count)
+
+# --- Modo streaming (memória limitada) ---
+STREAM_CHUNKSIZE = 500_000
+# Erro relativo máximo dos quantis aproximados
+SKETCH_ERROR = 0.005
+# Bucket dos valores <= 0 (fora da escala logarítmica)
+ZERO_BUCKET = -(2 ** 40)
+
+class GroupedQuantileSketch:
+    """
+    Esboço de quantis por grupo com erro relativo limitado (buckets em escala
+    logarítmica, como no DDSketch): todo quantil estimado fica a no máximo
+    `rel_error` (relativo) do valor exato. Guarda, por (grupo, bucket), a
+    contagem e o menor/maior valor; esboços de partes diferentes se juntam
+    somando contagens, então a memória depende do número de grupos e buckets,
+    e não do número de viagens. O menor/maior valor torna exatos os buckets
+    com um só valor distinto (caso comum com valores inteiros).
+    """
+
+    def __init__(self, rel_error=SKETCH_ERROR, compact_every=1_000_000):
+        self.rel_error = rel_error
+        self.log_gamma = math.log((1 + rel_error) / (1 - rel_error))
+        self.compact_every = compact_every
+        self._parts = []
+        self._pending = 0
+
+    def add(self, groups: pd.Series, values: pd.Series):
+        """Acrescenta valores (ignorando NaN e grupos ausentes)."""
+        v = values.to_numpy(dtype=float, na_value=np.nan)
+        ok = ~np.isnan(v) & groups.notna().to_numpy()
+        v = v[ok]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bucket = np.where(v > 0, np.ceil(np.log(v) / self.log_gamma), ZERO_BUCKET).astype(np.int64)
+        part = (pd.DataFrame({"grupo": groups.to_numpy()[ok], "bucket": bucket, "v": v})
+                .groupby(["grupo", "bucket"])["v"].agg(["size", "min", "max"]))
+        self._append(part)
+
+    def merge(self, other):
+        """Incorpora outro esboço (com o mesmo erro relativo)."""
+        if other.log_gamma != self.log_gamma:
+            raise ValueError("só é possível juntar esboços com o mesmo erro relativo")
+        for part in other._parts:
+            self._append(part)
+
+    def _append(self, part):
+        self._parts.append(part)
+        self._pending += len(part)
+        if self._pending >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        if len(self._parts) > 1:
+            table = pd.concat(self._parts).groupby(level=[0, 1]).agg({"size": "sum", "min": "min", "max": "max"})
+            self._parts = [table]
+        self._pending = 0
+
+    def counts(self):
+        """Número de valores por grupo (exato)."""
+        self._compact()
+        if not self._parts:
+            return pd.Series(dtype=np.int64)
+        return self._parts[0]["size"].groupby(level=0).sum()
+
+    def quantiles(self, qs):
+        """
+        DataFrame (grupo x q) com os quantis, usando a mesma posição (n - 1) * q
+        da interpolação linear de np.quantile.
+        """
+        self._compact()
+        if not self._parts:
+            return pd.DataFrame(columns=list(qs), dtype=float)
+        table = self._parts[0].sort_index()
+        codes, keys = pd.factorize(table.index.get_level_values(0))
+        size = table["size"].to_numpy(dtype=np.int64)
+        bucket = table.index.get_level_values(1).to_numpy()
+        # valor representativo de cada bucket, limitado ao menor/maior valor visto nele
+        gamma = math.exp(self.log_gamma)
+        with np.errstate(over="ignore"):
+            center = np.where(bucket == ZERO_BUCKET, 0.0, 2 * np.exp(bucket * self.log_gamma) / (gamma + 1))
+        estimate = np.clip(center, table["min"].to_numpy(), table["max"].to_numpy())
+
+        cum = np.cumsum(size)
+        n = np.bincount(codes, weights=size).astype(np.int64)
+        base = np.cumsum(n) - n
+        out = {}
+        for q in qs:
+            virtual = (n - 1) * q
+            lower = np.floor(virtual)
+            a = estimate[np.searchsorted(cum, base + lower, side="right")]
+            b = estimate[np.searchsorted(cum, base + np.minimum(lower + 1, n - 1), side="right")]
+            out[q] = a + (b - a) * (virtual - lower)
+        return pd.DataFrame(out, index=keys)
+
+def read_chunks(input_path, chunksize):
+    """Lê o CSV em partes, já com colunas padronizadas e normalizadas (antes dos filtros básicos)."""
+    columns = pd.read_csv(input_path, nrows=0).columns
+    warn_missing_columns(standardize_columns(pd.DataFrame(columns=columns)))
+    for chunk in pd.read_csv(input_path, dtype=id_dtypes(columns), chunksize=chunksize):
+        yield prepare_frame(standardize_columns(chunk))
+
+def fase_iter(iterable, name):
+    """Percorre `iterable` somando à fase `name` o tempo de produzir cada item."""
+    iterator = iter(iterable)
+    while True:
+        with fase(name):
+            item = next(iterator, None)
+        if item is None:
+            return
+        yield item
+
+def add_totals(totals, part):
+    """Soma contagens/somas por grupo de uma parte às acumuladas."""
+    return part if totals is None else totals.add(part, fill_value=0)
+
+def streaming_cube(input_path, chunksize=STREAM_CHUNKSIZE, rel_error=SKETCH_ERROR):
+    """
+    Modo streaming: duas leituras do CSV em partes. A primeira monta os esboços
+    dos quartis por Linha (limites do IQR); a segunda aplica os filtros e acumula
+    contagens e somas exatas e os esboços das medianas de cada dimensão.
+    Retorna (cube, contagens, notas sobre o erro).
+    """
+    # 1ª passada: quartis por Linha para o filtro IQR
+    before_count = after_basic_count = 0
+    iqr_sketches = {col: GroupedQuantileSketch(rel_error) for col in COLS_FOR_IQR}
+    for chunk in fase_iter(read_chunks(input_path, chunksize), 'ler'):
+        before_count += len(chunk)
+        chunk = basic_filter(chunk)
+        after_basic_count += len(chunk)
+        for col, sketch in iqr_sketches.items():
+            sketch.add(chunk["Linha"], chunk[col])
+    print(f"Linhas antes dos filtros básicos: {before_count}, após filtros básicos: {after_basic_count}")
+
+    bounds = {}
+    for col, sketch in iqr_sketches.items():
+        q = sketch.quantiles([0.25, 0.75])
+        q1, q3 = q[0.25], q[0.75]
+        iqr = q3 - q1
+        low = q1 - IQR_K * iqr
+        high = q3 + IQR_K * iqr
+        # se poucos dados, não remover por IQR (evita apagar quase tudo)
+        poucos = sketch.counts().reindex(q.index) < 4
+        low[poucos] = -np.inf
+        high[poucos] = np.inf
+        # incerteza dos limites, herdada do erro relativo dos quartis
+        margin = rel_error * ((1 + IQR_K) * q1.abs() + IQR_K * q3.abs())
+        bounds[col] = (low, high, margin.where(~poucos, 0.0))
+
+    # 2ª passada: filtros e métricas de cada dimensão
+    after_iqr_count = 0
+    uncertain = 0
+    totals = {dim: None for dim in CUBE_DIMENSIONS}
+    km_sketches = {dim: GroupedQuantileSketch(rel_error) for dim in CUBE_DIMENSIONS}
+    vel_sketches = {dim: GroupedQuantileSketch(rel_error) for dim in CUBE_DIMENSIONS}
+    for chunk in fase_iter(read_chunks(input_path, chunksize), 'ler'):
+        chunk = basic_filter(chunk)
+        keep = np.ones(len(chunk), dtype=bool)
+        near = np.zeros(len(chunk), dtype=bool)
+        for col, (low, high, margin) in bounds.items():
+            v = chunk[col].to_numpy(dtype=float, na_value=np.nan)
+            # linhas sem limite (ou valores ausentes) dão NaN e não são removidas
+            lo = low.reindex(chunk["Linha"]).to_numpy(dtype=float)
+            hi = high.reindex(chunk["Linha"]).to_numpy(dtype=float)
+            m = margin.reindex(chunk["Linha"]).to_numpy(dtype=float)
+            keep &= ~((v < lo) | (v > hi))
+            near |= (np.abs(v - lo) <= m) | (np.abs(v - hi) <= m)
+        uncertain += int(near.sum())
+        chunk = chunk[keep]
+        after_iqr_count += len(chunk)
+
+        for dim in CUBE_DIMENSIONS:
+            part = chunk.groupby(dim).agg(viagens=("Carro", "count"), soma_km=("Quilometragem", "sum"))
+            totals[dim] = add_totals(totals[dim], part)
+            km_sketches[dim].add(chunk[dim], chunk["Quilometragem"])
+            vel_sketches[dim].add(chunk[dim], chunk["Velocidade_Media"])
+    print(f"Linhas após remoção de outliers por Linha (IQR): {after_iqr_count}")
+
+    cube = {}
+    for dim in CUBE_DIMENSIONS:
+        t = totals[dim] if totals[dim] is not None else pd.DataFrame(columns=["viagens", "soma_km"])
+        t = t.sort_index()
+        cube[dim] = pd.DataFrame({
+            "viagens": t["viagens"].astype(np.int64),
+            "soma_km": t["soma_km"],
+            "mediana_km": km_sketches[dim].quantiles([0.5])[0.5].reindex(t.index),
+            "mediana_vel": vel_sketches[dim].quantiles([0.5])[0.5].reindex(t.index),
+        })
+
+    notes = (
+        f"Modo streaming: medianas e limites do IQR aproximados (erro relativo <= {rel_error:g}); "
+        "contagens e somas exatas sobre as viagens mantidas.",
+        f"Viagens dentro da margem de erro dos limites do IQR (podem ter sido classificadas diferente do modo exato): {uncertain}",
+    )
+    return cube, (before_count, after_basic_count, after_iqr_count), notes
 
+def write_report(cube, counts, notes=(), output=OUTPUT_TXT):
+    """Grava o relatório com os rankings das seções a partir do cubo."""
+    before_count, after_basic_count, after_iqr_count = counts
+
+    # Rankings (do maior para o menor) a partir do cubo
+    def ranking(dim, metric):
+        return cube[dim][metric].sort_values(ascending=False)
     # Seção 1: Análise de Linhas (por mediana)
-    linha_med_quil = group_stats("Linha", "Quilometragem", agg="median")
+    linha_med_quil = ranking("Linha", "mediana_km")
     linha_med_quil_min = linha_med_quil.sort_values(ascending=True)
-    linha_med_vel = group_stats("Linha", "Velocidade_Media", agg="median")
+    linha_med_vel = ranking("Linha", "mediana_vel")
     linha_med_vel_min = linha_med_vel.sort_values(ascending=True)
 
     # Seção 2: Análise de Viações (Viacao)
-    viac_med_quil = group_stats("Viacao", "Quilometragem", agg="median")
+    viac_med_quil = ranking("Viacao", "mediana_km")
     viac_med_quil_min = viac_med_quil.sort_values(ascending=True)
-    viac_med_vel = group_stats("Viacao", "Velocidade_Media", agg="median")
+    viac_med_vel = ranking("Viacao", "mediana_vel")
     viac_med_vel_min = viac_med_vel.sort_values(ascending=True)
 
     # Seção 3: Total de Viagens (Contagem)
-    linha_count = group_stats("Linha", "Carro", agg="count")  # contar pelo Carro dentro de Linha é equivalente a contar viagens por linha
+    linha_count = ranking("Linha", "viagens")  # contar pelo Carro dentro de Linha é equivalente a contar viagens por linha
     linha_count_min = linha_count.sort_values(ascending=True)
-    viac_count = group_stats("Viacao", "Carro", agg="count")
+    viac_count = ranking("Viacao", "viagens")
     viac_count_min = viac_count.sort_values(ascending=True)
 
     # Seção 4: Quilometragem Total (Soma)
-    linha_sum_km = group_stats("Linha", "Quilometragem", agg="sum")
+    linha_sum_km = ranking("Linha", "soma_km")
     linha_sum_km_min = linha_sum_km.sort_values(ascending=True)
-    viac_sum_km = group_stats("Viacao", "Quilometragem", agg="sum")
+    viac_sum_km = ranking("Viacao", "soma_km")
     viac_sum_km_min = viac_sum_km.sort_values(ascending=True)
 
     # Seção 5: Análise de Carro (mediana da velocidade) com condição >=10 viagens
-    carro_counts = dfc.groupby("Carro").size()
-    carros_validos = carro_counts[carro_counts >= 10].index
-    carro_med_vel = dfc[dfc["Carro"].isin(carros_validos)].groupby("Carro")["Velocidade_Media"].median().sort_values(ascending=False)
-    carro_med_vel_min = dfc[dfc["Carro"].isin(carros_validos)].groupby("Carro")["Velocidade_Media"].median().sort_values(ascending=True)
+    carros = cube["Carro"]
+    carro_vel = carros.loc[carros["viagens"] >= 10, "mediana_vel"]
+    carro_med_vel = carro_vel.sort_values(ascending=False)
+    carro_med_vel_min = carro_vel.sort_values(ascending=True)
     # Prepara conteúdo do relatório
     # Função utilitária para formatar rankings
     def top_to_text(series, n=10, reverse=False, fmt_val="{:.3f}"):
@@ -323,11 +721,14 @@ def main():
             lines.append(f"{i:2d}. {idx} — {val_str}")
         return "\n".join(lines) + "\n"
 
-    with open(OUTPUT_TXT, "w", encoding="utf-8") as f:
+    with open(output, "w", encoding="utf-8") as f:
         f.write("ANÁLISE DE VIAGENS\n")
         f.write("="*60 + "\n\n")
-        f.write(f"Total de viagens após limpeza: {len(dfc)}\n")
-        f.write(f"Linhas antes dos filtros: {before_count}; após filtros básicos: {after_basic_count}; após IQR: {after_iqr_count}\n\n")
+        f.write(f"Total de viagens após limpeza: {after_iqr_count}\n")
+        f.write(f"Linhas antes dos filtros: {before_count}; após filtros básicos: {after_basic_count}; após IQR: {after_iqr_count}\n")
+        for note in notes:
+            f.write(note + "\n")
+        f.write("\n")
 
         # Cada seção do relatório apresenta um ranking diferente
         f.write("SEÇÃO 1 — ANÁLISE DE LINHAS (POR MEDIANA)\n")
@@ -376,6 +777,49 @@ def main():
         f.write("\n- Top 10 Carros MAIS LENTOS (>=10 viagens)\n")
         f.write(top_to_text(carro_med_vel_min, 10, reverse=True, fmt_val="{:.3f}"))
 
+
+# --- Pipeline principal ---
+def main():
+    parser = argparse.ArgumentParser(description="Gera o relatório de análise das viagens.")
+    parser.add_argument("--cubo", default=None,
+                        help="exporta também o cubo de agregação (.parquet ou .csv)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="lê o CSV em partes, com medianas e limites do IQR aproximados (memória limitada)")
+    parser.add_argument("--chunksize", type=int, default=STREAM_CHUNKSIZE,
+                        help=f"linhas por parte no modo streaming (padrão: {STREAM_CHUNKSIZE})")
+    parser.add_argument("--erro", type=float, default=SKETCH_ERROR,
+                        help=f"erro relativo máximo dos quantis no modo streaming (padrão: {SKETCH_ERROR})")
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    try:
+        input_path = find_input_file()
+    except FileNotFoundError as e:
+        print(str(e))
+        return
+
+    print(f"Lendo arquivo: {input_path}")
+    if args.streaming and input_path.suffix.lower() != ".csv":
+        print("O modo streaming só lê CSV; converta a planilha ou rode sem --streaming.")
+        return
+
+    with Metricas("relatorio", args) as metricas:
+        metricas.lidos(input_path)
+        metricas.gravados(OUTPUT_TXT)
+        if args.streaming:
+            cube, counts, notes = streaming_cube(input_path, args.chunksize, args.erro)
+        else:
+            cube, counts = exact_cube(input_path)
+            notes = ()
+        metricas.registros = counts[0]
+
+        if args.cubo:
+            export_cube(cube, args.cubo)
+            metricas.gravados(args.cubo)
+            print(f"Cubo de agregação exportado: {args.cubo}")
+
+        with fase("gravar"):
+            write_report(cube, counts, notes)
     print(f"Relatório gerado: {OUTPUT_TXT}")
 
 if __name__ == "__main__":
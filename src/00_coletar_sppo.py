@@ -0,0 +1,217 @@
+"""
+Coleta os registros de GPS da API do SPPO em snapshots horários (pasta sppo/).
+
+Cada hora é pedida à API em janelas de --janela minutos que não se sobrepõem
+(de HH:MM:00 a HH:MM+N-1:59), baixadas em paralelo por um pool de conexões
+reaproveitadas (no máximo --concorrencia requisições ao mesmo tempo). Falhas
+de rede, respostas 5xx e 429 são repetidas com espera exponencial (com
+jitter, respeitando o Retry-After). A hora só é gravada quando todas as suas
+janelas chegaram, em registros_AAAA-MM-DD-HH.json.gz (ou no formato de
+--compressao, ver snapshots_sppo.py), lido diretamente pela etapa 02 e por
+tools/verificar_dados_sppo.py.
+
+As horas entre --inicio e --fim que ainda não têm arquivo são baixadas (uma
+hora só é pedida --atraso minutos depois de terminar); horas que falharam ou
+vieram vazias ficam sem arquivo e são tentadas de novo na próxima execução.
+Com --continuo, a coleta continua acompanhando as horas que vão terminando.
+
+Uso:
+    python src/00_coletar_sppo.py --inicio 2025-11-01 --fim 2025-11-07
+    python src/00_coletar_sppo.py --continuo
+    python src/00_coletar_sppo.py --url http://127.0.0.1:8000/gps/sppo --inicio 2025-11-01   # servidor de teste
+"""
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import random
+import sys
+from cliente_http import ErroHTTP, PoolHTTP
+from metricas import Metricas, adicionar_argumentos, contar
+from snapshots_sppo import EXTENSOES, FUSO, disponivel, gravar_snapshot, listar_snapshots, nome_snapshot
+
+URL = 'https://dados.mobilidade.rio/gps/sppo'
+
+# Minutos de cada requisição à API
+JANELA = 10
+
+# Requisições simultâneas (e conexões mantidas abertas)
+CONCORRENCIA = 4
+
+# Tentativas por janela e espera (s) antes da segunda, dobrando até ESPERA_MAX
+TENTATIVAS = 6
+ESPERA_BASE = 1.0
+ESPERA_MAX = 60.0
+
+# Minutos após o fim de uma hora antes de pedi-la (registros que chegam atrasados ao servidor)
+ATRASO = 10
+
+
+# Formato das datas aceito pela API
+def formatar(instante):
+    return instante.strftime('%Y-%m-%d %H:%M:%S')
+
+# Janelas (início, fim, inclusive no segundo) da hora `hora` do dia `dia`
+def janelas(dia, hora, minutos):
+    inicio = datetime(dia.year, dia.month, dia.day, hora, tzinfo=FUSO)
+    return [(inicio + timedelta(minutes=m), inicio + timedelta(minutes=m + minutos, seconds=-1))
+            for m in range(0, 60, minutos)]
+
+# Horas de `inicio` a `fim` (inclusive) que já terminaram há pelo menos `atraso` minutos
+def horas_fechadas(inicio, fim, atraso, agora=None):
+    agora = agora or datetime.now(FUSO)
+    horas = []
+    dia = inicio
+    while dia <= fim:
+        for hora in range(24):
+            termino = datetime(dia.year, dia.month, dia.day, hora, tzinfo=FUSO) + timedelta(hours=1)
+            if termino + timedelta(minutes=atraso) <= agora:
+                horas.append((dia, hora))
+        dia += timedelta(days=1)
+    return horas
+
+# Espera antes da tentativa seguinte: exponencial com jitter, ou o Retry-After do servidor
+def espera(tentativa, erro=None):
+    if isinstance(erro, ErroHTTP) and erro.cabecalhos.get('retry-after', '').isdigit():
+        return min(ESPERA_MAX, float(erro.cabecalhos['retry-after']))
+    return min(ESPERA_MAX, ESPERA_BASE * 2**tentativa) * random.uniform(0.5, 1.0)
+
+# Registros de uma janela, repetindo as falhas temporárias
+async def baixar_janela(pool, url, inicio, fim, tentativas=TENTATIVAS):
+    parametros = {'dataInicial': formatar(inicio), 'dataFinal': formatar(fim)}
+    for tentativa in range(tentativas):
+        try:
+            corpo = await pool.get(url, parametros)
+            contar('requisicoes')
+            contar('bytes_recebidos', len(corpo))
+            return json.loads(corpo)
+        except ErroHTTP as e:
+            # Erros do cliente (exceto 429) não mudam com nova tentativa
+            if e.status < 500 and e.status != 429:
+                raise
+            erro = e
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            erro = e
+        contar('retentativas')
+        if tentativa == tentativas - 1:
+            raise erro
+        await asyncio.sleep(espera(tentativa, erro))
+
+# Baixa todas as janelas de uma hora e grava o snapshot; retorna o número de registros
+async def coletar_hora(pool, args, dia, hora):
+    partes = await asyncio.gather(*(baixar_janela(pool, args.url, a, b, args.tentativas)
+                                    for a, b in janelas(dia, hora, args.janela)))
+
+    # As janelas não se sobrepõem, mas um mesmo registro repetido pela API é gravado uma vez
+    vistos = set()
+    registros = []
+    for parte in partes:
+        for r in parte:
+            chave = (r['ordem'], r['datahora'])
+            if chave not in vistos:
+                vistos.add(chave)
+                registros.append(r)
+    if registros:
+        # A compressão roda numa thread (o zlib libera o GIL) para não parar as outras requisições
+        await asyncio.to_thread(gravar_snapshot, Path(args.pasta) / nome_snapshot(dia, hora, args.compressao),
+                                json.dumps(registros).encode(), args.compressao)
+        contar('registros', len(registros))
+    return len(registros)
+
+# Coleta as horas pendentes, `args.concorrencia` horas por vez; retorna as que falharam ou vieram vazias
+async def coletar_horas(pool, args, horas):
+    fila = asyncio.Queue()
+    for h in horas:
+        fila.put_nowait(h)
+    pendentes = []
+
+    async def trabalhador():
+        while not fila.empty():
+            dia, hora = fila.get_nowait()
+            rotulo = f'{dia} {hora:02d}h'
+            try:
+                n = await coletar_hora(pool, args, dia, hora)
+            except Exception as e:
+                print(f'{rotulo}: falhou ({e})', file=sys.stderr)
+                pendentes.append((dia, hora))
+                continue
+            if n:
+                print(f'{rotulo}: {n} registros')
+            else:
+                print(f'{rotulo}: sem registros, será pedida de novo', file=sys.stderr)
+                pendentes.append((dia, hora))
+
+    await asyncio.gather(*(trabalhador() for _ in range(min(args.concorrencia, len(horas)))))
+    return sorted(pendentes)
+
+# Horas do período que ainda não têm snapshot
+def horas_faltando(args, agora=None):
+    fim = args.fim or datetime.now(FUSO).date()
+    existentes = listar_snapshots(args.pasta)
+    return [h for h in horas_fechadas(args.inicio, fim, args.atraso, agora) if h not in existentes]
+
+async def coletar(args):
+    Path(args.pasta).mkdir(parents=True, exist_ok=True)
+    async with PoolHTTP(conexoes=args.concorrencia, tempo_limite=args.tempo_limite) as pool:
+        while True:
+            faltando = horas_faltando(args)
+            if faltando:
+                print(f'{len(faltando)} horas a coletar ({faltando[0][0]} {faltando[0][1]:02d}h a '
+                      f'{faltando[-1][0]} {faltando[-1][1]:02d}h)')
+                pendentes = await coletar_horas(pool, args, faltando)
+                if pendentes:
+                    print(f'{len(pendentes)} horas sem snapshot', file=sys.stderr)
+            if not args.continuo:
+                break
+
+            # Dorme até a próxima hora poder ser pedida (ou um pouco, para repetir as que falharam)
+            agora = datetime.now(FUSO)
+            proxima = agora.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1, minutes=args.atraso)
+            if proxima - timedelta(hours=1) > agora:
+                proxima -= timedelta(hours=1)
+            segundos = (proxima - agora).total_seconds()
+            if horas_faltando(args):
+                segundos = min(segundos, 300)
+            await asyncio.sleep(max(segundos, 1.0))
+    print(f'{pool.abertas} conexões abertas no total')
+
+def main():
+    parser = argparse.ArgumentParser(description='Coleta os registros da API do SPPO em snapshots horários.')
+    parser.add_argument('--url', default=URL, help=f'endereço da API (padrão: {URL})')
+    parser.add_argument('--pasta', default='sppo', help='pasta dos snapshots (padrão: sppo/)')
+    parser.add_argument('--inicio', type=date.fromisoformat, default=None,
+                        help='primeiro dia coletado, AAAA-MM-DD (padrão: hoje)')
+    parser.add_argument('--fim', type=date.fromisoformat, default=None,
+                        help='último dia coletado, AAAA-MM-DD (padrão: hoje)')
+    parser.add_argument('--continuo', action='store_true',
+                        help='continua coletando cada hora que termina')
+    parser.add_argument('--janela', type=int, default=JANELA, choices=[1, 2, 3, 4, 5, 6, 10, 12, 15, 20, 30, 60],
+                        help=f'minutos por requisição (padrão: {JANELA})')
+    parser.add_argument('--concorrencia', type=int, default=CONCORRENCIA,
+                        help=f'requisições simultâneas (padrão: {CONCORRENCIA})')
+    parser.add_argument('--tentativas', type=int, default=TENTATIVAS,
+                        help=f'tentativas por requisição (padrão: {TENTATIVAS})')
+    parser.add_argument('--tempo-limite', type=float, default=120.0,
+                        help='segundos máximos por requisição (padrão: 120)')
+    parser.add_argument('--atraso', type=int, default=ATRASO,
+                        help=f'minutos após o fim de uma hora antes de pedi-la (padrão: {ATRASO})')
+    parser.add_argument('--compressao', choices=[c for c in EXTENSOES if c], default='gzip',
+                        help='compressão dos snapshots gravados (padrão: gzip; zstd requer o pacote zstandard)')
+    parser.add_argument('--sem-compressao', dest='compressao', action='store_const', const=None,
+                        help='grava registros_*.json sem compressão')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    args.inicio = args.inicio or datetime.now(FUSO).date()
+    if not disponivel(args.compressao):
+        parser.error(f'a compressão {args.compressao} requer o pacote zstandard')
+
+    with Metricas('coleta', args) as metricas:
+        metricas.gravados(args.pasta)
+        try:
+            asyncio.run(coletar(args))
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
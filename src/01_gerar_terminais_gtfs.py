@@ -1,12 +1,50 @@
-import pandas as pd
+import argparse
 import warnings
 import json
-import time
-from tqdm import tqdm
+from cache_gtfs import carregar_gtfs
+from metricas import Metricas, adicionar_argumentos, fase, progresso
 
-def analisar_terminais_da_linha(route_name, routes_df, trips_df, stop_times_df, stops_df):
+def indexar_gtfs(routes_df, trips_df, stop_times_df, stops_df):
     """
-    Função interna que analisa uma única linha.
+    Monta, uma única vez, os índices usados para achar os terminais:
+        - route_id de cada nome de linha (route_short_name e route_desc)
+        - primeira viagem de cada (route_id, direction_id)
+        - primeira parada (menor stop_sequence) dessas viagens
+        - coordenadas de cada stop_id
+
+    Retorna um dicionário com esses mapeamentos.
+    """
+    # 1. route_id da primeira rota com cada nome (mesma prioridade da busca por linha)
+    rota_por_nome = routes_df.drop_duplicates('route_short_name_str')
+    rota_por_nome = dict(zip(rota_por_nome['route_short_name_str'], rota_por_nome['route_id']))
+    rota_por_desc = routes_df.drop_duplicates('route_desc_str')
+    rota_por_desc = dict(zip(rota_por_desc['route_desc_str'], rota_por_desc['route_id']))
+
+    # 2. Primeira viagem (na ordem do arquivo) de cada rota em cada direção
+    viagens = trips_df[trips_df['direction_id'].isin([0, 1])]
+    viagens = viagens.drop_duplicates(['route_id', 'direction_id'])
+    viagem_amostra = dict(zip(zip(viagens['route_id'], viagens['direction_id']), viagens['trip_id']))
+
+    # 3. Primeira parada de cada viagem de amostra, com um único filtro sobre stop_times
+    paradas = stop_times_df[stop_times_df['trip_id'].isin(viagens['trip_id'])]
+    paradas = paradas.loc[paradas.groupby('trip_id', sort=False, observed=True)['stop_sequence'].idxmin()]
+    primeira_parada = dict(zip(paradas['trip_id'], paradas['stop_id']))
+
+    # 4. Coordenadas de cada parada
+    pontos = stops_df.drop_duplicates('stop_id')
+    coordenadas = dict(zip(pontos['stop_id'], zip(pontos['stop_lat'], pontos['stop_lon'])))
+
+    return {
+        'rota_por_nome': rota_por_nome,
+        'rota_por_desc': rota_por_desc,
+        'viagem_amostra': viagem_amostra,
+        'primeira_parada': primeira_parada,
+        'coordenadas': coordenadas,
+    }
+
+def analisar_terminais_da_linha(route_name, indice):
+    """
+    Função interna que analisa uma única linha usando o índice de indexar_gtfs.
     
     Retorna:
         - Uma lista de listas com coordenadas (ex: [[lat1, lon1], [lat2, lon2]])
@@ -18,52 +56,30 @@ def analisar_terminais_da_linha(route_name, routes_df, trips_df, stop_times_df,
     
     try:
         # 1. Encontrar o route_id
-        route_info = routes_df[routes_df['route_short_name'].astype(str) == str(route_name)]
-        if route_info.empty:
-            route_info = routes_df[routes_df['route_desc'].astype(str) == str(route_name)]
+        my_route_id = indice['rota_por_nome'].get(str(route_name))
+        if my_route_id is None:
+            my_route_id = indice['rota_por_desc'].get(str(route_name))
         
-        if route_info.empty:
+        if my_route_id is None:
             return []  # <--- Retorna lista vazia se não achar a rota
 
-        my_route_id = route_info.iloc[0]['route_id']
-        
-        # 2. Encontrar viagens
-        viagens_da_linha = trips_df[trips_df['route_id'] == my_route_id]
-        if viagens_da_linha.empty:
-            return []  # <--- Retorna lista vazia se não achar viagens
-
-        viagens_dir_0 = viagens_da_linha[viagens_da_linha['direction_id'] == 0]
-        viagens_dir_1 = viagens_da_linha[viagens_da_linha['direction_id'] == 1]
-
-        # 3. Processar cada direção
-        for trips_in_direction in [viagens_dir_0, viagens_dir_1]:
-            
-            if trips_in_direction.empty:
-                continue 
+        # 2. Processar cada direção
+        for direcao in [0, 1]:
+            sample_trip_id = indice['viagem_amostra'].get((my_route_id, direcao))
+            if sample_trip_id is None:
+                continue
 
-            sample_trip = trips_in_direction.iloc[0]
-            sample_trip_id = sample_trip['trip_id']
-            
-            trip_stops = stop_times_df[stop_times_df['trip_id'] == sample_trip_id]
-            if trip_stops.empty:
+            # Primeira parada (menor stop_sequence) da viagem
+            first_stop_id = indice['primeira_parada'].get(sample_trip_id)
+            if first_stop_id is None:
                 continue
 
-            # Encontra a *primeira* parada (menor stop_sequence)
-            trip_stops_sorted = trip_stops.sort_values('stop_sequence', ascending=True)
-            first_stop_entry = trip_stops_sorted.iloc[0]
-            first_stop_id = first_stop_entry['stop_id']
-            
-            terminal_stop_info = stops_df[stops_df['stop_id'] == first_stop_id]
-            if terminal_stop_info.empty:
+            stop_details = indice['coordenadas'].get(first_stop_id)
+            if stop_details is None:
                 continue
 
-            stop_details = terminal_stop_info.iloc[0]
-            
             # Adiciona a lista [lat, lon] à lista principal
-            coordenadas_terminais.append([
-                stop_details['stop_lat'], 
-                stop_details['stop_lon']
-            ])
+            coordenadas_terminais.append([stop_details[0], stop_details[1]])
 
         return coordenadas_terminais
 
@@ -77,18 +93,34 @@ def main():
     e salvar o resultado em JSON.
     """
     
-    # --- 2. Timer iniciado ---
-    inicio_script = time.perf_counter()
-    
+    parser = argparse.ArgumentParser(description='Gera as coordenadas dos pontos finais de cada linha a partir do GTFS.')
+    parser.add_argument('--gtfs', default='../gtfs', help="pasta do feed GTFS (padrão: ../gtfs)")
+    parser.add_argument('--saida', default='terminais_coordenadas.json',
+                        help='arquivo JSON gerado (padrão: terminais_coordenadas.json)')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    # Mede o tempo de execução (resumo no fim e, com --metricas, em JSON)
+    with Metricas('terminais', args) as metricas:
+        metricas.lidos(*(f'{args.gtfs}/{nome}.txt' for nome in ['stops', 'stop_times', 'trips', 'routes']))
+        metricas.gravados(args.saida)
+        gerar_terminais(args, metricas)
+
+def gerar_terminais(args, metricas):
+    """Carrega o GTFS, encontra os pontos finais de cada linha e grava o JSON."""
     warnings.simplefilter(action='ignore', category=FutureWarning)
     
     try:
         # 1. Carregar todos os DataFrames UMA VEZ
         print("Carregando arquivos GTFS (pode levar um momento)...")
-        stops_df = pd.read_csv("../gtfs/stops.txt", low_memory=False)
-        stop_times_df = pd.read_csv("../gtfs/stop_times.txt", low_memory=False)
-        trips_df = pd.read_csv("../gtfs/trips.txt", low_memory=False)
-        routes_df = pd.read_csv("../gtfs/routes.txt", low_memory=False)
+        # Leitura tipada, reaproveitando o cache binário se o feed não mudou
+        with fase('carregar'):
+            gtfs = carregar_gtfs(['stops', 'stop_times', 'trips', 'routes'], pasta=args.gtfs)
+        stops_df = gtfs['stops']
+        stop_times_df = gtfs['stop_times']
+        trips_df = gtfs['trips']
+        routes_df = gtfs['routes']
+        metricas.registros = len(stop_times_df)
         print("Arquivos carregados com sucesso.")
     
     except FileNotFoundError as e:
@@ -100,6 +132,14 @@ def main():
         print(f"Ocorreu um erro ao ler os arquivos: {e}")
         return
 
+    # Colunas de nome como texto, para a busca por nome da linha
+    routes_df['route_short_name_str'] = routes_df['route_short_name'].astype(str)
+    routes_df['route_desc_str'] = routes_df['route_desc'].astype(str)
+
+    # Índices de rotas, viagens, paradas e coordenadas (um único passe em cada arquivo)
+    with fase('indexar'):
+        indice = indexar_gtfs(routes_df, trips_df, stop_times_df, stops_df)
+
     # 2. Pegar a lista de todas as linhas únicas
     lista_de_linhas = routes_df['route_short_name'].dropna().unique()
     print(f"Encontradas {len(lista_de_linhas)} linhas únicas para analisar.")
@@ -107,12 +147,11 @@ def main():
     # O resultado final será um grande dicionário
     todos_os_resultados = {}
 
-    # 3. Iterar por todas as linhas com uma barra de progresso (tqdm)
-    for linha in tqdm(lista_de_linhas, desc="Processando linhas"):
+    # 3. Iterar por todas as linhas, com o progresso
+    for linha in progresso(lista_de_linhas, "Processando linhas"):
         
-        resultado_da_linha = analisar_terminais_da_linha(
-            linha, routes_df, trips_df, stop_times_df, stops_df
-        )
+        with fase('terminais'):
+            resultado_da_linha = analisar_terminais_da_linha(linha, indice)
         
         # Adiciona o resultado ao dicionário principal.
         # Se 'resultado_da_linha' for [], o JSON ficará "linha": []
@@ -126,9 +165,9 @@ def main():
     print("\nProcessamento concluído. Gerando JSON...")
 
     # 5. Salvar em JSON
-    output_filename = "terminais_coordenadas.json" # Mudei o nome
+    output_filename = args.saida
     try:
-        with open(output_filename, 'w', encoding='utf-8') as f:
+        with fase('gravar'), open(output_filename, 'w', encoding='utf-8') as f:
             # indent=2 cria um arquivo "bonito" (formatado)
             # ensure_ascii=False garante que acentos saiam corretos
             json.dump(todos_os_resultados, f, indent=2, ensure_ascii=False)
@@ -138,13 +177,6 @@ def main():
     except Exception as e:
         print(f"Erro ao salvar o arquivo JSON: {e}")
 
-    # --- 3. Timer finalizado e impresso ---
-    fim_script = time.perf_counter()
-    tempo_total = fim_script - inicio_script
-    print("\n" + "="*40)
-    print(f"Tempo total de execução: {tempo_total:.2f} segundos")
-    print("="*40)
-
 
 # Executa a função principal quando o script é rodado
 if __name__ == "__main__":
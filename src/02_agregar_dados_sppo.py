@@ -1,35 +1,81 @@
 from pathlib import Path
+from datetime import date, timedelta
+import argparse
 import json
-from tqdm import tqdm
+import ijson
+from metricas import Metricas, adicionar_argumentos, contar, fase, progresso
+from ordenacao_externa import AgregadorExterno
+from snapshots_sppo import abrir_snapshot, chave_hora, entrada_atual, ler_manifesto, listar_snapshots
+from trilhas import EscritorTrilhas
 
-dir = Path('sppo')
+CONSORCIOS = ['A', 'B', 'C', 'D', 'E']
 
-# Cria matriz para armazenar arquivos por dia e hora
-dias = [[None for _ in range(0, 24)] for _ in range(0, 7)]
+# Primeiro e último dia agregados por padrão (semana analisada)
+INICIO = date(2025, 11, 1)
+FIM = date(2025, 11, 7)
 
-# Preenche a matriz dias com os arquivos correspondentes a cada dia/hora
-for i in dir.iterdir():
-    mes = int(str(i)[20:22])
-    dia = int(str(i)[23:25])
-    if mes != 11 or dia > 7:
-        continue
-    
-    hora = int(str(i)[26:28])
+# Cria matriz com os arquivos de cada dia/hora entre `inicio` e `fim` (inclusive)
+# (None nas horas sem arquivo; nomes em snapshots_sppo.py, com ou sem compressão)
+def listar_arquivos(dir, inicio=INICIO, fim=FIM):
+    dias = [[None for _ in range(0, 24)] for _ in range((fim - inicio).days + 1)]
 
-    dias[dia - 1][hora] = i
+    # Preenche a matriz dias com os arquivos correspondentes a cada dia/hora
+    for (data, hora), i in listar_snapshots(dir).items():
+        if data < inicio or data > fim:
+            continue
 
-# Para cada consórcio, agrega dados dos carros
-for consorcio in tqdm(['A', 'B', 'C', 'D', 'E'], desc='Consórcio', position=0):
+        dias[(data - inicio).days][hora] = i
+
+    return dias
+
+# Arquivos de todos os dias, hora a hora (pulando as horas sem arquivo)
+def arquivos_em_ordem(dias):
+    for arquivos in dias:
+        for hora in range(0, 24):
+            if arquivos[hora] is not None:
+                yield arquivos[hora]
+
+def contar_arquivos(dias):
+    return sum(a is not None for arquivos in dias for a in arquivos)
+
+# Remove de `dias` as horas que o manifesto da verificação marcou com uma das
+# situações em `pular` (ver tools/verificar_dados_sppo.py), sem ler os arquivos
+def aplicar_manifesto(dias, inicio, manifesto, pular):
+    horas = manifesto.get('horas', {})
+    puladas = {}
+    desatualizadas = 0
+    for k, arquivos in enumerate(dias):
+        dia = inicio + timedelta(days=k)
+        for hora, arquivo in enumerate(arquivos):
+            entrada = horas.get(chave_hora(dia, hora))
+            if arquivo is None or entrada is None:
+                continue
+            if not entrada_atual(entrada, arquivo):
+                desatualizadas += 1
+            elif entrada['situacao'] in pular:
+                arquivos[hora] = None
+                puladas.setdefault(entrada['situacao'], []).append(f'{dia} {hora:02d}h')
+    for situacao, lista in sorted(puladas.items()):
+        print(f'{len(lista)} horas puladas ({situacao}): {", ".join(lista)}')
+    if desatualizadas:
+        print(f'{desatualizadas} arquivos mudaram depois da verificação e não foram pulados')
+    return dias
+
+# Lê cada arquivo uma única vez e distribui os registros entre os carros
+# de todos os consórcios selecionados
+def agregar(dias, consorcios):
     carros = {}
 
     # Itera sobre dias e horas disponíveis
-    for dia in tqdm(range(1, 8), desc="Dias", position=1, leave=False):
-        for hora in tqdm(range(0, 24), desc='Horas do Dia', position=2, leave=False):
-            with open(dias[dia - 1][hora], 'r') as f:
+    for arquivo in progresso(arquivos_em_ordem(dias), 'Arquivos', total=contar_arquivos(dias)):
+        with fase('ler'):
+            with abrir_snapshot(arquivo) as f:
                 dados = json.load(f)
+        contar('registros', len(dados))
+        with fase('agregar'):
             for i in dados:
                 # Filtra por consórcio usando a primeira letra da ordem
-                if i['ordem'][0] == consorcio:
+                if i['ordem'][0] in consorcios:
                     if not i['ordem'] in carros:
                         carros[i['ordem']] = []
                     carros[i['ordem']].append({
@@ -39,9 +85,98 @@ for consorcio in tqdm(['A', 'B', 'C', 'D', 'E'], desc='Consórcio', position=0):
                         'datahora': i['datahora'],
                     })
 
-    # Salva os dados agregados de cada carro em arquivos separados
-    for carro, d in tqdm(carros.items(), desc='Carros', leave=False):
-        d.sort(key=lambda x: x['datahora'])  # Ordena por data/hora
-        with open(f'carros/{carro}.json', 'w') as f:
-            json.dump(d, f)
+    return carros
+
+# Ordena os registros de cada carro agregado em memória
+def carros_ordenados(carros):
+    for carro, d in carros.items():
+        with fase('ordenar'):
+            d.sort(key=lambda x: x['datahora'])  # Ordena por data/hora
+        yield carro, d
+
+# Versão com memória limitada: lê os arquivos de forma incremental e usa
+# ordenação externa em disco para montar a trilha de cada carro
+def agregar_streaming(dias, consorcios, agregador):
+    for arquivo in progresso(arquivos_em_ordem(dias), 'Arquivos', total=contar_arquivos(dias)):
+        with fase('ler'):
+            n = 0
+            with abrir_snapshot(arquivo) as f:
+                for i in ijson.items(f, 'item'):
+                    n += 1
+                    if i['ordem'][0] in consorcios:
+                        agregador.adicionar(i['ordem'], i['latitude'], i['longitude'], i['linha'], i['datahora'])
+        contar('registros', n)
+
+# Salva os dados agregados de cada carro em arquivos separados.
+# Grava registro a registro (mesmo formato de json.dump da lista inteira).
+def salvar_carros(carros):
+    for carro, registros in progresso(carros, 'Carros'):
+        with fase('gravar'), open(f'carros/{carro}.json', 'w') as f:
+            f.write('[')
+            for k, r in enumerate(registros):
+                if k:
+                    f.write(', ')
+                f.write(json.dumps(r))
+            f.write(']')
+
+# Salva todos os carros em um único arquivo colunar (ver trilhas.py)
+def salvar_trilhas(carros, caminho):
+    with EscritorTrilhas(caminho) as escritor:
+        for carro, registros in progresso(carros, 'Carros'):
+            with fase('gravar'):
+                escritor.adicionar(carro, registros)
+
+# Agrega os dias pedidos e grava as trilhas (pasta carros/ ou arquivo colunar)
+def agregar_dados(args, metricas):
+    dias = listar_arquivos(Path('sppo'), args.inicio, args.fim)
+    faltando = 24 * len(dias) - contar_arquivos(dias)
+    if faltando:
+        print(f'{faltando} horas sem arquivo em sppo/ entre {args.inicio} e {args.fim}')
+    if args.manifesto:
+        pular = {'corrompida', 'vazia'} | ({'suspeita'} if args.pular_suspeitas else set())
+        dias = aplicar_manifesto(dias, args.inicio, ler_manifesto(args.manifesto), pular)
+    metricas.lidos(*arquivos_em_ordem(dias))
+    metricas.gravados(args.trilhas or 'carros')
+
+    def salvar(carros):
+        if args.trilhas:
+            salvar_trilhas(carros, args.trilhas)
+        else:
+            salvar_carros(carros)
+
+    if args.streaming:
+        with AgregadorExterno(memoria_max=args.memoria * 2**20, pasta=args.temp) as agregador:
+            agregar_streaming(dias, set(args.consorcios), agregador)
+            salvar(agregador.carros())
+    else:
+        salvar(carros_ordenados(agregar(dias, set(args.consorcios))))
+
+def main():
+    parser = argparse.ArgumentParser(description='Agrega os dados brutos do SPPO por carro.')
+    parser.add_argument('-c', '--consorcios', nargs='+', default=CONSORCIOS, choices=CONSORCIOS,
+                        help='consórcios a gravar (padrão: todos)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='agrega com memória limitada, usando ordenação externa em disco')
+    parser.add_argument('--memoria', type=int, default=256,
+                        help='limite de memória do buffer no modo --streaming (MB, padrão: 256)')
+    parser.add_argument('--temp', default=None,
+                        help='pasta para os arquivos temporários do modo --streaming')
+    parser.add_argument('--trilhas', default=None,
+                        help='grava um único arquivo colunar (ver trilhas.py) em vez da pasta carros/')
+    parser.add_argument('--inicio', type=date.fromisoformat, default=INICIO,
+                        help=f'primeiro dia agregado, AAAA-MM-DD (padrão: {INICIO})')
+    parser.add_argument('--fim', type=date.fromisoformat, default=FIM,
+                        help=f'último dia agregado, AAAA-MM-DD (padrão: {FIM})')
+    parser.add_argument('--manifesto', nargs='?', const='sppo/manifesto.json', default=None,
+                        help='pula as horas corrompidas ou vazias segundo o manifesto da verificação '
+                             '(padrão: sppo/manifesto.json)')
+    parser.add_argument('--pular-suspeitas', action='store_true',
+                        help='com --manifesto, pula também as horas suspeitas')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    with Metricas('agregar', args) as metricas:
+        agregar_dados(args, metricas)
 
+if __name__ == "__main__":
+    main()
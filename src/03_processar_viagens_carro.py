@@ -1,192 +1,457 @@
 from pathlib import Path
+import argparse
+import functools
+import heapq
 import json
+import multiprocessing
+import os
 from datetime import datetime
-from geopy.distance import great_circle
-from tqdm import tqdm
-import statistics
+import numpy as np
+from distancias import trilha_para_arrays, velocidades
+from indice_terminais import IndiceTerminais
+from armazem_viagens import ArmazemViagens, LoteViagens, expandir_lote
+from faixas_linhas import FaixasLinhas, ResumosViagens, intervalos_por_linha, quartis_agrupados
+from registro_linhas import RegistroLinhas
+from trilhas import Trilhas
+from viagens_binario import EscritorViagens, exportar_json, ler_lotes
+from estado_incremental import EstadoCarro, EstadoIncremental, impressao_arquivos
+from metricas import ComFases, Metricas, adicionar_argumentos, contar, fase, incorporar, progresso
 
 # Distância máxima para considerar chegada em ponto final (em km)
 distponto = 0.5
 
-# Carrega equivalências de nomes de linhas
-with open('equivalencias.json', 'r') as f:
-    equivalencias = json.load(f)
-
-# Função para obter nome equivalente de linha
-def outronome(n):
-    for eq in equivalencias:
-        if n == eq[0]:
-            return eq[1]
-        if n == eq[1]:
-            return eq[0]
-    return n
-
-def verdnome(n):
-    # Se for linha especial, retorna nome equivalente
-    if n[:4] == 'LECD':
-        return outronome(n)
-    return n
-
-# Carrega coordenadas dos pontos finais das linhas
-with open('terminais_coordenadas.json', 'r') as f:
-    pontos_finais = json.load(f)
-
-# Analisa os registros de um carro e segmenta viagens
-def analisar_carro(carro, prefixo):
-    llat = float(carro[0]['latitude'].replace(',', '.'))
-    llon = float(carro[0]['longitude'].replace(',', '.'))
-    lt = int(carro[0]['datahora'])
-    llinha = carro[0]['linha']
-
-    if llinha in pontos_finais:
-        pf = pontos_finais[llinha]
-    elif outronome(llinha) in pontos_finais:
-        pf = pontos_finais[outronome(llinha)]
-    else:
-        pf = []
-
-    viagens = []
-    
-    viagem = []
-
-    for i in tqdm(carro, desc='Registros', position=1, leave=False):
-        # Calcula distância e velocidade entre pontos
-        lat = float(i['latitude'].replace(',', '.'))
-        lon = float(i['longitude'].replace(',', '.'))
-        t = int(i['datahora'])
-
-        dist = great_circle((llat, llon), (lat, lon)).kilometers
-        if t != lt:
-            vel = dist * 3600000 / (t - lt)
+# Acima deste tamanho (em bytes) as viagens segmentadas são guardadas em disco
+limite_memoria_viagens = 1024 * 2**20
+
+# Equivalências de nomes e coordenadas dos pontos finais das linhas
+registro = RegistroLinhas(arq_equivalencias='equivalencias.json',
+                          arq_pontos_finais='terminais_coordenadas.json')
+
+outronome = registro.outronome
+verdnome = registro.verdnome
+terminais_da_linha = registro.terminais_da_linha
+
+# Índice espacial dos pontos finais (construído na primeira consulta)
+@functools.lru_cache(maxsize=None)
+def indice_terminais():
+    return IndiceTerminais(registro.pontos_finais, distponto)
+
+# Encontra os limites (início, fim exclusivo) de cada viagem fechada.
+# Uma viagem começa no primeiro registro em movimento longe dos pontos finais
+# e termina no primeiro registro seguinte que marca chegada em ponto final.
+def limites_viagens(inicio, fim):
+    pos_inicio = np.flatnonzero(inicio)
+    pos_fim = np.flatnonzero(fim)
+
+    limites = []
+    k = 0
+    while True:
+        # Próximo registro que abre viagem (a partir de k, inclusive)
+        a = np.searchsorted(pos_inicio, k)
+        if a == len(pos_inicio):
+            break
+        ini = pos_inicio[a]
+        # Próximo registro que fecha a viagem (estritamente depois do início)
+        b = np.searchsorted(pos_fim, ini, side='right')
+        if b == len(pos_fim):
+            break  # viagem ainda aberta no fim dos dados é descartada
+        k = pos_fim[b]
+        limites.append((int(ini), int(k)))
+    return limites
+
+# Marca os registros que abrem (inicio) e fecham (fim) viagens.
+# `linhas` tem o id da linha de cada registro e `nomes` a tabela id -> nome.
+def marcar_trilha(lat, lon, vel, linhas, nomes):
+    # Distância mínima até os pontos finais da linha de cada registro.
+    # Pelo índice, registros longe de todos os terminais ficam com infinito.
+    indice = indice_terminais()
+    mindist = np.zeros(len(vel), dtype=np.float64)
+    sem_pf = np.zeros(len(vel), dtype=bool)
+    ids, inversa = np.unique(linhas, return_inverse=True)
+    for j, linha_id in enumerate(ids.tolist()):
+        idx = np.flatnonzero(inversa == j)
+        d = indice.distancia_minima(registro.chave_pontos_finais(nomes[linha_id]), lat[idx], lon[idx])
+        if d is None:
+            sem_pf[idx] = True
         else:
-            vel = 0.0
-        if vel < 2 or vel > 200:
-            vel = 0.0
-
-        # Atualiza ponto final se linha mudou
-        if i['linha'] != llinha:
-            if i['linha'] in pontos_finais:
-                pf = pontos_finais[i['linha']]
-            elif outronome(i['linha']) in pontos_finais:
-                pf = pontos_finais[outronome(i['linha'])]
-            else:
-                pf = []
-
-        # Calcula distância até pontos finais conhecidos
-        d_pontos = []
-        for p in pf:
-            d_pontos.append(great_circle(p, (lat, lon)).kilometers)
-
-        if len(d_pontos) == 0:
-            mindist = 0.0
+            mindist[idx] = d
+
+    # Detecta início e fim de viagem
+    inicio = (vel > 0.0) & (mindist > distponto)
+    fim = ((vel == 0.0) & (mindist < distponto)) | sem_pf
+    return inicio, fim
+
+# Monta o lote compacto com as viagens delimitadas por `limites`
+def montar_lote(prefixo, limites, lat, lon, t, vel, linhas, nomes):
+    idx = np.concatenate([np.arange(a, b) for a, b in limites]) if limites else np.zeros(0, dtype=np.int64)
+    offsets = np.zeros(len(limites) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([b - a for a, b in limites])
+
+    return LoteViagens(
+        prefixo=prefixo,
+        linhas=[verdnome(nomes[linhas[b - 1]]) for _, b in limites],
+        offsets=offsets,
+        datahora=t[idx],
+        latitude=lat[idx],
+        longitude=lon[idx],
+        vel=vel[idx],
+    )
+
+# Segmenta as viagens da trilha de um carro (já em arrays) em um lote compacto.
+# `linhas` tem o id da linha de cada registro e `nomes` a tabela id -> nome.
+def segmentar_trilha(lat, lon, t, linhas, nomes, prefixo):
+    contar('registros', len(t))
+    with fase('distancia'):
+        vel = velocidades(lat, lon, t)
+    with fase('segmentar'):
+        inicio, fim = marcar_trilha(lat, lon, vel, linhas, nomes)
+
+        # Remove primeira e última viagem (artefato do algoritmo)
+        limites = limites_viagens(inicio, fim)[1:]
+
+        return montar_lote(prefixo, limites, lat, lon, t, vel, linhas, nomes)
+
+# Segmenta os registros novos de um carro continuando do estado salvo na
+# execução anterior (None para um carro novo). Retorna (lote, novo estado,
+# registros ignorados por serem anteriores ao estado). Processar os dias um a um
+# dá as mesmas viagens que segmentar_trilha sobre a trilha inteira.
+def segmentar_incremental(lat, lon, t, linhas, nomes, prefixo, estado):
+    contar('registros', len(t))
+    atrasados = 0
+    if estado is not None:
+        # Registros anteriores ao último já processado não cabem mais na trilha
+        novos = t >= estado.ultimo[2]
+        atrasados = int(len(t) - np.count_nonzero(novos))
+        if atrasados:
+            lat, lon, t, linhas = lat[novos], lon[novos], t[novos], linhas[novos]
+    if len(t) == 0:
+        return montar_lote(prefixo, [], lat, lon, t, np.zeros(0), linhas, nomes), estado, atrasados
+
+    # A velocidade do primeiro registro novo é calculada a partir do último do estado
+    with fase('distancia'):
+        if estado is None:
+            vel = velocidades(lat, lon, t)
         else:
-            mindist = min(d_pontos)
-
-        # Detecta fim de viagem
-        if len(viagem) > 0 and ((vel == 0.0 and mindist < distponto) or len(d_pontos) == 0):
-            viagens.append((verdnome(llinha), prefixo, viagem))
-            viagem = []
-
-        # Adiciona registro à viagem se válido
-        if len(viagem) > 0 or (vel > 0.0 and mindist > distponto):
-            viagem.append({
-                'datahora': int(i['datahora']),
-                'latitude': float(i['latitude'].replace(',', '.')),
-                'longitude': float(i['longitude'].replace(',', '.')),
-                'vel': vel,
-            })
-
-        # Atualiza variáveis para próximo registro
-        llat, llon = lat, lon
-        lt = t
-        llinha = i['linha']
-
-    # Remove primeira e última viagem (artefato do algoritmo)
-    return viagens[1:]
-
-# Calcula duração da viagem em milissegundos
-def duracao_viagem(v):
-    t0 = v[2][0]['datahora']
-    tn = v[2][-1]['datahora']
-
-    return tn - t0
-
-# Calcula distância da viagem em km
-def dist_viagem(v):
-    s0 = (v[2][0]['latitude'], v[2][0]['longitude'])
-    sn = (v[2][-1]['latitude'], v[2][-1]['longitude'])
-
-    return great_circle(s0, sn).kilometers
-
-# Gera resumo de cada viagem
-def resumo_viagem(v):
-    return (v[0], v[1], duracao_viagem(v), dist_viagem(v))
-    
-def dados_linhas(resumos):
-    linhas = {}
-    for i in resumos:
-        if not i[0] in linhas:
-            linhas[i[0]] = ()
-    # Calcula intervalos de duração e distância típicos por linha
-    for linha in tqdm(linhas.keys(), desc='Linhas'):
-        tempos = [r[2] for r in resumos if r[0] == linha]
-        dists = [r[3] for r in resumos if r[0] == linha]
-        # Usa quartis para definir limites de aceitação
-        t_qs = statistics.quantiles(tempos, n=4)
-        d_qs = statistics.quantiles(dists, n=4)
-        t_r = (t_qs[0] - (0.5 * (t_qs[2] - t_qs[0])), t_qs[2] + (0.5 * (t_qs[2] - t_qs[0])))
-        d_r = (d_qs[0] - (0.3 * (d_qs[2] - d_qs[0])), d_qs[2] + (0.3 * (d_qs[2] - d_qs[0])))
-        linhas[linha] = (t_r, d_r)
-    return linhas
-
-# Filtra viagens fora dos intervalos típicos de cada linha
-def filtrar_viagens(viagens, resumos, d_linhas):
-    ret = []
-    for i in range(len(viagens)):
-        t_r, d_r = d_linhas[resumos[i][0]]
-        if resumos[i][2] > t_r[0] and resumos[i][2] < t_r[1] and resumos[i][3] > d_r[0] and resumos[i][3] < d_r[1]:
-            ret.append(viagens[i])
-    return ret
-
-dir = Path('carros')
-prefixos = [str(i) for i in dir.iterdir()]
-
-resumo_tudo = []
-
-# Percorre todos os arquivos de carros, processa viagens e gera resumos
-for i in tqdm(prefixos, desc='Carros'):
-    prefixo = i[7:][:-5]
-
-    with open(i, 'r') as f:
-        viagens = analisar_carro(json.load(f), prefixo)
-
-    resumo_tudo += [resumo_viagem(v) for v in viagens]
-
-# Calcula intervalos típicos por linha
-d_linhas = dados_linhas(resumo_tudo)
-
-print(d_linhas)
-
-todas_viagens = []
-
-# Processa e filtra todas as viagens válidas
-for i in tqdm(prefixos, desc='Carros'):
-    prefixo = i[7:][:-5]
-
-    with open(i, 'r') as f:
-        viagens = analisar_carro(json.load(f), prefixo)
-
-    resumos = [resumo_viagem(v) for v in viagens]
-
-    todas_viagens += filtrar_viagens(viagens, resumos, d_linhas)
-
-    #for v in viagens:
-    #    print('Linha', v[0], 'carro', v[1], 'demorou', duracao_viagem(v) / 60000, 'min e andou', dist_viagem(v))
-
-# Salva todas as viagens processadas em arquivo JSON
-with open('viagens_processadas.json', 'w') as f:
-    json.dump(todas_viagens, f)
-
-
+            u_lat, u_lon, u_t = estado.ultimo
+            vel = velocidades(np.r_[u_lat, lat], np.r_[u_lon, lon], np.r_[u_t, t])[1:]
+    with fase('segmentar'):
+        inicio, fim = marcar_trilha(lat, lon, vel, linhas, nomes)
+    linhas = np.asarray(linhas, dtype=np.int64)
+
+    # A viagem que ficou aberta vem na frente: ela abre no seu primeiro registro
+    # e nenhum dos registros seguintes fechou a viagem
+    aberta = estado.aberta if estado is not None else None
+    if aberta is not None:
+        nomes = list(nomes)
+        ids = {nome: k for k, nome in enumerate(nomes)}
+        linhas_aberta = [ids.setdefault(nome, len(ids)) for nome in aberta['linhas']]
+        nomes += list(ids)[len(nomes):]
+        m = len(linhas_aberta)
+        lat = np.concatenate([aberta['latitude'], lat])
+        lon = np.concatenate([aberta['longitude'], lon])
+        t = np.concatenate([aberta['datahora'], t])
+        vel = np.concatenate([aberta['vel'], vel])
+        linhas = np.concatenate([np.asarray(linhas_aberta, dtype=np.int64), linhas])
+        inicio = np.concatenate([np.arange(m) == 0, inicio])
+        fim = np.concatenate([np.zeros(m, dtype=bool), fim])
+
+    todas = limites_viagens(inicio, fim)
+    limites = todas
+
+    # A primeira viagem do carro é removida uma única vez (artefato do algoritmo)
+    primeira_descartada = estado is not None and estado.primeira_descartada
+    if todas and not primeira_descartada:
+        limites = todas[1:]
+        primeira_descartada = True
+
+    # Viagem que começa depois da última fechada e ainda não terminou
+    k = todas[-1][1] if todas else 0
+    pos = np.flatnonzero(inicio[k:])
+    nova_aberta = None
+    if len(pos):
+        a = k + int(pos[0])
+        nova_aberta = {
+            'datahora': t[a:].copy(),
+            'latitude': lat[a:].copy(),
+            'longitude': lon[a:].copy(),
+            'vel': vel[a:].copy(),
+            'linhas': [nomes[i] for i in linhas[a:].tolist()],
+        }
+
+    novo_estado = EstadoCarro(
+        ultimo=(float(lat[-1]), float(lon[-1]), int(t[-1])),
+        linha=nomes[linhas[-1]],
+        aberta=nova_aberta,
+        primeira_descartada=primeira_descartada,
+    )
+    return montar_lote(prefixo, limites, lat, lon, t, vel, linhas, nomes), novo_estado, atrasados
+
+# Analisa os registros de um carro (formato de carros/*.json) e segmenta viagens
+def segmentar_carro(carro, prefixo):
+    # Converte a trilha inteira para arrays uma única vez
+    with fase('converter'):
+        lat, lon, t, linhas = trilha_para_arrays(carro)
+        nomes, ids = np.unique(np.asarray(linhas, dtype=str), return_inverse=True)
+    return segmentar_trilha(lat, lon, t, ids, nomes.tolist(), prefixo)
+
+# Analisa os registros de um carro e retorna as viagens como listas de registros
+def analisar_carro(carro, prefixo):
+    return expandir_lote(segmentar_carro(carro, prefixo))
 
+# Calcula intervalos de duração e distância típicos por linha, com os quartis
+# de todas as linhas calculados de uma vez sobre os resumos em arrays
+def dados_linhas(resumos):
+    codigos, tempos, dists = resumos.arrays()
+    n = len(resumos.linhas)
+    # Usa quartis para definir limites de aceitação
+    t_qs = quartis_agrupados(codigos, tempos, n)
+    d_qs = quartis_agrupados(codigos, dists, n)
+    t_iqr = t_qs[:, 2] - t_qs[:, 0]
+    d_iqr = d_qs[:, 2] - d_qs[:, 0]
+    return FaixasLinhas(
+        linhas=list(resumos.linhas),
+        t_min=t_qs[:, 0] - (0.5 * t_iqr),
+        t_max=t_qs[:, 2] + (0.5 * t_iqr),
+        d_min=d_qs[:, 0] - (0.3 * d_iqr),
+        d_max=d_qs[:, 2] + (0.3 * d_iqr),
+    )
+
+# Máscara das viagens dentro dos intervalos típicos de cada linha
+# (linhas sem intervalo, com menos de duas viagens, não têm viagens aceitas)
+def filtrar_viagens(resumos, d_linhas):
+    codigos, tempos, dists = resumos.arrays()
+    return ((tempos > d_linhas.t_min[codigos]) & (tempos < d_linhas.t_max[codigos])
+            & (dists > d_linhas.d_min[codigos]) & (dists < d_linhas.d_max[codigos]))
+
+# Prefixo do carro a partir do caminho carros/<prefixo>.json
+def prefixo_arquivo(caminho):
+    return caminho[7:][:-5]
+
+# Lê e segmenta o arquivo de um carro (usado em série e nos processos do pool)
+def processar_arquivo(caminho):
+    prefixo = prefixo_arquivo(caminho)
+
+    with fase('ler'), open(caminho, 'r') as f:
+        carro = json.load(f)
+    return segmentar_carro(carro, prefixo)
+
+# Versão incremental: recebe (caminho, estado do carro) e retorna (lote, novo estado, atrasados)
+def processar_arquivo_incremental(item):
+    caminho, estado = item
+    with fase('ler'), open(caminho, 'r') as f:
+        carro = json.load(f)
+    with fase('converter'):
+        lat, lon, t, linhas = trilha_para_arrays(carro)
+        nomes, ids = np.unique(np.asarray(linhas, dtype=str), return_inverse=True)
+    return segmentar_incremental(lat, lon, t, ids, nomes.tolist(), prefixo_arquivo(caminho), estado)
+
+# Arquivo de trilhas aberto neste processo (entrada colunar, ver trilhas.py)
+_trilhas = None
+
+def abrir_trilhas(caminho):
+    global _trilhas
+    _trilhas = Trilhas(caminho)
+
+# Segmenta um carro lido do arquivo de trilhas (fatias sem cópia do memmap)
+def processar_trilha(prefixo):
+    with fase('ler'):
+        c = _trilhas.carro(prefixo)
+    return segmentar_trilha(c['latitude'], c['longitude'], c['datahora'], c['linha'], _trilhas.linhas, prefixo)
+
+# Versão incremental: recebe (prefixo, estado do carro) e retorna (lote, novo estado, atrasados)
+def processar_trilha_incremental(item):
+    prefixo, estado = item
+    with fase('ler'):
+        c = _trilhas.carro(prefixo)
+    return segmentar_incremental(c['latitude'], c['longitude'], c['datahora'], c['linha'],
+                                 _trilhas.linhas, prefixo, estado)
+
+# Gera os lotes na mesma ordem de `itens`, em série ou em um pool de processos.
+# Os itens são enviados aos processos em blocos para diluir o custo de IPC, e as
+# fases medidas em cada processo voltam junto com o resultado de cada item.
+def segmentar_em_lote(funcao, itens, processos=1, tamanho_bloco=None, inicializador=None, args_inicializador=()):
+    if processos <= 1:
+        if inicializador is not None:
+            inicializador(*args_inicializador)
+        yield from map(funcao, itens)
+        return
+
+    if tamanho_bloco is None:
+        tamanho_bloco = max(1, len(itens) // (processos * 16))
+
+    with multiprocessing.Pool(processos, initializer=inicializador, initargs=args_inicializador) as pool:
+        # imap preserva a ordem de entrada, então o resultado é igual ao da execução em série
+        for resultado, fases in pool.imap(ComFases(funcao), itens, chunksize=tamanho_bloco):
+            incorporar(*fases)
+            yield resultado
+
+# Parâmetros que precisam ser os mesmos em todas as execuções incrementais
+def parametros_segmentacao():
+    return {
+        'distponto': distponto,
+        'referencias': impressao_arquivos(registro.arq_pontos_finais, registro.arq_equivalencias),
+    }
+
+# Ordem dos carros de uma execução incremental: os já vistos em execuções
+# anteriores na ordem em que apareceram pela primeira vez, depois os novos.
+# Assim os segmentos de todas as execuções ficam com os carros na mesma ordem.
+def ordenar_carros(prefixos, conhecidos, chave=lambda p: p):
+    presentes = {chave(p): p for p in prefixos}
+    return ([presentes[c] for c in conhecidos if c in presentes]
+            + [p for p in prefixos if chave(p) not in conhecidos])
+
+# Viagens de todos os segmentos agrupadas por carro, na ordem de `posicoes`
+# (prefixo -> posição) e, dentro de cada carro, na ordem das execuções. Gera
+# (lote, índices das viagens do carro no lote, posição da primeira viagem do lote
+# entre todas as viagens dos segmentos); `inicios` é essa posição para cada segmento.
+def viagens_por_carro(caminhos, inicios, posicoes):
+    def blocos(k, caminho, pos):
+        for lote in ler_lotes(caminho):
+            prefixos = lote.prefixos
+            a = 0
+            for b in range(1, len(prefixos) + 1):
+                if b == len(prefixos) or prefixos[b] != prefixos[a]:
+                    yield posicoes[prefixos[a]], k, lote, range(a, b), pos
+                    a = b
+            pos += len(prefixos)
+
+    # Cada segmento já tem os carros nessa ordem (ver ordenar_carros)
+    fluxos = [blocos(k, caminho, inicio) for k, (caminho, inicio) in enumerate(zip(caminhos, inicios))]
+    for _, _, lote, indices, pos in heapq.merge(*fluxos, key=lambda b: b[:2]):
+        yield lote, indices, pos
+
+# Modo incremental: segmenta só as trilhas novas continuando do estado salvo em
+# `pasta_estado`, e refaz a filtragem sobre as viagens de todas as execuções.
+# As viagens aceitas saem por carro, na ordem em que os carros apareceram pela
+# primeira vez, como no processamento completo sobre as trilhas do período
+# inteiro gravadas pela etapa 02 (sem --streaming, que ordena pelo prefixo).
+def processar_incremental(args, processos):
+    estado = EstadoIncremental(args.incremental, parametros_segmentacao())
+
+    if args.trilhas:
+        prefixos = ordenar_carros(Trilhas(args.trilhas).carros, estado.carros)
+        itens = [(p, estado.carros.get(p)) for p in prefixos]
+        lotes = segmentar_em_lote(processar_trilha_incremental, itens, processos, args.bloco,
+                                  abrir_trilhas, (args.trilhas,))
+    else:
+        prefixos = ordenar_carros([str(i) for i in Path('carros').iterdir()], estado.carros, prefixo_arquivo)
+        itens = [(p, estado.carros.get(prefixo_arquivo(p))) for p in prefixos]
+        lotes = segmentar_em_lote(processar_arquivo_incremental, itens, processos, args.bloco)
+
+    # Grava as viagens novas (ainda sem filtrar) e guarda o estado de cada carro
+    carros = {}
+    atrasados = 0
+    segmento = estado.novo_segmento()
+    with EscritorViagens(segmento) as escritor:
+        for lote, estado_carro, n in progresso(lotes, 'Carros', total=len(prefixos)):
+            with fase('gravar'):
+                escritor.adicionar(lote)
+            if estado_carro is not None:
+                carros[lote.prefixo] = estado_carro
+            atrasados += n
+    estado.registrar(carros, segmento)
+
+    if atrasados:
+        print(f'{atrasados} registros anteriores ao estado salvo foram ignorados')
+
+    # Os intervalos típicos dependem de todas as viagens: recalcula sobre todos os segmentos
+    resumos = ResumosViagens()
+    inicios = []
+    with fase('resumir'):
+        for caminho in estado.caminhos_segmentos():
+            inicios.append(len(resumos))
+            for lote in ler_lotes(caminho):
+                resumos.adicionar(lote)
+
+    with fase('filtrar'):
+        d_linhas = dados_linhas(resumos)
+
+        print(intervalos_por_linha(d_linhas))
+
+        aceitas_tudo = filtrar_viagens(resumos, d_linhas)
+    posicoes = {p: k for k, p in enumerate(estado.carros)}
+    with fase('gravar'), EscritorViagens(args.saida) as escritor:
+        for lote, indices, pos in viagens_por_carro(estado.caminhos_segmentos(), inicios, posicoes):
+            escritor.adicionar(lote, [j for j in indices if aceitas_tudo[pos + j]])
+
+    if args.json:
+        exportar_json(args.saida, 'viagens_processadas.json')
+
+# Processamento completo: segmenta todas as trilhas, calcula os intervalos
+# típicos por linha e grava as viagens aceitas
+def processar_completo(args, processos):
+    if args.trilhas:
+        prefixos = Trilhas(args.trilhas).carros
+        lotes = segmentar_em_lote(processar_trilha, prefixos, processos, args.bloco,
+                                  abrir_trilhas, (args.trilhas,))
+    else:
+        dir = Path('carros')
+        prefixos = [str(i) for i in dir.iterdir()]
+        lotes = segmentar_em_lote(processar_arquivo, prefixos, processos, args.bloco)
+
+    resumos = ResumosViagens()
+
+    with ArmazemViagens(limite_memoria=limite_memoria_viagens) as armazem:
+        # Percorre todos os arquivos de carros uma única vez: segmenta as viagens,
+        # gera os resumos e guarda o lote para a filtragem
+        for lote in progresso(lotes, 'Carros', total=len(prefixos)):
+            with fase('resumir'):
+                resumos.adicionar(lote)
+                armazem.adicionar(lote)
+
+        with fase('filtrar'):
+            # Calcula intervalos típicos por linha
+            d_linhas = dados_linhas(resumos)
+
+            print(intervalos_por_linha(d_linhas))
+
+            # Aceitação de todas as viagens, na mesma ordem dos lotes guardados
+            aceitas_tudo = filtrar_viagens(resumos, d_linhas)
+
+        todas_viagens = []
+        pos = 0
+
+        # Filtra as viagens válidas a partir dos lotes guardados e grava no formato binário
+        with fase('gravar'), EscritorViagens(args.saida) as escritor:
+            for lote in progresso(armazem, 'Filtrando', total=len(armazem)):
+                n = len(lote.linhas)
+                aceitas = np.flatnonzero(aceitas_tudo[pos:pos + n]).tolist()
+                pos += n
+                escritor.adicionar(lote, aceitas)
+                if args.json:
+                    todas_viagens += expandir_lote(lote, aceitas)
+
+    # Exporta também todas as viagens processadas em JSON, se pedido
+    if args.json:
+        with open('viagens_processadas.json', 'w') as f:
+            json.dump(todas_viagens, f)
+
+def main():
+    parser = argparse.ArgumentParser(description='Segmenta e filtra as viagens de cada carro.')
+    parser.add_argument('-p', '--processos', type=int, default=1,
+                        help='número de processos (0 = todos os núcleos; padrão: 1, em série)')
+    parser.add_argument('--bloco', type=int, default=None,
+                        help='carros por tarefa enviada a cada processo')
+    parser.add_argument('--trilhas', default=None,
+                        help='lê as trilhas de um arquivo colunar (ver trilhas.py) em vez da pasta carros/')
+    parser.add_argument('--saida', default='viagens_processadas.bin',
+                        help='arquivo binário de viagens processadas (padrão: viagens_processadas.bin)')
+    parser.add_argument('--json', action='store_true',
+                        help='exporta também viagens_processadas.json')
+    parser.add_argument('--incremental', metavar='PASTA', default=None,
+                        help='processa só os dias novos, continuando do estado salvo em PASTA')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    processos = args.processos or os.cpu_count()
+
+    with Metricas('viagens', args) as metricas:
+        metricas.lidos(args.trilhas or 'carros')
+        metricas.gravados(args.saida)
+        if args.incremental:
+            processar_incremental(args, processos)
+        else:
+            processar_completo(args, processos)
 
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,86 @@
+import argparse
 import ijson
-from datetime import datetime
-from tqdm import tqdm
-from geopy.distance import great_circle
+import itertools
 import csv
-from pegar_viacao import achar_viacao
+import numpy as np
+from metricas import Metricas, Progresso, adicionar_argumentos, contar, fase
+from registro_linhas import RegistroLinhas
+from viagens_binario import ler_lotes
+from viagens_csv import CABECALHO, linhas_csv
 
 outputf = 'viagens.csv'
 
-# Cria arquivo CSV de saída e escreve cabeçalho
-with open(outputf, 'w', newline='') as f:
-    writer = csv.writer(f)
-    writer.writerow(['viacao', 'linha', 'carro', 'kilometragem', 'duracao', 'velocidade media'])
-
-# Lê viagens processadas do JSON e converte para linhas do CSV
-with open('viagens_processadas.json', 'r') as f:
-    viagens = ijson.items(f, 'item')
-
-    for viagem in tqdm(viagens, desc='Viagens', total=220000):
-        # Ignora viagens muito curtas
-        if len(viagem[2]) < 20:
-            continue
-
-        ii = 5
-        kil = 0
-        # Calcula quilometragem total da viagem somando trechos
-        for i in range(0, len(viagem[2]) - ii, ii):
-            d = great_circle(
-                (viagem[2][i + ii]['latitude'], viagem[2][i + ii]['longitude']),
-                (viagem[2][i]['latitude'], viagem[2][i]['longitude'])
-            ).kilometers
-            kil += d
-
-        tempotot = viagem[2][-1]['datahora'] - viagem[2][0]['datahora']
-        velmed = kil * 3600000 / tempotot
-
-        # Determina a viação a partir da linha e prefixo
-        viacao = achar_viacao(viagem[0], viagem[1])
-
-        # Escreve linha no CSV
-        with open(outputf, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([viacao, viagem[0], viagem[1], round(kil), round(tempotot / 1000), round(velmed)])
+# Viagens processadas convertidas por vez
+tamanho_lote = 5000
 
+# Tabela de prefixo -> viação e regras de linhas especiais
+registro = RegistroLinhas(arq_equivalencias='equivalencias.json', arq_viacoes='viacoes.csv')
+
+# Agrupa as viagens do JSON (lido em streaming) em lotes de arrays
+def lotes_json(caminho):
+    with open(caminho, 'rb') as f:
+        viagens = ijson.items(f, 'item', use_float=True)
+        while True:
+            lote = list(itertools.islice(viagens, tamanho_lote))
+            if not lote:
+                break
+            offsets = np.zeros(len(lote) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(v[2]) for v in lote])
+            registros = [r for v in lote for r in v[2]]
+            yield (
+                [v[0] for v in lote],
+                [v[1] for v in lote],
+                offsets,
+                np.fromiter((r['latitude'] for r in registros), dtype=np.float64, count=len(registros)),
+                np.fromiter((r['longitude'] for r in registros), dtype=np.float64, count=len(registros)),
+                np.fromiter((r['datahora'] for r in registros), dtype=np.int64, count=len(registros)),
+            )
+
+# Lotes do arquivo binário da etapa 03, no mesmo formato de lotes_json
+def lotes_binario(caminho):
+    for lote in ler_lotes(caminho):
+        yield lote.linhas, lote.prefixos, lote.offsets, lote.latitude, lote.longitude, lote.datahora
+
+# Converte o arquivo de viagens processadas para o CSV
+def converter(entrada):
+    if entrada.endswith('.json'):
+        lotes = lotes_json(entrada)
+    else:
+        lotes = lotes_binario(entrada)
+
+    # Cria arquivo CSV de saída, escreve cabeçalho e mantém o mesmo writer até o fim
+    with open(outputf, 'w', newline='', buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        writer.writerow(CABECALHO)
+
+        # Lê viagens processadas em lotes e converte para linhas do CSV
+        with Progresso('Viagens') as barra:
+            while True:
+                with fase('ler'):
+                    lote = next(lotes, None)
+                if lote is None:
+                    break
+                linhas = linhas_csv(*lote, registro)
+                with fase('gravar'):
+                    writer.writerows(linhas)
+                contar('registros', len(lote[0]))
+                contar('linhas_csv', len(linhas))
+                barra.atualizar(len(lote[0]))
+
+    # Relata uma única vez os prefixos sem viação conhecida
+    registro.relatar_desconhecidos()
+
+def main():
+    parser = argparse.ArgumentParser(description='Converte as viagens processadas para viagens.csv.')
+    parser.add_argument('entrada', nargs='?', default='viagens_processadas.bin',
+                        help='viagens processadas: .bin (padrão) ou .json')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    with Metricas('csv', args) as metricas:
+        metricas.lidos(args.entrada)
+        metricas.gravados(outputf)
+        converter(args.entrada)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Armazenamento compacto das viagens segmentadas na etapa 03.
+
+As viagens de cada carro ficam em um LoteViagens (arrays NumPy concatenados),
+guardados em memória enquanto couberem no limite configurado e despejados
+para um arquivo temporário em disco quando o limite é ultrapassado.
+"""
+from collections import namedtuple
+import pickle
+import tempfile
+import numpy as np
+
+from distancias import great_circle_km
+
+# Viagens de um carro em forma compacta: os registros de todas as viagens
+# ficam concatenados nos arrays e offsets[k]:offsets[k + 1] delimita a viagem k.
+LoteViagens = namedtuple('LoteViagens', [
+    'prefixo', 'linhas', 'offsets', 'datahora', 'latitude', 'longitude', 'vel',
+])
+
+
+def tamanho_lote(lote):
+    """Estimativa do espaço ocupado pelo lote em memória (bytes)."""
+    arrays = (lote.offsets, lote.datahora, lote.latitude, lote.longitude, lote.vel)
+    return sum(a.nbytes for a in arrays) + 64 * len(lote.linhas)
+
+
+def duracoes_distancias(lote):
+    """Arrays com a duração (ms) e a distância em linha reta (km) de cada viagem."""
+    if len(lote.linhas) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    ini = lote.offsets[:-1]
+    fim = lote.offsets[1:] - 1
+    duracoes = lote.datahora[fim] - lote.datahora[ini]
+    dists = great_circle_km(lote.latitude[ini], lote.longitude[ini],
+                            lote.latitude[fim], lote.longitude[fim])
+    return duracoes, dists
+
+
+def resumos_lote(lote):
+    """Resumo (linha, prefixo, duração em ms, distância em km) de cada viagem."""
+    duracoes, dists = duracoes_distancias(lote)
+    return [(linha, lote.prefixo, d, km) for linha, d, km in zip(lote.linhas, duracoes.tolist(), dists.tolist())]
+
+
+def expandir_lote(lote, indices=None):
+    """
+    Converte o lote de volta para o formato de lista usado no JSON de saída:
+    (linha, prefixo, [{'datahora', 'latitude', 'longitude', 'vel'}, ...]).
+    Se `indices` for dado, expande apenas essas viagens.
+    """
+    if indices is None:
+        indices = range(len(lote.linhas))
+    t, lat, lon, vel = (lote.datahora.tolist(), lote.latitude.tolist(),
+                        lote.longitude.tolist(), lote.vel.tolist())
+    offsets = lote.offsets.tolist()
+
+    viagens = []
+    for k in indices:
+        viagem = [{
+            'datahora': t[j],
+            'latitude': lat[j],
+            'longitude': lon[j],
+            'vel': vel[j],
+        } for j in range(offsets[k], offsets[k + 1])]
+        viagens.append((lote.linhas[k], lote.prefixo, viagem))
+    return viagens
+
+
+class ArmazemViagens:
+    """
+    Guarda lotes de viagens na ordem em que são adicionados.
+    Fica em memória até `limite_memoria` bytes; acima disso todos os lotes
+    passam para um arquivo temporário (em `pasta`, ou na pasta padrão do sistema).
+    """
+
+    def __init__(self, limite_memoria=1024 * 2**20, pasta=None):
+        self.limite_memoria = limite_memoria
+        self.pasta = pasta
+        self._lotes = []
+        self._arquivo = None
+        self._bytes = 0
+        self._quantidade = 0
+
+    def __len__(self):
+        return self._quantidade
+
+    @property
+    def em_disco(self):
+        return self._arquivo is not None
+
+    def adicionar(self, lote):
+        self._bytes += tamanho_lote(lote)
+        self._quantidade += 1
+        if self._arquivo is None and self._bytes > self.limite_memoria:
+            self._despejar()
+        if self._arquivo is not None:
+            pickle.dump(lote, self._arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            self._lotes.append(lote)
+
+    def _despejar(self):
+        # Move os lotes em memória para o arquivo temporário
+        self._arquivo = tempfile.TemporaryFile(dir=self.pasta)
+        for lote in self._lotes:
+            pickle.dump(lote, self._arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+        self._lotes = []
+
+    def __iter__(self):
+        if self._arquivo is None:
+            yield from self._lotes
+            return
+        self._arquivo.flush()
+        self._arquivo.seek(0)
+        for _ in range(self._quantidade):
+            yield pickle.load(self._arquivo)
+        self._arquivo.seek(0, 2)
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        self._lotes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
@@ -0,0 +1,170 @@
+"""
+Leitura tipada dos arquivos GTFS com cache binário.
+
+Cada arquivo .txt do feed é lido uma vez com dtypes explícitos (categorias
+para ids e textos repetidos, inteiros pequenos, float64 para coordenadas) e
+o DataFrame resultante é salvo em pickle na pasta de cache. As execuções
+seguintes carregam o pickle direto, desde que a versão do feed (feed_info.txt)
+e o hash do arquivo não tenham mudado; caso contrário o cache é refeito.
+"""
+from pathlib import Path
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import pandas as pd
+
+# Versão do esquema de dtypes abaixo; mudar invalida todos os caches
+VERSAO_ESQUEMA = 1
+
+# dtypes explícitos por arquivo (colunas ausentes no arquivo são ignoradas)
+DTYPES = {
+    'agency': {
+        'agency_id': 'category',
+    },
+    'routes': {
+        'route_id': 'category',
+        'agency_id': 'category',
+        'route_short_name': str,
+        'route_long_name': str,
+        'route_desc': str,
+        'route_type': 'int16',
+        'route_color': 'category',
+        'route_text_color': 'category',
+        'fare_id': 'category',
+    },
+    'trips': {
+        'trip_id': 'category',
+        'route_id': 'category',
+        'service_id': 'category',
+        'trip_headsign': 'category',
+        'trip_short_name': 'category',
+        'direction_id': 'Int8',
+        'shape_id': 'category',
+    },
+    'stop_times': {
+        'trip_id': 'category',
+        'arrival_time': 'category',
+        'departure_time': 'category',
+        'stop_id': 'category',
+        'stop_sequence': 'int32',
+    },
+    'stops': {
+        'stop_id': str,
+        'stop_code': str,
+        'stop_name': str,
+        'stop_desc': str,
+        'stop_lat': 'float64',
+        'stop_lon': 'float64',
+        'parent_station': str,
+    },
+    'frequencies': {
+        'trip_id': 'category',
+        'start_time': 'category',
+        'end_time': 'category',
+        'headway_secs': 'int32',
+        'exact_times': 'Int8',
+    },
+    'fare_rules': {
+        'fare_id': 'category',
+        'route_id': 'category',
+        'agency_id': 'category',
+    },
+}
+
+
+def versao_feed(pasta):
+    """feed_version de feed_info.txt (ou None se não existir)."""
+    caminho = Path(pasta) / 'feed_info.txt'
+    if not caminho.exists():
+        return None
+    info = pd.read_csv(caminho, dtype=str)
+    if 'feed_version' not in info.columns or info.empty:
+        return None
+    return info['feed_version'].iloc[0]
+
+
+def hash_arquivo(caminho):
+    h = hashlib.sha1()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def gravar_atomico(caminho, escrever, modo='wb'):
+    """
+    Grava `caminho` com `escrever(f)` num temporário da mesma pasta e o renomeia
+    no fim: outro processo lendo o cache ao mesmo tempo (etapas independentes
+    rodam em paralelo) vê o arquivo antigo ou o novo, nunca um pela metade.
+    """
+    caminho = Path(caminho)
+    fd, temporario = tempfile.mkstemp(dir=caminho.parent, prefix=caminho.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, modo) as f:
+            escrever(f)
+        os.replace(temporario, caminho)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+def ler_tabela(caminho, nome):
+    """Lê um arquivo GTFS com os dtypes definidos em DTYPES (sem cache)."""
+    colunas = pd.read_csv(caminho, nrows=0).columns
+    dtypes = {c: t for c, t in DTYPES.get(nome, {}).items() if c in colunas}
+    return pd.read_csv(caminho, dtype=dtypes, low_memory=False)
+
+
+def carregar_tabela(nome, pasta='../gtfs', cache=None):
+    """
+    Carrega `<pasta>/<nome>.txt`, usando o cache em `cache` (padrão:
+    `<pasta>/.cache`) quando ele ainda corresponde ao arquivo e à versão do feed.
+    """
+    pasta = Path(pasta)
+    caminho = pasta / f'{nome}.txt'
+    cache = Path(cache) if cache is not None else pasta / '.cache'
+    arq_dados = cache / f'{nome}.pkl'
+    arq_meta = cache / f'{nome}.json'
+
+    estado = caminho.stat()  # FileNotFoundError se o arquivo não existir
+    chave = {
+        'esquema': VERSAO_ESQUEMA,
+        'pandas': pd.__version__,
+        'feed_version': versao_feed(pasta),
+    }
+
+    meta = None
+    if arq_meta.exists() and arq_dados.exists():
+        with open(arq_meta, 'r') as f:
+            meta = json.load(f)
+
+    if meta is not None and all(meta.get(k) == v for k, v in chave.items()):
+        # Tamanho e data iguais: confia no cache sem reler o arquivo
+        if meta['tamanho'] == estado.st_size and meta['mtime'] == estado.st_mtime_ns:
+            with open(arq_dados, 'rb') as f:
+                return pickle.load(f)
+        # Arquivo tocado: só refaz o cache se o conteúdo realmente mudou
+        sha1 = hash_arquivo(caminho)
+        if meta['sha1'] == sha1:
+            meta.update(tamanho=estado.st_size, mtime=estado.st_mtime_ns)
+            gravar_atomico(arq_meta, lambda f: json.dump(meta, f), 'w')
+            with open(arq_dados, 'rb') as f:
+                return pickle.load(f)
+    else:
+        sha1 = hash_arquivo(caminho)
+
+    df = ler_tabela(caminho, nome)
+
+    # Dados antes do meta: um meta novo nunca aponta para dados antigos
+    cache.mkdir(parents=True, exist_ok=True)
+    gravar_atomico(arq_dados, lambda f: pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL))
+    meta = dict(chave, sha1=sha1, tamanho=estado.st_size, mtime=estado.st_mtime_ns)
+    gravar_atomico(arq_meta, lambda f: json.dump(meta, f), 'w')
+    return df
+
+
+def carregar_gtfs(nomes, pasta='../gtfs', cache=None):
+    """Carrega vários arquivos do feed: retorna {nome: DataFrame}."""
+    return {nome: carregar_tabela(nome, pasta, cache) for nome in nomes}
@@ -0,0 +1,149 @@
+"""
+Cliente HTTP/1.1 assíncrono mínimo (asyncio), com pool de conexões.
+
+Só com a biblioteca padrão: as conexões (TLS ou não) abertas por
+asyncio.open_connection são reaproveitadas entre requisições ao mesmo
+servidor (keep-alive), até `conexoes` simultâneas por servidor. Suporta
+respostas com Content-Length ou chunked e com gzip (Content-Encoding), o
+suficiente para consultar a API do SPPO.
+"""
+from urllib.parse import urlencode, urlsplit
+import asyncio
+import gzip
+import ssl
+
+
+class ErroHTTP(Exception):
+    """Resposta com status de erro; `status` e `cabecalhos` ficam disponíveis."""
+
+    def __init__(self, status, cabecalhos, url):
+        super().__init__(f'HTTP {status} em {url}')
+        self.status = status
+        self.cabecalhos = cabecalhos
+
+
+class PoolHTTP:
+    """
+    Pool de conexões por servidor (esquema, host, porta). `get` espera uma
+    conexão livre (ou abre uma nova, se houver vaga) e devolve o corpo da
+    resposta. Use como `async with PoolHTTP(...) as pool`.
+    """
+
+    def __init__(self, conexoes=8, tempo_limite=60.0, agente='coletor-sppo'):
+        self.conexoes = conexoes
+        self.tempo_limite = tempo_limite
+        self.agente = agente
+        self._livres = {}
+        self._vagas = {}
+        self.abertas = 0
+
+    def _servidor(self, url):
+        partes = urlsplit(url)
+        tls = partes.scheme == 'https'
+        return partes.scheme, partes.hostname, partes.port or (443 if tls else 80)
+
+    async def _conectar(self, servidor):
+        esquema, host, porta = servidor
+        contexto = ssl.create_default_context() if esquema == 'https' else None
+        leitor, escritor = await asyncio.open_connection(host, porta, ssl=contexto)
+        self.abertas += 1
+        return leitor, escritor
+
+    async def get(self, url, parametros=None):
+        """Corpo (bytes) da resposta a um GET; levanta ErroHTTP se o status não for 2xx."""
+        if parametros:
+            url = f'{url}{"&" if "?" in url else "?"}{urlencode(parametros)}'
+        servidor = self._servidor(url)
+        vagas = self._vagas.setdefault(servidor, asyncio.Semaphore(self.conexoes))
+        livres = self._livres.setdefault(servidor, [])
+
+        async with vagas:
+            conexao = livres.pop() if livres else None
+            reaproveitada = conexao is not None
+            if not reaproveitada:
+                conexao = await asyncio.wait_for(self._conectar(servidor), self.tempo_limite)
+            try:
+                try:
+                    status, cabecalhos, corpo, manter = await asyncio.wait_for(
+                        self._requisitar(conexao, url, servidor), self.tempo_limite)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # Conexão reaproveitada pode ter sido fechada pelo servidor: repete uma vez numa nova
+                    if not reaproveitada:
+                        raise
+                    conexao[1].close()
+                    conexao = await asyncio.wait_for(self._conectar(servidor), self.tempo_limite)
+                    status, cabecalhos, corpo, manter = await asyncio.wait_for(
+                        self._requisitar(conexao, url, servidor), self.tempo_limite)
+            except BaseException:
+                conexao[1].close()
+                raise
+
+            if manter:
+                livres.append(conexao)
+            else:
+                conexao[1].close()
+
+        if not 200 <= status < 300:
+            raise ErroHTTP(status, cabecalhos, url)
+        return corpo
+
+    async def _requisitar(self, conexao, url, servidor):
+        leitor, escritor = conexao
+        partes = urlsplit(url)
+        caminho = (partes.path or '/') + (f'?{partes.query}' if partes.query else '')
+        escritor.write((f'GET {caminho} HTTP/1.1\r\n'
+                        f'Host: {servidor[1]}\r\n'
+                        f'User-Agent: {self.agente}\r\n'
+                        'Accept: application/json\r\n'
+                        'Accept-Encoding: gzip\r\n'
+                        'Connection: keep-alive\r\n\r\n').encode('latin-1'))
+        await escritor.drain()
+
+        linha = await leitor.readuntil(b'\r\n')
+        status = int(linha.split()[1])
+        cabecalhos = {}
+        while True:
+            linha = await leitor.readuntil(b'\r\n')
+            if linha == b'\r\n':
+                break
+            nome, _, valor = linha.decode('latin-1').partition(':')
+            cabecalhos[nome.strip().lower()] = valor.strip()
+
+        if cabecalhos.get('transfer-encoding', '').lower() == 'chunked':
+            partes_corpo = []
+            while True:
+                tamanho = int((await leitor.readuntil(b'\r\n')).split(b';')[0], 16)
+                if tamanho == 0:
+                    # trailers até a linha vazia
+                    while await leitor.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                partes_corpo.append(await leitor.readexactly(tamanho))
+                await leitor.readexactly(2)
+            corpo = b''.join(partes_corpo)
+            manter = True
+        elif 'content-length' in cabecalhos:
+            corpo = await leitor.readexactly(int(cabecalhos['content-length']))
+            manter = True
+        else:
+            # Sem tamanho: o corpo vai até o servidor fechar a conexão
+            corpo = await leitor.read()
+            manter = False
+
+        if cabecalhos.get('connection', '').lower() == 'close':
+            manter = False
+        if cabecalhos.get('content-encoding', '').lower() == 'gzip':
+            corpo = gzip.decompress(corpo)
+        return status, cabecalhos, corpo, manter
+
+    async def fechar(self):
+        for livres in self._livres.values():
+            for _, escritor in livres:
+                escritor.close()
+            livres.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.fechar()
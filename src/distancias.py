@@ -0,0 +1,73 @@
+"""
+Cálculo vetorizado de distâncias great-circle com NumPy.
+
+Usa exatamente a mesma fórmula e o mesmo raio de geopy.distance.great_circle,
+de modo que os resultados em lote coincidem com o cálculo ponto a ponto
+(e os limites de viagem da etapa 03 não mudam).
+"""
+import numpy as np
+
+# Mesmo raio médio da Terra usado pelo geopy (em km)
+RAIO_TERRA_KM = 6371.009
+
+# Limites de velocidade (km/h) fora dos quais o carro é considerado parado
+VEL_MIN = 2
+VEL_MAX = 200
+
+
+def great_circle_km(lat1, lon1, lat2, lon2):
+    """
+    Distância great-circle em km entre arrays (ou escalares) de coordenadas.
+    Aceita broadcasting do NumPy, ex: (N, 1) contra (1, M).
+    """
+    lat1 = np.radians(lat1)
+    lon1 = np.radians(lon1)
+    lat2 = np.radians(lat2)
+    lon2 = np.radians(lon2)
+
+    sin_lat1, cos_lat1 = np.sin(lat1), np.cos(lat1)
+    sin_lat2, cos_lat2 = np.sin(lat2), np.cos(lat2)
+
+    delta_lon = lon2 - lon1
+    cos_delta_lon, sin_delta_lon = np.cos(delta_lon), np.sin(delta_lon)
+
+    d = np.arctan2(np.sqrt((cos_lat2 * sin_delta_lon) ** 2 +
+                           (cos_lat1 * sin_lat2 -
+                            sin_lat1 * cos_lat2 * cos_delta_lon) ** 2),
+                   sin_lat1 * sin_lat2 + cos_lat1 * cos_lat2 * cos_delta_lon)
+
+    return RAIO_TERRA_KM * d
+
+
+def trilha_para_arrays(carro):
+    """
+    Converte a lista de registros de um carro (strings com vírgula decimal)
+    em arrays float64/int64, fazendo o parse de cada valor uma única vez.
+
+    Retorna (lat, lon, t, linhas).
+    """
+    n = len(carro)
+    lat = np.fromiter((float(r['latitude'].replace(',', '.')) for r in carro), dtype=np.float64, count=n)
+    lon = np.fromiter((float(r['longitude'].replace(',', '.')) for r in carro), dtype=np.float64, count=n)
+    t = np.fromiter((int(r['datahora']) for r in carro), dtype=np.int64, count=n)
+    linhas = [r['linha'] for r in carro]
+    return lat, lon, t, linhas
+
+
+def velocidades(lat, lon, t):
+    """
+    Velocidade (km/h) de cada registro em relação ao anterior.
+    O primeiro registro tem velocidade 0, assim como registros com o mesmo
+    horário do anterior ou com velocidade fora de [VEL_MIN, VEL_MAX].
+    """
+    vel = np.zeros(len(t), dtype=np.float64)
+    if len(t) < 2:
+        return vel
+
+    dist = great_circle_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    dt = (t[1:] - t[:-1]).astype(np.float64)
+    np.divide(dist * 3600000, dt, out=vel[1:], where=dt != 0)
+
+    vel[(vel < VEL_MIN) | (vel > VEL_MAX)] = 0.0
+    return vel
+
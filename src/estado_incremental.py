@@ -0,0 +1,86 @@
+"""
+Estado salvo entre execuções do modo incremental da etapa 03.
+
+Para acrescentar um dia novo sem reprocessar os anteriores, cada execução
+guarda, por carro, o que a segmentação precisa para continuar a trilha: o
+último registro (para a velocidade do próximo), a linha atual, a viagem que
+ficou aberta no fim dos dados e se a primeira viagem do carro já foi
+descartada. As viagens segmentadas (antes da filtragem) de cada execução
+ficam em um arquivo no formato de viagens_binario.py, porque os intervalos
+típicos por linha dependem de todas as viagens e são recalculados a cada dia.
+
+Pasta de estado:
+    estado.pkl              estado dos carros e lista de segmentos incorporados
+    segmentos/NNNNN.bin     viagens segmentadas de cada execução
+
+O estado.pkl é gravado por último (troca atômica do arquivo), então um
+segmento de uma execução interrompida nunca é incorporado.
+"""
+from collections import namedtuple
+from pathlib import Path
+import hashlib
+import os
+import pickle
+
+# Continuação da trilha de um carro. `ultimo` é (latitude, longitude, datahora)
+# do último registro; `aberta` é None ou um dict com as colunas datahora,
+# latitude, longitude, vel e a lista de nomes das linhas da viagem aberta.
+EstadoCarro = namedtuple('EstadoCarro', ['ultimo', 'linha', 'aberta', 'primeira_descartada'])
+
+
+def impressao_arquivos(*caminhos):
+    """Hash do conteúdo dos arquivos de referência (terminais, equivalências)."""
+    h = hashlib.sha1()
+    for caminho in caminhos:
+        with open(caminho, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class EstadoIncremental:
+    """
+    Estado da pasta `pasta`. `parametros` identifica a configuração da
+    segmentação (distância dos pontos finais, terminais, equivalências); se o
+    estado salvo foi gerado com outros parâmetros, a continuação não daria o
+    mesmo resultado do processamento completo e é recusada.
+    """
+
+    def __init__(self, pasta, parametros):
+        self.pasta = Path(pasta)
+        self.parametros = parametros
+        self.carros = {}
+        self.segmentos = []
+
+        arquivo = self.pasta / 'estado.pkl'
+        if arquivo.exists():
+            with open(arquivo, 'rb') as f:
+                salvo = pickle.load(f)
+            if salvo['parametros'] != parametros:
+                raise ValueError(f'{arquivo} foi gerado com outros terminais, equivalências ou distponto; '
+                                 'apague a pasta de estado e reprocesse todos os dias')
+            self.carros = salvo['carros']
+            self.segmentos = salvo['segmentos']
+
+    def novo_segmento(self):
+        """Caminho do arquivo de viagens segmentadas da próxima execução."""
+        pasta = self.pasta / 'segmentos'
+        pasta.mkdir(parents=True, exist_ok=True)
+        return pasta / f'{len(self.segmentos):05d}.bin'
+
+    def caminhos_segmentos(self):
+        return [self.pasta / 'segmentos' / nome for nome in self.segmentos]
+
+    def registrar(self, carros, segmento):
+        """Incorpora o segmento gravado e o novo estado dos carros processados."""
+        self.carros.update(carros)
+        self.segmentos.append(Path(segmento).name)
+
+        arquivo = self.pasta / 'estado.pkl'
+        temporario = arquivo.with_suffix('.tmp')
+        with open(temporario, 'wb') as f:
+            pickle.dump({
+                'parametros': self.parametros,
+                'carros': self.carros,
+                'segmentos': self.segmentos,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, arquivo)
@@ -0,0 +1,278 @@
+"""
+Executor da pipeline (etapas 01 a 04 e relatório) com cache por conteúdo.
+
+Cada etapa declara os arquivos que lê e os que grava. A chave de uma etapa é
+o hash do seu código (o script e os módulos de src/ que ele importa, o que
+inclui constantes como distponto e os fatores dos intervalos interquartis),
+dos parâmetros de linha de comando que afetam o resultado e do conteúdo das
+entradas. Se a chave é igual à da última execução e as saídas não foram
+alteradas desde então, a etapa é pulada. Etapas independentes (01, as
+equivalências de linhas e 02) rodam em paralelo.
+
+Todas as etapas rodam com a pasta de trabalho como pasta atual. O estado
+fica em <pasta de trabalho>/.pipeline/:
+    hashes.json     hash de cada arquivo, reaproveitado enquanto tamanho e data não mudam
+    etapas/*.json   chave e hash das saídas da última execução de cada etapa
+    logs/*.log      saída de cada etapa
+    metricas/*.json métricas de desempenho da última execução de cada etapa (ver metricas.py)
+"""
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+RAIZ = Path(__file__).resolve().parent.parent
+SRC = RAIZ / 'src'
+
+# Etapa da pipeline. `entradas` e `saidas` são caminhos relativos à pasta de
+# trabalho (ou absolutos); `parametros` entra na chave, `argumentos` não
+# (ex: número de processos, que não muda o resultado).
+Etapa = namedtuple('Etapa', ['nome', 'script', 'argumentos', 'parametros', 'entradas', 'saidas'])
+
+
+def etapas_pipeline(gtfs, inicio, fim, consorcios, processos, equivalencias_manuais=False):
+    """Etapas da pipeline completa, de GTFS e sppo/ até o relatório."""
+    arquivos_gtfs = [str(Path(gtfs) / f'{nome}.txt') for nome in ('stops', 'stop_times', 'trips', 'routes')]
+    etapas = [
+        Etapa('terminais', SRC / '01_gerar_terminais_gtfs.py',
+              ['--gtfs', gtfs, '--saida', 'terminais_coordenadas.json'], {},
+              arquivos_gtfs, ['terminais_coordenadas.json']),
+        Etapa('agregar', SRC / '02_agregar_dados_sppo.py',
+              ['--trilhas', 'carros.trilhas', '--inicio', inicio, '--fim', fim, '-c', *consorcios],
+              {'inicio': inicio, 'fim': fim, 'consorcios': sorted(consorcios)},
+              ['sppo'], ['carros.trilhas']),
+        Etapa('viagens', SRC / '03_processar_viagens_carro.py',
+              ['--trilhas', 'carros.trilhas', '-p', str(processos), '--saida', 'viagens_processadas.bin'], {},
+              ['carros.trilhas', 'terminais_coordenadas.json', 'equivalencias.json'], ['viagens_processadas.bin']),
+        Etapa('csv', SRC / '04_converter_para_csv.py',
+              ['viagens_processadas.bin'], {},
+              ['viagens_processadas.bin', 'equivalencias.json', 'viacoes.csv'], ['viagens.csv']),
+        Etapa('relatorio', RAIZ / 'analysis' / 'gerar_relatório.py',
+              [], {},
+              ['viagens.csv'], ['analise_viagens2.txt']),
+    ]
+    if not equivalencias_manuais:
+        etapas.insert(1, Etapa('equivalencias', RAIZ / 'tools' / 'gerar_equivalencias_de_linhas.py',
+                               ['--gtfs', gtfs, '--saida', 'equivalencias.json'], {},
+                               [str(Path(gtfs) / 'routes.txt')], ['equivalencias.json']))
+    return etapas
+
+
+def modulos_importados(script):
+    """O script e os módulos de src/ importados por ele (direta ou indiretamente)."""
+    vistos = {Path(script)}
+    pendentes = [Path(script)]
+    while pendentes:
+        arvore = ast.parse(pendentes.pop().read_bytes())
+        for no in ast.walk(arvore):
+            if isinstance(no, ast.Import):
+                nomes = [a.name for a in no.names]
+            elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+                nomes = [no.module]
+            else:
+                continue
+            for nome in nomes:
+                caminho = SRC / f'{nome.split(".")[0]}.py'
+                if caminho.exists() and caminho not in vistos:
+                    vistos.add(caminho)
+                    pendentes.append(caminho)
+    return sorted(vistos)
+
+
+class Hashes:
+    """
+    Hash (sha1) de arquivos e pastas, com cache em disco: um arquivo só é
+    relido se o tamanho ou a data de modificação mudaram.
+    """
+
+    def __init__(self, arquivo):
+        self.arquivo = Path(arquivo)
+        self._trava = threading.Lock()
+        self._cache = {}
+        if self.arquivo.exists():
+            with open(self.arquivo, 'r') as f:
+                self._cache = json.load(f)
+
+    def arquivo_hash(self, caminho):
+        caminho = Path(caminho).resolve()
+        estado = caminho.stat()
+        chave = str(caminho)
+        with self._trava:
+            salvo = self._cache.get(chave)
+        if salvo is not None and salvo[0] == estado.st_size and salvo[1] == estado.st_mtime_ns:
+            return salvo[2]
+
+        h = hashlib.sha1()
+        with open(caminho, 'rb') as f:
+            for bloco in iter(lambda: f.read(1 << 20), b''):
+                h.update(bloco)
+        with self._trava:
+            self._cache[chave] = [estado.st_size, estado.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def __call__(self, caminho):
+        """Hash de um arquivo, ou de uma pasta (nomes e conteúdo de todos os arquivos); None se não existir."""
+        caminho = Path(caminho)
+        if caminho.is_file():
+            return self.arquivo_hash(caminho)
+        if not caminho.is_dir():
+            return None
+        h = hashlib.sha1()
+        for arquivo in sorted(p for p in caminho.rglob('*') if p.is_file()):
+            h.update(str(arquivo.relative_to(caminho)).encode('utf-8'))
+            h.update(self.arquivo_hash(arquivo).encode('ascii'))
+        return h.hexdigest()
+
+    def salvar(self):
+        with self._trava:
+            self.arquivo.parent.mkdir(parents=True, exist_ok=True)
+            temporario = self.arquivo.with_suffix('.tmp')
+            with open(temporario, 'w') as f:
+                json.dump(self._cache, f)
+            os.replace(temporario, self.arquivo)
+
+
+class Pipeline:
+    """Executa as etapas em ordem de dependência, pulando as que estão em cache."""
+
+    def __init__(self, etapas, trabalho='.', paralelas=3, forcar=False):
+        self.etapas = {e.nome: e for e in etapas}
+        self.trabalho = Path(trabalho)
+        self.paralelas = paralelas
+        self.forcar = forcar
+        self.pasta = self.trabalho / '.pipeline'
+        self.hashes = Hashes(self.pasta / 'hashes.json')
+
+        # Uma etapa depende das etapas que produzem suas entradas
+        produtor = {s: e.nome for e in etapas for s in e.saidas}
+        self.dependencias = {e.nome: {produtor[x] for x in e.entradas if x in produtor} for e in etapas}
+
+        faltando = [x for e in etapas for x in e.entradas
+                    if x not in produtor and not (self.trabalho / x).exists()]
+        if faltando:
+            raise FileNotFoundError('entradas não encontradas: ' + ', '.join(sorted(set(faltando))))
+
+    def chave(self, etapa):
+        h = hashlib.sha1()
+        h.update(json.dumps({
+            'etapa': etapa.nome,
+            'codigo': {p.name: self.hashes(p) for p in modulos_importados(etapa.script)},
+            'parametros': etapa.parametros,
+            'entradas': {x: self.hashes(self.trabalho / x) for x in etapa.entradas},
+        }, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def em_cache(self, etapa, chave):
+        arquivo = self.pasta / 'etapas' / f'{etapa.nome}.json'
+        if self.forcar or not arquivo.exists():
+            return False
+        with open(arquivo, 'r') as f:
+            salvo = json.load(f)
+        return salvo['chave'] == chave and all(
+            self.hashes(self.trabalho / s) == h for s, h in salvo['saidas'].items())
+
+    def executar_etapa(self, etapa):
+        """Executa (ou pula) uma etapa; retorna True se as saídas estão prontas."""
+        chave = self.chave(etapa)
+        if self.em_cache(etapa, chave):
+            print(f'[{etapa.nome}] em cache')
+            return True
+
+        # Apaga as saídas antigas: uma etapa que falha sem erro não deixa resultado velho para trás
+        for s in etapa.saidas:
+            (self.trabalho / s).unlink(missing_ok=True)
+
+        (self.pasta / 'logs').mkdir(parents=True, exist_ok=True)
+        log = self.pasta / 'logs' / f'{etapa.nome}.log'
+        metricas = (self.pasta / 'metricas' / f'{etapa.nome}.json').resolve()
+        print(f'[{etapa.nome}] executando ({log})')
+        inicio = time.perf_counter()
+        with open(log, 'w') as f:
+            retorno = subprocess.run([sys.executable, str(etapa.script), *etapa.argumentos, '--metricas', str(metricas)],
+                                     cwd=self.trabalho, stdout=f, stderr=subprocess.STDOUT).returncode
+
+        faltando = [s for s in etapa.saidas if not (self.trabalho / s).exists()]
+        if retorno != 0 or faltando:
+            print(f'[{etapa.nome}] falhou (código {retorno}), veja {log}')
+            return False
+
+        saidas = {s: self.hashes(self.trabalho / s) for s in etapa.saidas}
+        (self.pasta / 'etapas').mkdir(parents=True, exist_ok=True)
+        with open(self.pasta / 'etapas' / f'{etapa.nome}.json', 'w') as f:
+            json.dump({'chave': chave, 'saidas': saidas}, f, indent=2)
+        self.hashes.salvar()
+        print(f'[{etapa.nome}] concluída em {time.perf_counter() - inicio:.1f} s')
+        return True
+
+    def executar(self, nomes=None):
+        """Executa as etapas `nomes` (padrão: todas) e as etapas das quais elas dependem."""
+        pendentes = set(nomes or self.etapas)
+        fila = list(pendentes)
+        while fila:
+            for d in self.dependencias[fila.pop()]:
+                if d not in pendentes:
+                    pendentes.add(d)
+                    fila.append(d)
+
+        concluidas, falhas = set(), set()
+        with ThreadPoolExecutor(max_workers=self.paralelas) as pool:
+            rodando = {}
+            while pendentes or rodando:
+                for nome in sorted(pendentes):
+                    if self.dependencias[nome] <= concluidas:
+                        pendentes.discard(nome)
+                        rodando[pool.submit(self.executar_etapa, self.etapas[nome])] = nome
+                if not rodando:
+                    break  # as etapas restantes dependem de alguma que falhou
+                prontas, _ = wait(rodando, return_when=FIRST_COMPLETED)
+                for futuro in prontas:
+                    nome = rodando.pop(futuro)
+                    (concluidas if futuro.result() else falhas).add(nome)
+
+        self.hashes.salvar()
+        if pendentes:
+            print('Não executadas (dependem de etapas com falha): ' + ', '.join(sorted(pendentes)))
+        return not falhas and not pendentes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Executa a pipeline, pulando as etapas cujo resultado ainda vale.')
+    parser.add_argument('etapas', nargs='*',
+                        help='etapas a executar, com as suas dependências (padrão: todas)')
+    parser.add_argument('--trabalho', default='.',
+                        help='pasta com sppo/, viacoes.csv e onde ficam os resultados (padrão: pasta atual)')
+    parser.add_argument('--gtfs', default='../gtfs', help='pasta do feed GTFS (padrão: ../gtfs)')
+    parser.add_argument('--inicio', default='2025-11-01', help='primeiro dia agregado (padrão: 2025-11-01)')
+    parser.add_argument('--fim', default='2025-11-07', help='último dia agregado (padrão: 2025-11-07)')
+    parser.add_argument('-c', '--consorcios', nargs='+', default=['A', 'B', 'C', 'D', 'E'],
+                        help='consórcios agregados na etapa 02 (padrão: todos)')
+    parser.add_argument('-p', '--processos', type=int, default=1,
+                        help='processos da etapa 03 (0 = todos os núcleos)')
+    parser.add_argument('-j', '--paralelas', type=int, default=3,
+                        help='etapas independentes executadas ao mesmo tempo (padrão: 3)')
+    parser.add_argument('--equivalencias-manuais', action='store_true',
+                        help='usa o equivalencias.json da pasta de trabalho em vez de gerá-lo do GTFS')
+    parser.add_argument('--forcar', action='store_true', help='ignora o cache e executa todas as etapas')
+    args = parser.parse_args()
+
+    etapas = etapas_pipeline(args.gtfs, args.inicio, args.fim, args.consorcios, args.processos,
+                             args.equivalencias_manuais)
+    desconhecidas = set(args.etapas) - {e.nome for e in etapas}
+    if desconhecidas:
+        parser.error('etapas desconhecidas: ' + ', '.join(sorted(desconhecidas)))
+
+    pipeline = Pipeline(etapas, args.trabalho, args.paralelas, args.forcar)
+    if not pipeline.executar(args.etapas):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
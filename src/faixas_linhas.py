@@ -0,0 +1,96 @@
+"""
+Intervalos típicos de duração e distância das viagens de cada linha (etapa 03).
+
+Os resumos das viagens ficam em arrays (código da linha, duração em ms,
+distância em km) e os quartis de todas as linhas são calculados de uma vez,
+ordenando os valores por (linha, valor). O resultado é igual ao de
+statistics.quantiles(n=4) (método 'exclusive', o padrão) aplicado linha a
+linha. Linhas com menos de duas viagens ficam sem intervalo (NaN), e por
+isso nenhuma viagem delas é aceita. É o resultado do cálculo linha a linha
+no Python 3.13, em que statistics.quantiles de um único valor repete o valor
+nos três quartis e o intervalo aberto fica vazio; até o 3.12 ele falhava e
+interrompia a etapa.
+"""
+from collections import namedtuple
+import numpy as np
+
+from armazem_viagens import duracoes_distancias
+
+# Intervalos (abertos) aceitos por linha; o índice dos arrays é o código da linha
+FaixasLinhas = namedtuple('FaixasLinhas', ['linhas', 't_min', 't_max', 'd_min', 'd_max'])
+
+
+def quartis_agrupados(codigos, valores, n_grupos):
+    """
+    Quartis de `valores` por grupo: array (n_grupos, 3), com a linha g igual a
+    statistics.quantiles(valores do grupo g, n=4). Grupos com menos de dois
+    valores ficam com NaN.
+    """
+    codigos = np.asarray(codigos, dtype=np.int64)
+    valores = np.asarray(valores)
+    quartis = np.full((n_grupos, 3), np.nan)
+
+    contagem = np.bincount(codigos, minlength=n_grupos)
+    inicio = np.zeros(n_grupos, dtype=np.int64)
+    inicio[1:] = np.cumsum(contagem)[:-1]
+    ordenados = valores[np.lexsort((valores, codigos))]
+
+    grupos = np.flatnonzero(contagem >= 2)
+    ld = contagem[grupos]
+    m = ld + 1
+    base = inicio[grupos]
+    # Mesma interpolação (com aritmética inteira nos índices) de statistics.quantiles
+    for i in range(1, 4):
+        j = np.clip(i * m // 4, 1, ld - 1)
+        delta = i * m - j * 4
+        quartis[grupos, i - 1] = (ordenados[base + j - 1] * (4 - delta) + ordenados[base + j] * delta) / 4
+    return quartis
+
+
+class ResumosViagens:
+    """Duração e distância de todas as viagens, com a linha codificada em inteiros."""
+
+    def __init__(self):
+        self.codigos = {}
+        self.linhas = []
+        self._partes = []
+        self._arrays = None
+
+    def __len__(self):
+        return sum(len(p[0]) for p in self._partes)
+
+    def codificar(self, linhas):
+        """Códigos (int32) dos nomes de linha, criando códigos novos se preciso."""
+        codigos = np.empty(len(linhas), dtype=np.int32)
+        for k, linha in enumerate(linhas):
+            c = self.codigos.get(linha)
+            if c is None:
+                c = self.codigos[linha] = len(self.linhas)
+                self.linhas.append(linha)
+            codigos[k] = c
+        return codigos
+
+    def adicionar(self, lote):
+        """Acrescenta os resumos das viagens de um LoteViagens."""
+        duracoes, dists = duracoes_distancias(lote)
+        self._partes.append((self.codificar(lote.linhas), duracoes, dists))
+        self._arrays = None
+
+    def arrays(self):
+        """(códigos, durações em ms, distâncias em km) de todas as viagens, na ordem adicionada."""
+        if self._arrays is None:
+            if self._partes:
+                self._arrays = tuple(np.concatenate(c) for c in zip(*self._partes))
+            else:
+                self._arrays = (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64),
+                                np.zeros(0, dtype=np.float64))
+        return self._arrays
+
+
+def intervalos_por_linha(faixas):
+    """Intervalos no formato {linha: ((t_min, t_max), (d_min, d_max))}, None se a linha não tiver intervalo."""
+    ret = {}
+    for linha, t0, t1, d0, d1 in zip(faixas.linhas, faixas.t_min.tolist(), faixas.t_max.tolist(),
+                                     faixas.d_min.tolist(), faixas.d_max.tolist()):
+        ret[linha] = None if np.isnan(t0) else ((t0, t1), (d0, d1))
+    return ret
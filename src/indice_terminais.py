@@ -0,0 +1,220 @@
+"""
+Índice espacial (grade regular em km projetados) dos pontos finais das linhas.
+
+Os pontos finais são projetados em coordenadas planas (equiretangular em torno
+da latitude média) e agrupados em células do tamanho do raio de busca, com
+uma margem que cobre a distorção da projeção. Um ponto só pode estar a menos
+de `raio` km de um terminal da célula dele ou de uma das 8 vizinhas; apenas
+esses pares candidatos têm a distância great-circle calculada de fato, com a
+mesma fórmula de distancias.great_circle_km. Por isso o resultado das
+comparações com o raio é idêntico ao da força bruta sobre todos os terminais.
+
+Para consultas com pontos de muitas linhas de uma vez (ex: um snapshot da
+frota inteira na segmentação online), `distancia_minima_linhas` usa uma tabela
+única com as células de todas as linhas, em vez de uma consulta por linha.
+"""
+from functools import cached_property
+import numpy as np
+
+from distancias import great_circle_km, RAIO_TERRA_KM
+
+# Folga relativa sobre o raio para absorver a aproximação plana
+FOLGA = 0.01
+
+# Deslocamento para empacotar os índices de célula (ix, iy) em um único int64
+_DESLOC = 2**31
+
+
+class IndiceTerminais:
+    """
+    Índice dos terminais de todas as linhas.
+
+    `pontos_finais` é o dicionário linha -> [[lat, lon], ...] e `raio` a
+    distância (km) usada nas consultas de proximidade.
+    """
+
+    def __init__(self, pontos_finais, raio):
+        self.raio = raio
+
+        todos = [p for pf in pontos_finais.values() for p in pf]
+        lats = np.array([p[0] for p in todos], dtype=np.float64)
+        self.lat_ref = float(lats.mean()) if len(todos) else 0.0
+        self._kx = RAIO_TERRA_KM * np.cos(np.radians(self.lat_ref))
+
+        # A escala leste-oeste real na latitude de um terminal é cos(lat) e a
+        # projeção usa cos(lat_ref); o fator cobre a pior razão entre as duas.
+        if len(todos):
+            lat_max = np.abs(lats).max() + np.degrees(raio / RAIO_TERRA_KM)
+            fator = max(1.0, np.cos(np.radians(self.lat_ref)) / np.cos(np.radians(min(lat_max, 89.0))))
+        else:
+            fator = 1.0
+        self.celula = raio * fator * (1 + FOLGA)
+
+        self._linhas = {}
+        for linha, pf in pontos_finais.items():
+            if len(pf) == 0:
+                continue
+            t = np.asarray(pf, dtype=np.float64)
+            x, y = self._projetar(t[:, 0], t[:, 1])
+            ix, iy = self._celulas(x, y)
+            codigos = self._codigo(ix, iy)
+            ordem = np.argsort(codigos, kind='stable')
+            self._linhas[linha] = {
+                'codigos': codigos[ordem],
+                'lat': t[ordem, 0],
+                'lon': t[ordem, 1],
+                # Maior número de terminais da linha numa mesma célula
+                'max_celula': int(np.unique(codigos, return_counts=True)[1].max()),
+                'caixa': (x.min(), x.max(), y.min(), y.max()),
+            }
+
+    def _projetar(self, lat, lon):
+        return self._kx * np.radians(lon), RAIO_TERRA_KM * np.radians(lat)
+
+    def _celulas(self, x, y):
+        return (np.floor(x / self.celula).astype(np.int64),
+                np.floor(y / self.celula).astype(np.int64))
+
+    @staticmethod
+    def _codigo(ix, iy):
+        return (ix + _DESLOC) * 2**32 + (iy + _DESLOC)
+
+    def __contains__(self, linha):
+        return linha in self._linhas
+
+    def candidatos(self, linha, lat, lon):
+        """
+        Pares (índice do ponto, índice do terminal, distância em km) que podem
+        estar dentro do raio. Pares fora da lista estão garantidamente além do raio.
+        """
+        vazio = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+        dados = self._linhas[linha]
+
+        validos = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        if len(validos) == 0:
+            return vazio
+        x, y = self._projetar(lat[validos], lon[validos])
+
+        # Rejeição antecipada: a trilha inteira está longe de todos os terminais da linha
+        x0, x1, y0, y1 = dados['caixa']
+        c = self.celula
+        if x.max() < x0 - c or x.min() > x1 + c or y.max() < y0 - c or y.min() > y1 + c:
+            return vazio
+
+        ix, iy = self._celulas(x, y)
+        codigos = dados['codigos']
+        pontos, terminais = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cod = self._codigo(ix + dx, iy + dy)
+                pos = np.searchsorted(codigos, cod)
+                for r in range(dados['max_celula']):
+                    p = pos + r
+                    ok = p < len(codigos)
+                    ok[ok] = codigos[p[ok]] == cod[ok]
+                    if not ok.any():
+                        break
+                    pontos.append(validos[ok])
+                    terminais.append(p[ok])
+
+        if not pontos:
+            return vazio
+        pontos = np.concatenate(pontos)
+        terminais = np.concatenate(terminais)
+        d = great_circle_km(dados['lat'][terminais], dados['lon'][terminais], lat[pontos], lon[pontos])
+        return pontos, terminais, d
+
+    def distancia_minima(self, linha, lat, lon):
+        """
+        Menor distância (km) de cada ponto aos terminais da linha.
+        Pontos sem nenhum terminal dentro do raio recebem infinito (a
+        distância exata não é calculada); retorna None se a linha não tem terminais.
+        """
+        if linha not in self._linhas:
+            return None
+        mindist = np.full(len(lat), np.inf)
+        pontos, _, d = self.candidatos(linha, lat, lon)
+        np.minimum.at(mindist, pontos, d)
+        return mindist
+
+    @cached_property
+    def _tabela(self):
+        # Terminais de todas as linhas ordenados pelo código (linha, célula), com as
+        # células numeradas numa grade compacta com uma célula de margem em volta
+        nomes = list(self._linhas)
+        lat = np.concatenate([self._linhas[n]['lat'] for n in nomes])
+        lon = np.concatenate([self._linhas[n]['lon'] for n in nomes])
+        linha = np.repeat(np.arange(len(nomes)), [len(self._linhas[n]['lat']) for n in nomes])
+        ix, iy = self._celulas(*self._projetar(lat, lon))
+        origem = (int(ix.min()) - 1, int(iy.min()) - 1)
+        largura = int(ix.max()) - origem[0] + 2
+        altura = int(iy.max()) - origem[1] + 2
+        codigos = (linha * altura + (iy - origem[1])) * largura + (ix - origem[0])
+        ordem = np.argsort(codigos, kind='stable')
+        return {
+            'ids': {n: k for k, n in enumerate(nomes)},
+            'codigos': codigos[ordem],
+            'lat': lat[ordem],
+            'lon': lon[ordem],
+            'max_celula': int(np.unique(codigos, return_counts=True)[1].max()),
+            'origem': origem,
+            'largura': largura,
+            'altura': altura,
+        }
+
+    def id_linha(self, linha):
+        """Número da linha na tabela de `distancia_minima_linhas` (-1 se não tem terminais)."""
+        if not self._linhas:
+            return -1
+        return self._tabela['ids'].get(linha, -1)
+
+    def distancia_minima_linhas(self, linhas, lat, lon):
+        """
+        Como `distancia_minima`, com a linha de cada ponto dada em `linhas`
+        (array de `id_linha`). Pontos de linhas sem terminais (-1) ou sem
+        nenhum terminal dentro do raio recebem infinito.
+        """
+        mindist = np.full(len(lat), np.inf)
+        validos = np.flatnonzero((linhas >= 0) & np.isfinite(lat) & np.isfinite(lon))
+        if len(validos) == 0:
+            return mindist
+        tab = self._tabela
+        ix, iy = self._celulas(*self._projetar(lat[validos], lon[validos]))
+        ix = ix - tab['origem'][0]
+        iy = iy - tab['origem'][1]
+        base = linhas[validos] * tab['altura']
+        codigos = tab['codigos']
+
+        pontos, terminais = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                # Células fora da grade não têm terminais
+                dentro = ((ix + dx >= 0) & (ix + dx < tab['largura'])
+                          & (iy + dy >= 0) & (iy + dy < tab['altura']))
+                cod = np.where(dentro, (base + iy + dy) * tab['largura'] + ix + dx, -1)
+                pos = np.searchsorted(codigos, cod)
+                for r in range(tab['max_celula']):
+                    p = pos + r
+                    ok = dentro & (p < len(codigos))
+                    ok[ok] = codigos[p[ok]] == cod[ok]
+                    if not ok.any():
+                        break
+                    pontos.append(validos[ok])
+                    terminais.append(p[ok])
+
+        if pontos:
+            pontos = np.concatenate(pontos)
+            terminais = np.concatenate(terminais)
+            d = great_circle_km(tab['lat'][terminais], tab['lon'][terminais], lat[pontos], lon[pontos])
+            np.minimum.at(mindist, pontos, d)
+        return mindist
+
+    def terminais_proximos(self, linha, lat, lon):
+        """Pares (índice do ponto, [lat, lon] do terminal) a menos de `raio` km."""
+        if linha not in self._linhas:
+            return []
+        dados = self._linhas[linha]
+        pontos, terminais, d = self.candidatos(linha, lat, lon)
+        dentro = d < self.raio
+        return [(p, [dados['lat'][t], dados['lon'][t]])
+                for p, t in zip(pontos[dentro].tolist(), terminais[dentro].tolist())]
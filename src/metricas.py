@@ -0,0 +1,289 @@
+"""
+Métricas de desempenho das etapas da pipeline.
+
+Cada etapa roda dentro de `Metricas(nome, args)`, que mede tempo de parede e
+de CPU (do processo e dos processos filhos), pico de memória (RSS), registros
+processados e bytes lidos e gravados, e grava tudo em JSON (--metricas).
+Trechos internos são medidos com `fase(nome)` e contagens com `contar(nome, n)`;
+os dois só acumulam em dicionários do processo, então também funcionam nos
+processos de um pool (ver `ComFases`, que devolve o acumulado de cada tarefa
+junto com o resultado).
+
+Opcionalmente a etapa roda sob o cProfile (--perfil) ou com um amostrador de
+pilhas (--amostragem, no formato "folded" dos flame graphs).
+
+O progresso (`progresso`/`Progresso`) é impresso com no máximo uma linha por
+intervalo, consultando o relógio só de tempos em tempos.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import json
+import resource
+import sys
+import threading
+import time
+
+# Tempo (s) e chamadas de cada fase, e contadores, acumulados neste processo
+_fases = defaultdict(lambda: [0.0, 0])
+_contadores = Counter()
+
+
+@contextmanager
+def fase(nome):
+    """Soma o tempo do bloco à fase `nome`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        f = _fases[nome]
+        f[0] += time.perf_counter() - inicio
+        f[1] += 1
+
+
+def contar(nome, n=1):
+    _contadores[nome] += n
+
+
+def coletar():
+    """Retira (e zera) as fases e contadores acumulados neste processo."""
+    fases = {nome: tuple(v) for nome, v in _fases.items()}
+    contadores = dict(_contadores)
+    _fases.clear()
+    _contadores.clear()
+    return fases, contadores
+
+
+def incorporar(fases, contadores):
+    """Soma fases e contadores vindos de outro processo aos deste."""
+    for nome, (segundos, chamadas) in fases.items():
+        f = _fases[nome]
+        f[0] += segundos
+        f[1] += chamadas
+    _contadores.update(contadores)
+
+
+class ComFases:
+    """
+    Envolve uma função executada em processos de um pool: retorna
+    (resultado, fases e contadores acumulados na chamada), para o processo
+    principal incorporar com `incorporar`.
+    """
+
+    def __init__(self, funcao):
+        self.funcao = funcao
+
+    def __call__(self, item):
+        resultado = self.funcao(item)
+        return resultado, coletar()
+
+
+def adicionar_argumentos(parser):
+    """Opções comuns de medição das etapas."""
+    parser.add_argument('--metricas', metavar='ARQUIVO', default=None,
+                        help='grava as métricas de desempenho da execução em JSON')
+    parser.add_argument('--perfil', metavar='ARQUIVO', default=None,
+                        help='executa sob o cProfile e grava as estatísticas (pstats)')
+    parser.add_argument('--amostragem', metavar='ARQUIVO', default=None,
+                        help='amostra as pilhas do processo e grava no formato folded (flame graph)')
+
+
+def tamanho(caminho):
+    """Bytes de um arquivo ou de todos os arquivos de uma pasta (0 se não existir)."""
+    caminho = Path(caminho)
+    if caminho.is_file():
+        return caminho.stat().st_size
+    if caminho.is_dir():
+        return sum(p.stat().st_size for p in caminho.rglob('*') if p.is_file())
+    return 0
+
+
+def _rss_mb(quem):
+    if quem == resource.RUSAGE_SELF:
+        # No Linux o ru_maxrss herda o pico do processo pai (sobrevive ao fork e
+        # ao exec); o VmHWM é do espaço de endereçamento atual
+        try:
+            with open('/proc/self/status', 'r') as f:
+                for linha in f:
+                    if linha.startswith('VmHWM:'):
+                        return int(linha.split()[1]) / 2**10
+        except OSError:
+            pass
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    rss = resource.getrusage(quem).ru_maxrss
+    return rss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def _cpu(quem):
+    uso = resource.getrusage(quem)
+    return uso.ru_utime + uso.ru_stime
+
+
+class Amostrador(threading.Thread):
+    """Amostra a pilha da thread principal a cada `intervalo` s e conta as pilhas vistas."""
+
+    def __init__(self, intervalo=0.005):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._alvo = threading.main_thread().ident
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self._alvo)
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(f'{Path(codigo.co_filename).name}:{codigo.co_name}')
+                quadro = quadro.f_back
+            if pilha:
+                self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def parar(self, caminho):
+        self._parar.set()
+        self.join()
+        with open(caminho, 'w') as f:
+            for pilha, n in self.pilhas.most_common():
+                f.write(f'{pilha} {n}\n')
+
+
+class Metricas:
+    """
+    Mede a execução de uma etapa. `args` é o resultado do argparse com as
+    opções de `adicionar_argumentos` (ou None). Use `lidos`/`gravados` para
+    declarar os arquivos de entrada e saída (o tamanho é medido no fim) e
+    `registros` para o total de itens processados.
+    """
+
+    def __init__(self, etapa, args=None):
+        self.etapa = etapa
+        self.arquivo = getattr(args, 'metricas', None)
+        self.perfil = getattr(args, 'perfil', None)
+        self.amostragem = getattr(args, 'amostragem', None)
+        self.registros = None
+        self._lidos = []
+        self._gravados = []
+
+    def lidos(self, *caminhos):
+        self._lidos.extend(caminhos)
+
+    def gravados(self, *caminhos):
+        self._gravados.extend(caminhos)
+
+    def __enter__(self):
+        coletar()
+        self._inicio_data = datetime.now().isoformat(timespec='seconds')
+        self._inicio = time.perf_counter()
+        self._cpu = time.process_time()
+        self._cpu_filhos = _cpu(resource.RUSAGE_CHILDREN)
+        self._perfilador = None
+        self._amostrador = None
+        if self.perfil:
+            import cProfile
+            self._perfilador = cProfile.Profile()
+            self._perfilador.enable()
+        if self.amostragem:
+            self._amostrador = Amostrador()
+            self._amostrador.start()
+        return self
+
+    def __exit__(self, tipo, *_):
+        parede = time.perf_counter() - self._inicio
+        if self._perfilador is not None:
+            self._perfilador.disable()
+            self._perfilador.dump_stats(self.perfil)
+        if self._amostrador is not None:
+            self._amostrador.parar(self.amostragem)
+
+        fases, contadores = coletar()
+        registros = self.registros if self.registros is not None else contadores.get('registros')
+        resultado = {
+            'etapa': self.etapa,
+            'inicio': self._inicio_data,
+            'argumentos': sys.argv[1:],
+            'concluida': tipo is None,
+            'parede_s': round(parede, 4),
+            'cpu_s': round(time.process_time() - self._cpu, 4),
+            'cpu_filhos_s': round(_cpu(resource.RUSAGE_CHILDREN) - self._cpu_filhos, 4),
+            'rss_pico_mb': round(_rss_mb(resource.RUSAGE_SELF), 1),
+            'rss_pico_filhos_mb': round(_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            'registros': registros,
+            'registros_por_s': round(registros / parede, 1) if registros and parede > 0 else None,
+            'bytes_lidos': sum(tamanho(c) for c in self._lidos),
+            'bytes_gravados': sum(tamanho(c) for c in self._gravados),
+            'fases': {nome: {'segundos': round(s, 4), 'chamadas': n} for nome, (s, n) in sorted(fases.items())},
+            'contadores': contadores,
+        }
+        if self.arquivo:
+            Path(self.arquivo).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.arquivo, 'w') as f:
+                json.dump(resultado, f, indent=2)
+
+        vazao = f", {resultado['registros_por_s']:.0f} registros/s" if resultado['registros_por_s'] else ''
+        print(f"[{self.etapa}] {parede:.2f} s (CPU {resultado['cpu_s'] + resultado['cpu_filhos_s']:.2f} s)"
+              f"{vazao}, pico de memória {resultado['rss_pico_mb']:.0f} MB", file=sys.stderr)
+        return False
+
+
+class Progresso:
+    """
+    Progresso de baixo custo: `atualizar` só soma, e o relógio só é consultado
+    quando a contagem passa do próximo ponto de verificação (ajustado pela
+    vazão). A linha é reescrita no máximo a cada `intervalo` s no terminal, ou
+    impressa a cada 10 s quando a saída não é um terminal (ex: log).
+    """
+
+    def __init__(self, desc, total=None, intervalo=None, saida=None):
+        self.desc = desc
+        self.total = total
+        self.saida = saida or sys.stderr
+        self.terminal = self.saida.isatty()
+        self.intervalo = intervalo if intervalo is not None else (0.5 if self.terminal else 10.0)
+        self.n = 0
+        self._inicio = self._ultimo = time.perf_counter()
+        self._proximo = 1
+
+    def atualizar(self, n=1):
+        self.n += n
+        if self.n >= self._proximo:
+            self._verificar()
+
+    def _verificar(self):
+        agora = time.perf_counter()
+        taxa = self.n / max(agora - self._inicio, 1e-9)
+        # próxima verificação em ~1/10 do intervalo, na vazão atual
+        self._proximo = self.n + max(1, int(taxa * self.intervalo / 10))
+        if agora - self._ultimo >= self.intervalo:
+            self._ultimo = agora
+            self._escrever(agora, taxa)
+
+    def _escrever(self, agora, taxa, fim=False):
+        total = f'/{self.total}' if self.total else ''
+        texto = f'{self.desc}: {self.n}{total} ({agora - self._inicio:.0f} s, {taxa:.0f}/s)'
+        if self.terminal:
+            self.saida.write('\r' + texto + ('\n' if fim else ''))
+        else:
+            self.saida.write(texto + '\n')
+        self.saida.flush()
+
+    def fechar(self):
+        agora = time.perf_counter()
+        self._escrever(agora, self.n / max(agora - self._inicio, 1e-9), fim=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.fechar()
+
+
+def progresso(iteravel, desc, total=None):
+    """Percorre `iteravel` reportando o progresso (ver Progresso)."""
+    if total is None and hasattr(iteravel, '__len__'):
+        total = len(iteravel)
+    with Progresso(desc, total) as p:
+        for item in iteravel:
+            yield item
+            p.atualizar()
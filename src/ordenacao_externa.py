@@ -0,0 +1,125 @@
+"""
+Agregação por carro com memória limitada (ordenação externa).
+
+Os registros são acumulados em memória até o limite configurado; ao atingir
+o limite, o buffer é ordenado por (ordem, datahora) e gravado em disco como
+um "run". No final, os runs são intercalados (k-way merge) e cada carro sai
+com seus registros já ordenados por datahora, sem que a semana inteira
+precise caber em memória.
+"""
+from pathlib import Path
+import heapq
+import itertools
+import json
+import shutil
+import tempfile
+
+# Custo aproximado de um registro em memória além do tamanho das strings (bytes)
+CUSTO_REGISTRO = 400
+
+
+def _ler_run(caminho):
+    with open(caminho, 'r') as f:
+        for linha in f:
+            yield json.loads(linha)
+
+
+def _chave(r):
+    # (ordem, datahora, sequência de chegada): mantém a ordem estável da ordenação em memória
+    return r[0], r[1], r[2]
+
+
+class AgregadorExterno:
+    """
+    Acumula registros (ordem, latitude, longitude, linha, datahora) e os devolve
+    agrupados por carro e ordenados por datahora.
+
+    `memoria_max` é o limite aproximado (bytes) do buffer em memória e
+    `max_arquivos` o número máximo de runs abertos ao mesmo tempo no merge.
+    """
+
+    def __init__(self, memoria_max=256 * 2**20, pasta=None, max_arquivos=64):
+        self.memoria_max = memoria_max
+        self.max_arquivos = max_arquivos
+        self._pasta = Path(tempfile.mkdtemp(prefix='sppo_runs_', dir=pasta))
+        self._buffer = []
+        self._bytes = 0
+        self._seq = 0
+        self._runs = []
+
+    def adicionar(self, ordem, latitude, longitude, linha, datahora):
+        self._buffer.append((ordem, datahora, self._seq, latitude, longitude, linha))
+        self._seq += 1
+        self._bytes += CUSTO_REGISTRO + len(ordem) + len(latitude) + len(longitude) + len(linha) + len(datahora)
+        if self._bytes >= self.memoria_max:
+            self._gravar_run()
+
+    def _novo_run(self):
+        return self._pasta / f'run_{len(self._runs):06d}.jsonl'
+
+    def _gravar_run(self):
+        # Ordena o buffer e grava como um novo run em disco
+        if not self._buffer:
+            return
+        self._buffer.sort(key=_chave)
+        caminho = self._novo_run()
+        with open(caminho, 'w') as f:
+            for r in self._buffer:
+                f.write(json.dumps(r))
+                f.write('\n')
+        self._runs.append(caminho)
+        self._buffer = []
+        self._bytes = 0
+
+    def _compactar_runs(self):
+        # Intercala grupos de runs até restarem no máximo `max_arquivos`
+        while len(self._runs) > self.max_arquivos:
+            grupo, self._runs = self._runs[:self.max_arquivos], self._runs[self.max_arquivos:]
+            caminho = self._pasta / f'merge_{grupo[0].stem}_{len(grupo)}.jsonl'
+            with open(caminho, 'w') as f:
+                for r in heapq.merge(*[_ler_run(c) for c in grupo], key=_chave):
+                    f.write(json.dumps(r))
+                    f.write('\n')
+            for c in grupo:
+                c.unlink()
+            self._runs.append(caminho)
+
+    def registros(self):
+        """Todos os registros em ordem de (ordem, datahora), intercalando os runs."""
+        if not self._runs:
+            # Tudo coube em memória: não precisa passar pelo disco
+            self._buffer.sort(key=_chave)
+            yield from self._buffer
+            return
+        self._gravar_run()
+        self._compactar_runs()
+        yield from heapq.merge(*[_ler_run(c) for c in self._runs], key=_chave)
+
+    def carros(self):
+        """
+        Gera (ordem, registros) para cada carro, onde `registros` é um iterador
+        (preguiçoso) de dicts no formato de carros/*.json. Consuma cada
+        iterador antes de avançar para o próximo carro.
+        """
+        for ordem, grupo in itertools.groupby(self.registros(), key=lambda r: r[0]):
+            yield ordem, (_registro_carro(r) for r in grupo)
+
+    def fechar(self):
+        shutil.rmtree(self._pasta, ignore_errors=True)
+        self._buffer = []
+        self._runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def _registro_carro(r):
+    return {
+        'latitude': r[3],
+        'longitude': r[4],
+        'linha': r[5],
+        'datahora': r[1],
+    }
@@ -0,0 +1,174 @@
+"""
+Registro único de nomes de linhas, pontos finais e viações.
+
+Carrega (sob demanda) as equivalências de nomes de linhas, as coordenadas dos
+pontos finais, a tabela de prefixo -> viação e as regras de linhas especiais
+em dicionários e conjuntos, com cache das consultas já resolvidas.
+Usado pelas etapas 03 (nomes e pontos finais) e 04 (viações).
+"""
+from collections import Counter
+from functools import cached_property
+import csv
+import json
+
+# Listas de linhas especiais para regras de exceção
+SOU = frozenset(['379', '383', '389', 'SP389', 'SV391', '394', '395', '731', 'SN731', '737', '741', '743', '745', '746', '753', '754', '756', '757', '764', '765', 'SV777', '790', 'SN790', 'SV790', '791', '794', 'SN794', '812', '926', '936', '841', 'SV853'])
+
+PARANAPUAN = frozenset(['323', '327', '328', '634', '635', 'SP635', '901', 'SV901', '910', '913', '915', '922', 'SV922', '2342', 'SV2342'])
+
+PAVUNENSE = frozenset(['296', '298', 'SN298', '342', 'SR342', '384', 'SV384', 'SR384', '385', '386', 'SR386', '399', 'SR399', '687', '688', '779', 'SN779', '780', '793', 'SP795', '945', '946', '2305', '2399',
+ '254', '265', 'SP265', '277', '292', '311', '349', '456', '457', '627', '650', '665', 'SVA665', 'SVB665', '799', '979'])
+
+
+class RegistroLinhas:
+    """
+    Tabelas de consulta de linhas e viações.
+    Cada arquivo só é lido na primeira consulta que precisar dele.
+    """
+
+    def __init__(self, arq_equivalencias='equivalencias.json',
+                 arq_pontos_finais='terminais_coordenadas.json',
+                 arq_viacoes='viacoes.csv'):
+        self.arq_equivalencias = arq_equivalencias
+        self.arq_pontos_finais = arq_pontos_finais
+        self.arq_viacoes = arq_viacoes
+
+        self._terminais = {}
+        self._viacoes_prefixo = {}
+        self._viacoes_linha = {}
+        self.desconhecidos = Counter()
+
+    @cached_property
+    def equivalencias(self):
+        """Nome -> nome equivalente, nos dois sentidos (vale o primeiro par encontrado)."""
+        with open(self.arq_equivalencias, 'r') as f:
+            pares = json.load(f)
+        mapa = {}
+        for a, b in pares:
+            mapa.setdefault(a, b)
+            mapa.setdefault(b, a)
+        return mapa
+
+    @cached_property
+    def pontos_finais(self):
+        with open(self.arq_pontos_finais, 'r') as f:
+            return json.load(f)
+
+    @cached_property
+    def viacoes(self):
+        """Código do prefixo (ex: '29000') -> nome da viação (vale a primeira linha do CSV)."""
+        with open(self.arq_viacoes, 'r') as f:
+            mapa = {}
+            for v in csv.reader(f):
+                mapa.setdefault(v[0], v[1])
+            return mapa
+
+    # Retorna o nome equivalente de uma linha (ou o próprio nome)
+    def outronome(self, n):
+        return self.equivalencias.get(n, n)
+
+    # Se for linha especial, retorna nome equivalente
+    def verdnome(self, n):
+        if n[:4] == 'LECD':
+            return self.outronome(n)
+        return n
+
+    # Retorna a chave de pontos_finais usada para a linha (ou None se desconhecida)
+    def chave_pontos_finais(self, linha):
+        if linha in self.pontos_finais:
+            return linha
+        if self.outronome(linha) in self.pontos_finais:
+            return self.outronome(linha)
+        return None
+
+    # Retorna os pontos finais conhecidos de uma linha (ou [] se desconhecida)
+    def terminais_da_linha(self, linha):
+        try:
+            return self._terminais[linha]
+        except KeyError:
+            pass
+        chave = self.chave_pontos_finais(linha)
+        pf = self.pontos_finais[chave] if chave is not None else []
+        self._terminais[linha] = pf
+        return pf
+
+    def _resolver_prefixo(self, prefixo):
+        # Retorna (consulta, viação, conhecido)
+        if prefixo[0] == 'E':
+            return prefixo, 'CMTC / Mobi Rio', True
+        if prefixo[0] in 'ABCD' and len(prefixo) == 6:
+            # Lógica para prefixos de consórcios
+            d = int(prefixo[3])
+            if d >= 5:
+                consulta = prefixo[1:3] + '500'
+                consulta2 = prefixo[1:3] + '000'
+            else:
+                consulta = prefixo[1:3] + '000'
+                consulta2 = prefixo[1:3] + '500'
+            # Busca na tabela de viações
+            if consulta in self.viacoes:
+                return consulta, self.viacoes[consulta], True
+            if consulta2 in self.viacoes:
+                return consulta2, self.viacoes[consulta2], True
+            return consulta, f'Empresa Desconhecida ({prefixo})', False
+        return prefixo, f'Empresa Desconhecida ({prefixo})', False
+
+    def _prefixo(self, prefixo):
+        # Consulta (consulta, viação, conhecido) com cache, sem contar desconhecidos
+        if prefixo not in self._viacoes_prefixo:
+            self._viacoes_prefixo[prefixo] = self._resolver_prefixo(prefixo)
+        return self._viacoes_prefixo[prefixo]
+
+    def _viacao(self, linha, prefixo):
+        # Viação do par (linha, prefixo) com cache, aplicando as regras especiais
+        chave = (linha, prefixo)
+        try:
+            return self._viacoes_linha[chave]
+        except KeyError:
+            pass
+        consulta, v, _ = self._prefixo(prefixo)
+        if consulta == '32500':
+            if linha in PARANAPUAN:
+                v = self._prefixo('B10000')[1]
+        elif consulta in ('13000', '30000'):
+            if linha in SOU:
+                v = self._prefixo('B33000')[1]
+        self._viacoes_linha[chave] = v
+        return v
+
+    def _contar(self, prefixo):
+        # Prefixos desconhecidos são contados e relatados uma vez no final
+        if not self._viacoes_prefixo[prefixo][2]:
+            self.desconhecidos[prefixo] += 1
+
+    # Determina viação a partir do prefixo, sem considerar linha
+    def achar_viacao_sem_linha(self, prefixo):
+        consulta, v, _ = self._prefixo(prefixo)
+        self._contar(prefixo)
+        return consulta, v
+
+    # Determina viação considerando linha e prefixo, com regras especiais
+    def achar_viacao(self, linha, prefixo):
+        v = self._viacao(linha, prefixo)
+        self._contar(prefixo)
+        return v
+
+    def achar_viacoes(self, linhas, prefixos):
+        """
+        Resolve em lote a viação de cada par (linha, prefixo).
+        Cada par distinto é resolvido uma única vez.
+        """
+        pares = list(zip(linhas, prefixos))
+        resolvidos = {chave: self._viacao(*chave) for chave in set(pares)}
+        for _, prefixo in pares:
+            self._contar(prefixo)
+        return [resolvidos[chave] for chave in pares]
+
+    def relatar_desconhecidos(self):
+        """Imprime um resumo dos prefixos sem viação conhecida."""
+        if not self.desconhecidos:
+            return
+        print(f'Prefixos desconhecidos: {len(self.desconhecidos)} '
+              f'({sum(self.desconhecidos.values())} consultas)')
+        for prefixo, n in self.desconhecidos.most_common():
+            print(f'  {prefixo}: {n}')
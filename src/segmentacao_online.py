@@ -0,0 +1,357 @@
+"""
+Segmentação online de viagens sobre os snapshots do SPPO à medida que chegam.
+
+Em vez de esperar a semana inteira (etapas 02 a 04), mantém em memória o
+estado de segmentação de cada carro (último registro e viagem aberta) e fecha
+cada viagem assim que chega o registro de parada no ponto final, gravando a
+linha do viagens.csv (com a viação já resolvida) logo após o snapshot que a
+fechou.
+
+O critério é o mesmo da etapa 03: a viagem abre no primeiro registro em
+movimento longe dos pontos finais da linha e fecha no primeiro registro
+seguinte parado junto a um deles (ou de linha sem pontos finais), e a
+primeira viagem de cada carro é descartada. Sobre os mesmos registros, as
+viagens gravadas são as mesmas do processamento em lote antes da filtragem
+pelos intervalos típicos de cada linha, que depende do período inteiro e não
+é aplicada aqui (o relatório ainda remove os outliers). Como na etapa 02, os
+pings repetidos (mesmo carro e datahora) são mantidos; só são ignorados os
+registros anteriores ao último do carro e, no instante do último, as cópias
+(mesma datahora e posição) já vistas em snapshots anteriores, que vêm do mesmo
+arquivo relido ou de snapshots sobrepostos.
+
+Cada snapshot é processado de uma vez com NumPy (velocidades e distâncias aos
+pontos finais de todos os registros); só a máquina de estados de cada
+registro roda em Python. O estado de cada carro é limitado: uma viagem aberta
+com mais de `registros_max` registros é descartada, e o carro só volta a
+abrir viagem depois do ponto final que a teria fechado.
+
+Fontes dos snapshots:
+    --pasta sppo/   snapshots novos ou alterados na pasta (ver snapshots_sppo.py,
+                    ex: gravados pelo coletor); um arquivo alterado é relido e
+                    os registros já vistos são ignorados
+    --url URL       resposta JSON de uma URL consultada a cada --intervalo s
+                    (a API do SPPO ou um servidor local que a imite)
+
+Uso:
+    python src/segmentacao_online.py --pasta sppo/ --saida viagens_online.csv
+    python src/segmentacao_online.py --pasta sppo/ --uma-vez    # processa o que existe e termina
+"""
+from collections import Counter
+from pathlib import Path
+import argparse
+import csv
+import json
+import sys
+import time
+import urllib.request
+import numpy as np
+from distancias import VEL_MAX, VEL_MIN, great_circle_km
+from indice_terminais import IndiceTerminais
+from metricas import Metricas, Progresso, adicionar_argumentos, contar, fase
+from registro_linhas import RegistroLinhas
+from snapshots_sppo import ERROS_LEITURA, abrir_snapshot, listar_snapshots
+from viagens_csv import CABECALHO, linhas_csv
+
+CONSORCIOS = ['A', 'B', 'C', 'D', 'E']
+
+# Distância máxima para considerar chegada em ponto final (em km), como na etapa 03
+DISTPONTO = 0.5
+
+# Registros de uma viagem aberta acima dos quais ela é descartada
+REGISTROS_MAX = 2000
+
+# Intervalo (s) entre consultas à pasta ou à URL
+INTERVALO = 5.0
+
+
+class CarroOnline:
+    """Estado de segmentação de um carro: último registro e viagem aberta."""
+
+    __slots__ = ('lat', 'lon', 't', 'vistos', 'aberta', 'linha', 'primeira_descartada', 'descartando')
+
+    def __init__(self):
+        self.lat = self.lon = None
+        self.t = -1
+        # Quantos registros já foram processados no instante t em cada posição (latitude, longitude)
+        self.vistos = Counter()
+        # Colunas (datahora, latitude, longitude) da viagem aberta, ou None
+        self.aberta = None
+        # Linha do último registro da viagem aberta
+        self.linha = None
+        self.primeira_descartada = False
+        # Viagem longa demais descartada, esperando o ponto final que a fecharia
+        self.descartando = False
+
+
+class SegmentadorOnline:
+    """
+    Segmenta os registros de snapshots sucessivos. `processar` recebe a lista
+    de registros de um snapshot (formato da API) e retorna as linhas do CSV
+    das viagens que ele fechou.
+    """
+
+    def __init__(self, registro, distponto=DISTPONTO, consorcios=CONSORCIOS, registros_max=REGISTROS_MAX):
+        self.registro = registro
+        self.distponto = distponto
+        self.consorcios = set(consorcios)
+        self.registros_max = registros_max
+        self.indice = IndiceTerminais(registro.pontos_finais, distponto)
+        self._ids_linhas = {}
+        self.carros = {}
+        # Registros já vistos (snapshots sobrepostos) ou atrasados
+        self.ignorados = 0
+        # Viagens abertas descartadas por passarem de registros_max
+        self.descartadas = 0
+
+    def _id_linha(self, nome):
+        # Linha do índice de terminais usada para o nome (-1 se não tem pontos finais)
+        try:
+            return self._ids_linhas[nome]
+        except KeyError:
+            chave = self.registro.chave_pontos_finais(nome)
+            i = self._ids_linhas[nome] = -1 if chave is None else self.indice.id_linha(chave)
+            return i
+
+    def _arrays(self, registros):
+        # Colunas dos registros dos consórcios selecionados
+        sel = [r for r in registros if r['ordem'][0] in self.consorcios]
+        n = len(sel)
+        t = np.fromiter((int(r['datahora']) for r in sel), dtype=np.int64, count=n)
+        lat = np.fromiter((float(r['latitude'].replace(',', '.')) for r in sel), dtype=np.float64, count=n)
+        lon = np.fromiter((float(r['longitude'].replace(',', '.')) for r in sel), dtype=np.float64, count=n)
+        prefixos, carro = np.unique(np.asarray([r['ordem'] for r in sel], dtype=str), return_inverse=True)
+        nomes, linha = np.unique(np.asarray([r['linha'] for r in sel], dtype=str), return_inverse=True)
+        return t, lat, lon, carro, linha, prefixos.tolist(), nomes.tolist()
+
+    def _marcar(self, lat, lon, vel, linha, nomes):
+        # Mesmo critério de início e fim de viagem da etapa 03 (marcar_trilha), com
+        # as distâncias de todas as linhas do snapshot numa única consulta ao índice
+        ids = np.array([self._id_linha(n) for n in nomes], dtype=np.int64)[linha]
+        sem_pf = ids < 0
+        mindist = self.indice.distancia_minima_linhas(ids, lat, lon)
+        mindist[sem_pf] = 0.0
+        inicio = (vel > 0.0) & (mindist > self.distponto)
+        fim = ((vel == 0.0) & (mindist < self.distponto)) | sem_pf
+        return inicio, fim
+
+    def processar(self, registros):
+        contar('registros', len(registros))
+        with fase('converter'):
+            t, lat, lon, carro, linha, prefixos, nomes = self._arrays(registros)
+        if len(t) == 0:
+            return []
+
+        with fase('velocidade'):
+            # Registros de cada carro em ordem de datahora (ordenação estável, como na etapa 02)
+            ordem = np.argsort(t, kind='stable')
+            ordem = ordem[np.argsort(carro[ordem], kind='stable')]
+            t, lat, lon, carro, linha = t[ordem], lat[ordem], lon[ordem], carro[ordem], linha[ordem]
+
+            # Último registro já processado de cada carro do snapshot
+            estados = [self.carros.get(p) for p in prefixos]
+            ult_t = np.array([-1 if e is None else e.t for e in estados], dtype=np.int64)
+            ult_lat = np.array([np.nan if e is None or e.lat is None else e.lat for e in estados])
+            ult_lon = np.array([np.nan if e is None or e.lon is None else e.lon for e in estados])
+
+            # Registros atrasados são ignorados. No instante do último registro do carro só
+            # as cópias já vistas (snapshots sobrepostos), pois a etapa 02 mantém os repetidos
+            novos = t >= ult_t[carro]
+            restantes = {}
+            for k in np.flatnonzero(t == ult_t[carro]).tolist():
+                vistos = restantes.setdefault(carro[k], Counter(estados[carro[k]].vistos))
+                posicao = (lat[k].item(), lon[k].item())
+                if vistos[posicao] > 0:
+                    vistos[posicao] -= 1
+                    novos[k] = False
+            self.ignorados += int(np.count_nonzero(~novos & (ult_t[carro] >= 0)))
+            t, lat, lon, carro, linha = t[novos], lat[novos], lon[novos], carro[novos], linha[novos]
+            if len(t) == 0:
+                return []
+
+            # Velocidade em relação ao registro anterior do carro (do snapshot ou do estado)
+            mesmo = np.zeros(len(t), dtype=bool)
+            mesmo[1:] = carro[1:] == carro[:-1]
+            ant_lat = np.where(mesmo, np.r_[np.nan, lat[:-1]], ult_lat[carro])
+            ant_lon = np.where(mesmo, np.r_[np.nan, lon[:-1]], ult_lon[carro])
+            ant_t = np.where(mesmo, np.r_[0, t[:-1]], ult_t[carro])
+            tem_anterior = mesmo | (ult_t[carro] >= 0)
+
+            vel = np.zeros(len(t), dtype=np.float64)
+            dist = great_circle_km(ant_lat, ant_lon, lat, lon)
+            dt = (t - ant_t).astype(np.float64)
+            np.divide(dist * 3600000, dt, out=vel, where=tem_anterior & (dt != 0))
+            vel[(vel < VEL_MIN) | (vel > VEL_MAX)] = 0.0
+
+        with fase('segmentar'):
+            inicio, fim = self._marcar(lat, lon, vel, linha, nomes)
+            fechadas = self._avancar(t, lat, lon, carro, linha, inicio, fim, prefixos, nomes)
+
+        if not fechadas:
+            return []
+        contar('viagens', len(fechadas))
+        with fase('gravar'):
+            offsets = np.zeros(len(fechadas) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(v[2]) for v in fechadas])
+            return linhas_csv(
+                [v[1] for v in fechadas], [v[0] for v in fechadas], offsets,
+                np.concatenate([v[3] for v in fechadas]),
+                np.concatenate([v[4] for v in fechadas]),
+                np.array([x for v in fechadas for x in v[2]], dtype=np.int64),
+                self.registro,
+            )
+
+    def _avancar(self, t, lat, lon, carro, linha, inicio, fim, prefixos, nomes):
+        # Máquina de estados de cada registro; retorna as viagens fechadas como
+        # (prefixo, linha, datahora, latitude, longitude)
+        fechadas = []
+        verdnome = self.registro.verdnome
+        t_l, lat_l, lon_l = t.tolist(), lat.tolist(), lon.tolist()
+        carro_l = carro.tolist()
+        linha_l = np.asarray(nomes, dtype=object)[linha].tolist()
+        inicio_l, fim_l = inicio.tolist(), fim.tolist()
+
+        atual = -1
+        c = None
+        primeiro = 0
+        for k in range(len(t_l)):
+            if carro_l[k] != atual:
+                if c is not None:
+                    self._guardar_ultimo(c, t_l, lat_l, lon_l, primeiro, k)
+                atual = carro_l[k]
+                primeiro = k
+                c = self.carros.get(prefixos[atual])
+                if c is None:
+                    c = self.carros[prefixos[atual]] = CarroOnline()
+
+            if c.aberta is None:
+                if c.descartando:
+                    if fim_l[k]:
+                        c.descartando = False
+                elif inicio_l[k]:
+                    c.aberta = ([t_l[k]], [lat_l[k]], [lon_l[k]])
+                    c.linha = linha_l[k]
+            elif fim_l[k]:
+                # A viagem termina no registro anterior ao que chegou no ponto final
+                if c.primeira_descartada:
+                    ts, lats, lons = c.aberta
+                    fechadas.append((prefixos[atual], verdnome(c.linha), ts, np.array(lats), np.array(lons)))
+                c.primeira_descartada = True
+                c.aberta = None
+            elif len(c.aberta[0]) >= self.registros_max:
+                # Viagem longa demais: descarta e espera o ponto final que a fecharia
+                self.descartadas += 1
+                c.primeira_descartada = True
+                c.aberta = None
+                c.descartando = True
+            else:
+                ts, lats, lons = c.aberta
+                ts.append(t_l[k])
+                lats.append(lat_l[k])
+                lons.append(lon_l[k])
+                c.linha = linha_l[k]
+        if c is not None:
+            self._guardar_ultimo(c, t_l, lat_l, lon_l, primeiro, len(t_l))
+        return fechadas
+
+    @staticmethod
+    def _guardar_ultimo(c, t_l, lat_l, lon_l, a, b):
+        # Último registro do carro (registros a:b do snapshot) e as posições já
+        # vistas no mesmo instante, somadas às anteriores se o instante não mudou
+        t = t_l[b - 1]
+        vistos = c.vistos if t == c.t else Counter()
+        k = b - 1
+        while k >= a and t_l[k] == t:
+            vistos[lat_l[k], lon_l[k]] += 1
+            k -= 1
+        c.lat, c.lon, c.t, c.vistos = lat_l[b - 1], lon_l[b - 1], t, vistos
+
+    def viagens_abertas(self):
+        return sum(1 for c in self.carros.values() if c.aberta is not None)
+
+
+# Snapshots novos ou alterados na pasta, em ordem de dia e hora.
+# Arquivos ainda incompletos (JSON inválido) são relidos na consulta seguinte.
+def snapshots_pasta(pasta, intervalo=INTERVALO, uma_vez=False):
+    vistos = {}
+    while True:
+        for _, arquivo in sorted(listar_snapshots(pasta).items()):
+            st = arquivo.stat()
+            marca = (st.st_size, st.st_mtime_ns)
+            if vistos.get(arquivo.name) == marca:
+                continue
+            with fase('ler'):
+                try:
+                    with abrir_snapshot(arquivo) as f:
+                        registros = json.load(f)
+                except (json.JSONDecodeError, *ERROS_LEITURA):
+                    continue
+            vistos[arquivo.name] = marca
+            yield registros
+        if uma_vez:
+            return
+        time.sleep(intervalo)
+
+# Snapshots de uma URL com a resposta no formato da API, consultada a cada `intervalo` s
+def snapshots_url(url, intervalo=INTERVALO, tempo_limite=30):
+    while True:
+        inicio = time.monotonic()
+        try:
+            with fase('ler'), urllib.request.urlopen(url, timeout=tempo_limite) as resposta:
+                registros = json.load(resposta)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f'Falha ao consultar {url}: {e}', file=sys.stderr)
+        else:
+            yield registros
+        time.sleep(max(0.0, intervalo - (time.monotonic() - inicio)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Segmenta viagens online sobre os snapshots do SPPO.')
+    fonte = parser.add_mutually_exclusive_group(required=True)
+    fonte.add_argument('--pasta', default=None, help='pasta com os snapshots .json (ex: sppo/)')
+    fonte.add_argument('--url', default=None, help='URL consultada a cada --intervalo s')
+    parser.add_argument('--saida', default='viagens_online.csv',
+                        help='CSV onde as viagens fechadas são acrescentadas (padrão: viagens_online.csv)')
+    parser.add_argument('--intervalo', type=float, default=INTERVALO,
+                        help=f'segundos entre consultas à pasta ou à URL (padrão: {INTERVALO})')
+    parser.add_argument('--uma-vez', action='store_true',
+                        help='processa os arquivos que já estão na pasta e termina')
+    parser.add_argument('-c', '--consorcios', nargs='+', default=CONSORCIOS, choices=CONSORCIOS,
+                        help='consórcios processados (padrão: todos)')
+    parser.add_argument('--registros-max', type=int, default=REGISTROS_MAX,
+                        help=f'registros de uma viagem aberta acima dos quais ela é descartada (padrão: {REGISTROS_MAX})')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    registro = RegistroLinhas(arq_equivalencias='equivalencias.json',
+                              arq_pontos_finais='terminais_coordenadas.json',
+                              arq_viacoes='viacoes.csv')
+    segmentador = SegmentadorOnline(registro, consorcios=args.consorcios, registros_max=args.registros_max)
+    if args.pasta:
+        snapshots = snapshots_pasta(args.pasta, args.intervalo, args.uma_vez)
+    else:
+        snapshots = snapshots_url(args.url, args.intervalo)
+
+    novo = not Path(args.saida).exists()
+    with Metricas('online', args) as metricas, open(args.saida, 'a', newline='') as f:
+        metricas.lidos(*([args.pasta] if args.pasta else []))
+        metricas.gravados(args.saida)
+        writer = csv.writer(f)
+        if novo:
+            writer.writerow(CABECALHO)
+        try:
+            with Progresso('Registros') as barra:
+                for registros in snapshots:
+                    linhas = segmentador.processar(registros)
+                    writer.writerows(linhas)
+                    # Cada viagem fica visível no CSV logo após o snapshot que a fechou
+                    f.flush()
+                    barra.atualizar(len(registros))
+        except KeyboardInterrupt:
+            pass
+        print(f'{segmentador.viagens_abertas()} viagens ainda abertas, {segmentador.ignorados} registros '
+              f'repetidos ou atrasados ignorados, {segmentador.descartadas} viagens longas descartadas',
+              file=sys.stderr)
+        registro.relatar_desconhecidos()
+
+if __name__ == "__main__":
+    main()
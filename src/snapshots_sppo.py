@@ -0,0 +1,183 @@
+"""
+Nomes e leitura dos snapshots horários do SPPO (pasta sppo/).
+
+Cada arquivo guarda os registros de uma hora, no formato da API (lista JSON
+de objetos), com o dia e a hora locais (horário de Brasília) no nome:
+
+    registros_AAAA-MM-DD-HH.json       sem compressão
+    registros_AAAA-MM-DD-HH.json.gz    gzip
+    registros_AAAA-MM-DD-HH.json.xz    xz (lzma)
+    registros_AAAA-MM-DD-HH.json.zst   zstd (requer o pacote zstandard)
+
+O coletor grava os arquivos com gzip (ou outra compressão, com --compressao);
+a etapa 02, a verificação dos dados e a segmentação online leem qualquer um
+dos formatos, descomprimindo em streaming. tools/recomprimir_sppo.py converte
+uma pasta inteira de um formato para outro.
+
+A verificação (tools/verificar_dados_sppo.py) grava na pasta um manifesto,
+manifesto.json, com a contagem de registros e a situação de cada hora:
+
+    {"versao": 1, "criterios": {...}, "horas": {"AAAA-MM-DD-HH": {
+        "arquivo", "tamanho", "mtime_ns",        identificam o arquivo verificado
+        "registros", "carros", "duplicados", "coordenadas_invalidas",
+        "fora_da_hora", "maior_lacuna_s", "erro",
+        "situacao": "ok" | "suspeita" | "vazia" | "corrompida",
+        "motivos": [...]}}}
+
+Uma entrada só vale enquanto o arquivo tiver o mesmo tamanho e data de
+modificação; a etapa 02 usa o manifesto para pular as horas ruins sem ler de novo
+os arquivos.
+"""
+from datetime import date, timedelta, timezone
+from pathlib import Path
+import gzip
+import json
+import lzma
+import os
+import re
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Fuso dos nomes dos arquivos e das consultas à API (horário de Brasília, sem horário de verão)
+FUSO = timezone(timedelta(hours=-3))
+
+# Extensão de cada compressão (None = sem compressão), na ordem de preferência
+# quando a mesma hora existe em mais de um formato (vale a última)
+EXTENSOES = {None: '.json', 'gzip': '.json.gz', 'xz': '.json.xz', 'zstd': '.json.zst'}
+
+# Nível padrão de cada compressão. O 9 do gzip custa várias vezes mais CPU para
+# arquivos só um pouco menores; o xz no nível 6 já é lento para gravar
+NIVEIS = {'gzip': 6, 'xz': 6, 'zstd': 10}
+
+# Erros de leitura de um snapshot truncado ou corrompido (além dos erros do JSON)
+ERROS_LEITURA = (OSError, EOFError, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard else ())
+
+# Nome do manifesto gravado pela verificação dentro da pasta dos snapshots
+MANIFESTO = 'manifesto.json'
+
+_NOME = re.compile(r'registros_(\d{4})-(\d{2})-(\d{2})-(\d{2})\.json(\.gz|\.xz|\.zst)?$')
+
+
+def nome_snapshot(dia, hora, compressao='gzip'):
+    """Nome do arquivo da hora `hora` do dia `dia` (date)."""
+    return f'registros_{dia.isoformat()}-{hora:02d}{EXTENSOES[compressao]}'
+
+
+def data_hora(caminho):
+    """(dia, hora) de um arquivo de snapshot, ou None se o nome não segue o padrão."""
+    m = _NOME.search(Path(caminho).name)
+    if m is None:
+        return None
+    return date(int(m[1]), int(m[2]), int(m[3])), int(m[4])
+
+
+def listar_snapshots(pasta):
+    """
+    Dicionário (dia, hora) -> caminho dos snapshots da pasta. Se a mesma hora
+    existe em mais de um formato, vale o último de EXTENSOES (comprimido).
+    """
+    snapshots = {}
+    pasta = Path(pasta)
+    if not pasta.is_dir():
+        return snapshots
+    preferencia = list(EXTENSOES)
+    for caminho in sorted(pasta.iterdir(), key=lambda c: (c.name.split('.')[0], preferencia.index(compressao(c)))):
+        chave = data_hora(caminho)
+        if chave is not None:
+            snapshots[chave] = caminho
+    return snapshots
+
+
+def compressao(caminho):
+    """Compressão de um snapshot pela extensão (None = sem compressão)."""
+    nome = str(caminho)
+    for c, extensao in EXTENSOES.items():
+        if c is not None and nome.endswith(extensao):
+            return c
+    return None
+
+
+def disponivel(compressao):
+    """Se a compressão pode ser lida e gravada neste ambiente (zstd depende de um pacote opcional)."""
+    return compressao != 'zstd' or zstandard is not None
+
+
+def _zstandard():
+    if zstandard is None:
+        raise RuntimeError('snapshots .json.zst requerem o pacote zstandard (pip install zstandard)')
+    return zstandard
+
+
+def abrir_snapshot(caminho):
+    """Abre o snapshot para leitura em binário, descomprimindo em streaming se preciso."""
+    c = compressao(caminho)
+    if c == 'gzip':
+        return gzip.open(caminho, 'rb')
+    if c == 'xz':
+        return lzma.open(caminho, 'rb')
+    if c == 'zstd':
+        return _zstandard().open(caminho, 'rb')
+    return open(caminho, 'rb')
+
+
+def comprimir(dados, compressao='gzip', nivel=None):
+    """Bytes `dados` comprimidos no formato dado (o mesmo de gravar_snapshot)."""
+    nivel = NIVEIS.get(compressao) if nivel is None else nivel
+    if compressao == 'gzip':
+        # mtime=0: o mesmo conteúdo gera sempre o mesmo arquivo
+        return gzip.compress(dados, compresslevel=nivel, mtime=0)
+    if compressao == 'xz':
+        return lzma.compress(dados, preset=nivel)
+    if compressao == 'zstd':
+        return _zstandard().ZstdCompressor(level=nivel).compress(dados)
+    return dados
+
+
+def gravar_snapshot(caminho, dados, compressao='gzip', nivel=None):
+    """
+    Grava os bytes `dados` (JSON) no snapshot. O arquivo aparece completo ou
+    não aparece: é gravado num temporário e renomeado no fim.
+    """
+    caminho = Path(caminho)
+    temporario = caminho.with_name(caminho.name + '.tmp')
+    with open(temporario, 'wb') as f:
+        f.write(comprimir(dados, compressao, nivel))
+    os.replace(temporario, caminho)
+
+
+def chave_hora(dia, hora):
+    """Chave da hora no manifesto (AAAA-MM-DD-HH)."""
+    return f'{dia.isoformat()}-{hora:02d}'
+
+
+def ler_manifesto(caminho):
+    """Manifesto gravado pela verificação (dicionário vazio se não existir)."""
+    caminho = Path(caminho)
+    if caminho.is_dir():
+        caminho = caminho / MANIFESTO
+    if not caminho.exists():
+        return {'versao': 1, 'horas': {}}
+    with open(caminho, 'r') as f:
+        return json.load(f)
+
+
+def gravar_manifesto(pasta, manifesto):
+    """Grava o manifesto na pasta (num temporário renomeado no fim, como os snapshots)."""
+    destino = Path(pasta) / MANIFESTO
+    temporario = destino.with_name(destino.name + '.tmp')
+    with open(temporario, 'w') as f:
+        json.dump(manifesto, f, indent=1)
+    os.replace(temporario, destino)
+
+
+def entrada_atual(entrada, caminho):
+    """Se a entrada do manifesto ainda descreve o arquivo (mesmo nome, tamanho e data)."""
+    try:
+        st = Path(caminho).stat()
+    except OSError:
+        return False
+    return (entrada.get('arquivo') == Path(caminho).name and entrada.get('tamanho') == st.st_size
+            and entrada.get('mtime_ns') == st.st_mtime_ns)
@@ -0,0 +1,179 @@
+"""
+Armazenamento colunar das trilhas dos carros em um único arquivo.
+
+Substitui a pasta carros/ (um JSON por carro, com tudo em texto) por um
+arquivo binário com as colunas datahora (int64), latitude/longitude (float64)
+e linha (int32, índice na tabela de nomes), mais um índice de offsets por
+carro. O arquivo é aberto com np.memmap, então ler um carro devolve fatias
+dos arrays sem cópia.
+
+Formato:
+    MAGICO (8 bytes) | tamanho do cabeçalho (uint64) | cabeçalho JSON |
+    colunas, cada uma alinhada em ALINHAMENTO bytes
+"""
+from pathlib import Path
+import json
+import shutil
+import struct
+import tempfile
+import numpy as np
+
+MAGICO = b'TRILHAS1'
+ALINHAMENTO = 64
+
+COLUNAS = {
+    'datahora': np.int64,
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'linha': np.int32,
+}
+
+
+def registros_para_colunas(registros, linhas_ids):
+    """
+    Converte registros no formato de carros/*.json (strings, vírgula decimal)
+    em arrays. `linhas_ids` é o dicionário nome -> id, estendido se preciso.
+    """
+    registros = list(registros)
+    n = len(registros)
+    datahora = np.fromiter((int(r['datahora']) for r in registros), dtype=np.int64, count=n)
+    latitude = np.fromiter((float(r['latitude'].replace(',', '.')) for r in registros), dtype=np.float64, count=n)
+    longitude = np.fromiter((float(r['longitude'].replace(',', '.')) for r in registros), dtype=np.float64, count=n)
+    linha = np.fromiter((linhas_ids.setdefault(r['linha'], len(linhas_ids)) for r in registros), dtype=np.int32, count=n)
+    return {'datahora': datahora, 'latitude': latitude, 'longitude': longitude, 'linha': linha}
+
+
+class EscritorTrilhas:
+    """
+    Grava trilhas carro a carro. Cada coluna vai para um arquivo temporário
+    e o arquivo final é montado em `fechar()`, sem guardar tudo em memória.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = Path(caminho)
+        self._pasta = Path(tempfile.mkdtemp(prefix='trilhas_', dir=self.caminho.parent))
+        self._colunas = {c: open(self._pasta / c, 'wb') for c in COLUNAS}
+        self.carros = []
+        self.offsets = [0]
+        self.linhas_ids = {}
+
+    def adicionar(self, prefixo, registros):
+        """Adiciona um carro a partir dos registros no formato de carros/*.json."""
+        self.adicionar_colunas(prefixo, registros_para_colunas(registros, self.linhas_ids))
+
+    def adicionar_colunas(self, prefixo, colunas):
+        """Adiciona um carro já em arrays (linha com ids de `linhas_ids`)."""
+        n = len(colunas['datahora'])
+        for c, dtype in COLUNAS.items():
+            self._colunas[c].write(np.ascontiguousarray(colunas[c], dtype=dtype).tobytes())
+        self.carros.append(prefixo)
+        self.offsets.append(self.offsets[-1] + n)
+
+    def fechar(self):
+        for f in self._colunas.values():
+            f.close()
+
+        total = self.offsets[-1]
+        linhas = [None] * len(self.linhas_ids)
+        for nome, i in self.linhas_ids.items():
+            linhas[i] = nome
+
+        offsets = np.asarray(self.offsets, dtype=np.int64)
+        blocos = [('offsets', offsets.dtype.str, len(offsets), None)]
+        blocos += [(c, np.dtype(d).str, total, self._pasta / c) for c, d in COLUNAS.items()]
+
+        # Calcula a posição de cada coluna (alinhada) depois do cabeçalho.
+        # O tamanho do próprio cabeçalho desloca as colunas, então repete até estabilizar.
+        inicio = 0
+        while True:
+            pos = inicio
+            posicoes = {}
+            for nome, dtype, n, _ in blocos:
+                pos = -(-pos // ALINHAMENTO) * ALINHAMENTO
+                posicoes[nome] = [dtype, pos, n]
+                pos += n * np.dtype(dtype).itemsize
+            cabecalho = json.dumps({
+                'registros': total,
+                'carros': self.carros,
+                'linhas': linhas,
+                'colunas': posicoes,
+            }, ensure_ascii=False).encode('utf-8')
+            fim_cabecalho = len(MAGICO) + 8 + len(cabecalho)
+            if fim_cabecalho <= inicio:
+                break
+            inicio = fim_cabecalho
+
+        with open(self.caminho, 'wb') as f:
+            f.write(MAGICO)
+            f.write(struct.pack('<Q', len(cabecalho)))
+            f.write(cabecalho)
+            for nome, dtype, n, origem in blocos:
+                f.write(b'\0' * (posicoes[nome][1] - f.tell()))
+                if origem is None:
+                    f.write(offsets.tobytes())
+                else:
+                    with open(origem, 'rb') as src:
+                        shutil.copyfileobj(src, f)
+
+        shutil.rmtree(self._pasta, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.fechar()
+        else:
+            for f in self._colunas.values():
+                f.close()
+            shutil.rmtree(self._pasta, ignore_errors=True)
+
+
+class Trilhas:
+    """Leitura (memory-mapped) de um arquivo de trilhas."""
+
+    def __init__(self, caminho):
+        self.caminho = Path(caminho)
+        with open(self.caminho, 'rb') as f:
+            if f.read(len(MAGICO)) != MAGICO:
+                raise ValueError(f'{self.caminho} não é um arquivo de trilhas')
+            tamanho, = struct.unpack('<Q', f.read(8))
+            cabecalho = json.loads(f.read(tamanho).decode('utf-8'))
+
+        self.carros = cabecalho['carros']
+        self.linhas = cabecalho['linhas']
+        self._posicao = {p: k for k, p in enumerate(self.carros)}
+
+        self._colunas = {}
+        for nome, (dtype, pos, n) in cabecalho['colunas'].items():
+            if n == 0:
+                self._colunas[nome] = np.zeros(0, dtype=dtype)
+            else:
+                self._colunas[nome] = np.memmap(self.caminho, dtype=dtype, mode='r', offset=pos, shape=(n,))
+        self.offsets = np.asarray(self._colunas.pop('offsets'))
+
+    def __len__(self):
+        return len(self.carros)
+
+    def __contains__(self, prefixo):
+        return prefixo in self._posicao
+
+    def carro(self, prefixo):
+        """
+        Colunas de um carro como fatias (sem cópia) dos arrays mapeados:
+        dict com 'datahora', 'latitude', 'longitude' e 'linha' (ids em self.linhas).
+        """
+        k = self._posicao[prefixo]
+        a, b = self.offsets[k], self.offsets[k + 1]
+        return {c: v[a:b] for c, v in self._colunas.items()}
+
+    def registros(self, prefixo):
+        """Registros de um carro no formato de carros/*.json (com vírgula decimal)."""
+        c = self.carro(prefixo)
+        return [{
+            'latitude': repr(lat).replace('.', ','),
+            'longitude': repr(lon).replace('.', ','),
+            'linha': self.linhas[linha],
+            'datahora': str(t),
+        } for t, lat, lon, linha in zip(c['datahora'].tolist(), c['latitude'].tolist(),
+                                        c['longitude'].tolist(), c['linha'].tolist())]
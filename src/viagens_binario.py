@@ -0,0 +1,174 @@
+"""
+Formato binário em lotes para as viagens processadas (etapa 03 -> etapa 04).
+
+Substitui o viagens_processadas.json: em vez de um dict por registro, cada
+lote guarda uma tabela de viagens (linha, prefixo, offsets) e uma tabela de
+registros em colunas (datahora int64, latitude/longitude/vel float64).
+
+Formato:
+    MAGICO (8 bytes), seguido de lotes, cada um com
+    tamanho do lote (uint64) | tamanho do cabeçalho (uint32) | cabeçalho JSON |
+    preenchimento até múltiplo de 8 | offsets | datahora | latitude | longitude | vel
+"""
+from collections import namedtuple
+import json
+import struct
+import numpy as np
+
+MAGICO = b'VIAGENS1'
+
+# Viagens de um lote lido do arquivo; offsets[k]:offsets[k + 1] delimita a viagem k
+LoteArquivo = namedtuple('LoteArquivo', [
+    'linhas', 'prefixos', 'offsets', 'datahora', 'latitude', 'longitude', 'vel',
+])
+
+_COLUNAS = [('datahora', '<i8'), ('latitude', '<f8'), ('longitude', '<f8'), ('vel', '<f8')]
+
+
+def selecionar(lote, indices):
+    """
+    Subconjunto das viagens `indices` de um LoteViagens (ou de um LoteArquivo),
+    como (linhas, prefixos, offsets, colunas).
+    """
+    indices = list(indices)
+    offsets = lote.offsets
+    if isinstance(lote, LoteArquivo):
+        prefixos = [lote.prefixos[k] for k in indices]
+    else:
+        prefixos = [lote.prefixo] * len(indices)
+    tamanhos = [int(offsets[k + 1] - offsets[k]) for k in indices]
+    idx = np.concatenate([np.arange(offsets[k], offsets[k + 1]) for k in indices]) if indices else np.zeros(0, dtype=np.int64)
+    return (
+        [lote.linhas[k] for k in indices],
+        prefixos,
+        tamanhos,
+        {c: getattr(lote, c)[idx] for c, _ in _COLUNAS},
+    )
+
+
+class EscritorViagens:
+    """
+    Grava viagens em lotes. As viagens adicionadas ficam em memória até
+    somarem `viagens_por_lote`, quando o lote é gravado no arquivo.
+    """
+
+    def __init__(self, caminho, viagens_por_lote=5000):
+        self.caminho = caminho
+        self.viagens_por_lote = viagens_por_lote
+        self._f = open(caminho, 'wb')
+        self._f.write(MAGICO)
+        self._pendentes = []
+        self._n_pendentes = 0
+        self.viagens = 0
+
+    def adicionar(self, lote, indices=None):
+        """Adiciona as viagens `indices` (padrão: todas) de um LoteViagens ou LoteArquivo."""
+        if indices is None:
+            indices = range(len(lote.linhas))
+        parte = selecionar(lote, indices)
+        if not parte[0]:
+            return
+        self._pendentes.append(parte)
+        self._n_pendentes += len(parte[0])
+        if self._n_pendentes >= self.viagens_por_lote:
+            self._gravar_lote()
+
+    def _gravar_lote(self):
+        if not self._pendentes:
+            return
+        linhas = [l for p in self._pendentes for l in p[0]]
+        prefixos = [x for p in self._pendentes for x in p[1]]
+        offsets = np.zeros(len(linhas) + 1, dtype='<i8')
+        offsets[1:] = np.cumsum([t for p in self._pendentes for t in p[2]])
+        colunas = [np.concatenate([p[3][c] for p in self._pendentes]).astype(d, copy=False) for c, d in _COLUNAS]
+
+        cabecalho = json.dumps({
+            'viagens': len(linhas),
+            'registros': int(offsets[-1]),
+            'linhas': linhas,
+            'prefixos': prefixos,
+        }, ensure_ascii=False).encode('utf-8')
+        # Alinha as colunas em 8 bytes dentro do lote
+        cabecalho += b' ' * (-(12 + len(cabecalho)) % 8)
+
+        corpo = [offsets.tobytes()] + [c.tobytes() for c in colunas]
+        tamanho = 4 + len(cabecalho) + sum(len(b) for b in corpo)
+        self._f.write(struct.pack('<Q', tamanho))
+        self._f.write(struct.pack('<I', len(cabecalho)))
+        self._f.write(cabecalho)
+        for b in corpo:
+            self._f.write(b)
+
+        self.viagens += len(linhas)
+        self._pendentes = []
+        self._n_pendentes = 0
+
+    def fechar(self):
+        if self._f is not None:
+            self._gravar_lote()
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def ler_lotes(caminho):
+    """Lê o arquivo lote a lote, gerando LoteArquivo (arrays sobre o buffer do lote)."""
+    with open(caminho, 'rb') as f:
+        if f.read(len(MAGICO)) != MAGICO:
+            raise ValueError(f'{caminho} não é um arquivo de viagens processadas')
+        while True:
+            prefixo = f.read(8)
+            if not prefixo:
+                break
+            tamanho, = struct.unpack('<Q', prefixo)
+            dados = f.read(tamanho)
+            if len(dados) != tamanho:
+                raise ValueError(f'{caminho}: lote truncado')
+
+            n_cab, = struct.unpack_from('<I', dados)
+            cabecalho = json.loads(dados[4:4 + n_cab].decode('utf-8'))
+            pos = 4 + n_cab
+            n, m = cabecalho['viagens'], cabecalho['registros']
+
+            offsets = np.frombuffer(dados, dtype='<i8', count=n + 1, offset=pos)
+            pos += 8 * (n + 1)
+            colunas = {}
+            for c, d in _COLUNAS:
+                colunas[c] = np.frombuffer(dados, dtype=d, count=m, offset=pos)
+                pos += 8 * m
+
+            yield LoteArquivo(cabecalho['linhas'], cabecalho['prefixos'], offsets, **colunas)
+
+
+def exportar_json(caminho, destino):
+    """Exporta o arquivo binário para o formato de viagens_processadas.json."""
+    viagens = []
+    for lote in ler_lotes(caminho):
+        t, lat, lon, vel = (lote.datahora.tolist(), lote.latitude.tolist(),
+                            lote.longitude.tolist(), lote.vel.tolist())
+        offsets = lote.offsets.tolist()
+        for k in range(len(lote.linhas)):
+            viagens.append((lote.linhas[k], lote.prefixos[k], [{
+                'datahora': t[j],
+                'latitude': lat[j],
+                'longitude': lon[j],
+                'vel': vel[j],
+            } for j in range(offsets[k], offsets[k + 1])]))
+    with open(destino, 'w') as f:
+        json.dump(viagens, f)
+
+
+# Uso: python viagens_binario.py viagens_processadas.bin viagens_processadas.json
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Exporta viagens processadas do formato binário para JSON.')
+    parser.add_argument('entrada', nargs='?', default='viagens_processadas.bin')
+    parser.add_argument('saida', nargs='?', default='viagens_processadas.json')
+    args = parser.parse_args()
+    exportar_json(args.entrada, args.saida)
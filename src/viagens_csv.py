@@ -0,0 +1,59 @@
+"""
+Conversão de viagens segmentadas nas linhas do viagens.csv.
+
+Usada pela etapa 04 (sobre o arquivo de viagens processadas) e pela
+segmentação online (sobre as viagens fechadas de cada snapshot), para que as
+duas produzam exatamente as mesmas linhas.
+"""
+import numpy as np
+from distancias import great_circle_km
+from metricas import fase
+
+CABECALHO = ['viacao', 'linha', 'carro', 'kilometragem', 'duracao', 'velocidade media']
+
+# Viagens com menos registros que isso são ignoradas
+min_registros = 20
+
+# Passo (em registros) entre os pontos usados para somar a quilometragem
+ii = 5
+
+# Converte um lote de viagens (registros concatenados em arrays, offsets[k]:offsets[k + 1]
+# delimita a viagem k) nas linhas do CSV; `registro` (RegistroLinhas) resolve as viações
+def linhas_csv(linhas, prefixos, offsets, lat, lon, datahora, registro):
+    tamanhos = np.diff(offsets)
+
+    # Ignora viagens muito curtas
+    validas = np.flatnonzero(tamanhos >= min_registros)
+    if len(validas) == 0:
+        return []
+    ini = offsets[validas]
+    n = tamanhos[validas]
+
+    # Índices dos trechos i -> i + ii de cada viagem (i = 0, ii, 2*ii, ... < n - ii)
+    n_trechos = (n - ii + ii - 1) // ii
+    viagem_do_trecho = np.repeat(np.arange(len(validas)), n_trechos)
+    inicio_trechos = np.zeros(len(validas) + 1, dtype=np.int64)
+    inicio_trechos[1:] = np.cumsum(n_trechos)
+    passo = np.arange(inicio_trechos[-1]) - inicio_trechos[viagem_do_trecho]
+    i = ini[viagem_do_trecho] + passo * ii
+
+    with fase('distancia'):
+        # Quilometragem de todos os trechos do lote de uma vez
+        d = great_circle_km(lat[i + ii], lon[i + ii], lat[i], lon[i]).tolist()
+
+        # Soma em ordem, trecho a trecho, como na soma original
+        limites = inicio_trechos.tolist()
+        kil = np.array([sum(d[limites[k]:limites[k + 1]], 0) for k in range(len(validas))], dtype=np.float64)
+
+    tempotot = datahora[ini + n - 1] - datahora[ini]
+    velmed = kil * 3600000 / tempotot
+
+    # Determina a viação a partir da linha e prefixo
+    linhas_v = [linhas[k] for k in validas.tolist()]
+    prefixos_v = [prefixos[k] for k in validas.tolist()]
+    with fase('viacoes'):
+        viacoes = registro.achar_viacoes(linhas_v, prefixos_v)
+
+    return [[viacao, linha, prefixo, round(k), round(t / 1000), round(v)]
+            for viacao, linha, prefixo, k, t, v in zip(viacoes, linhas_v, prefixos_v, kil.tolist(),
+                                                        tempotot.tolist(), velmed.tolist())]
@@ -0,0 +1,22 @@
+from pathlib import Path
+import importlib.util
+import sys
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Os testes importam os módulos da pipeline como as etapas fazem, a partir de src/
+sys.path.insert(0, str(RAIZ / 'src'))
+
+
+@pytest.fixture(scope='session')
+def importar_script():
+    """Importa um script pelo caminho relativo à raiz (ex: src/03_processar_viagens_carro.py)."""
+    def importar(caminho):
+        spec = importlib.util.spec_from_file_location(Path(caminho).stem, RAIZ / caminho)
+        modulo = importlib.util.module_from_spec(spec)
+        # Registrado para que as funções do script possam ir para os processos de um pool
+        sys.modules[spec.name] = modulo
+        spec.loader.exec_module(modulo)
+        return modulo
+    return importar
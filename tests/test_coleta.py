@@ -0,0 +1,95 @@
+"""
+Coleta de ponta a ponta (src/00_coletar_sppo.py) contra o servidor de teste
+(tools/servidor_sppo_stub.py), com falhas 503/429 injetadas.
+"""
+from argparse import Namespace
+from datetime import date, datetime
+import asyncio
+import json
+import threading
+import pytest
+
+from snapshots_sppo import FUSO, abrir_snapshot, gravar_snapshot, listar_snapshots, nome_snapshot
+
+DIA = date(2025, 11, 1)
+HORAS = [6, 7]
+
+
+def registros_da_hora(hora):
+    """Pings a cada 30 s de alguns carros durante a hora (no formato da API)."""
+    inicio = int(datetime(DIA.year, DIA.month, DIA.day, hora, tzinfo=FUSO).timestamp() * 1000)
+    return [{'ordem': f'A{c:05d}', 'latitude': f'-22,{900000 + 10 * s + c}', 'longitude': f'-43,{200000 + s}',
+             'datahora': str(inicio + s * 30_000 + c * 1_000), 'velocidade': '20', 'linha': str(100 + c)}
+            for c in range(5) for s in range(120)]
+
+
+@pytest.fixture
+def servidor(tmp_path, importar_script):
+    """Servidor de teste servindo os snapshots gravados de HORAS, com 30% das requisições falhando."""
+    stub = importar_script('tools/servidor_sppo_stub.py')
+    gravados = tmp_path / 'gravados'
+    gravados.mkdir()
+    for hora in HORAS:
+        gravar_snapshot(gravados / nome_snapshot(DIA, hora), json.dumps(registros_da_hora(hora)).encode())
+    srv = stub.criar_servidor(gravados, 0, falhas=0.3, semente=3)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def coletor(importar_script, monkeypatch):
+    modulo = importar_script('src/00_coletar_sppo.py')
+    # Esperas curtas entre as tentativas (inclusive as pedidas pelo Retry-After)
+    monkeypatch.setattr(modulo, 'ESPERA_BASE', 0.01)
+    monkeypatch.setattr(modulo, 'ESPERA_MAX', 0.02)
+    return modulo
+
+
+def argumentos(servidor, pasta):
+    return Namespace(url=f'http://127.0.0.1:{servidor.server_address[1]}/gps/sppo', pasta=str(pasta),
+                     inicio=DIA, fim=DIA, continuo=False, janela=15, concorrencia=4, tentativas=20,
+                     tempo_limite=10.0, atraso=10, compressao='gzip')
+
+
+def conteudo(caminho):
+    with abrir_snapshot(caminho) as f:
+        return sorted((r['ordem'], r['datahora']) for r in json.load(f))
+
+
+def test_coleta_com_falhas(servidor, coletor, tmp_path):
+    pasta = tmp_path / 'sppo'
+    asyncio.run(coletor.coletar(argumentos(servidor, pasta)))
+
+    # Só as horas com registros ganham arquivo, com todos os registros gravados
+    snapshots = listar_snapshots(pasta)
+    assert sorted(snapshots) == [(DIA, h) for h in HORAS]
+    for hora in HORAS:
+        assert snapshots[(DIA, hora)].name == nome_snapshot(DIA, hora, 'gzip')
+        assert conteudo(snapshots[(DIA, hora)]) == sorted((r['ordem'], r['datahora']) for r in registros_da_hora(hora))
+
+    # As falhas foram repetidas e as conexões reaproveitadas
+    contagem = servidor.contagem
+    assert contagem['falhas'] > 0
+    assert contagem['conexoes'] <= 4
+    assert contagem['requisicoes'] >= 24 * 4 + contagem['falhas']
+
+
+def test_coleta_baixa_so_as_horas_que_faltam(servidor, coletor, tmp_path):
+    pasta = tmp_path / 'sppo'
+    args = argumentos(servidor, pasta)
+    asyncio.run(coletor.coletar(args))
+    apagado = listar_snapshots(pasta)[(DIA, HORAS[0])]
+    mantido = listar_snapshots(pasta)[(DIA, HORAS[1])]
+    mtime = mantido.stat().st_mtime_ns
+    apagado.unlink()
+
+    assert coletor.horas_faltando(args)[:1] == [(DIA, 0)]
+    assert (DIA, HORAS[0]) in coletor.horas_faltando(args)
+    assert (DIA, HORAS[1]) not in coletor.horas_faltando(args)
+    asyncio.run(coletor.coletar(args))
+
+    assert apagado.exists()
+    assert mantido.stat().st_mtime_ns == mtime
@@ -0,0 +1,93 @@
+"""
+Conversão para o viagens.csv (etapa 04): o caminho em lotes, a partir do
+arquivo binário ou do JSON da etapa 03, grava os mesmos bytes do laço
+original, viagem a viagem com o geopy.
+"""
+import csv
+import json
+import ijson
+import numpy as np
+import pytest
+from geopy.distance import great_circle
+
+from armazem_viagens import LoteViagens
+from registro_linhas import RegistroLinhas
+from viagens_binario import EscritorViagens, exportar_json
+
+EQUIVALENCIAS = [['LECD100', '100']]
+VIACOES = [['10000', 'Viação Um'], ['13000', 'Viação Treze'], ['20500', 'Viação Vinte'],
+           ['33000', 'Viação Sul'], ['32500', 'Viação Ilha'], ['10500', 'Viação Paranapuan']]
+
+# (linha, prefixo) das viagens: viações conhecidas, regras de linhas especiais
+# (SOU, Paranapuan), linha LECD e prefixos desconhecidos
+CARROS = [('100', 'A10001'), ('LECD100', 'A10002'), ('379', 'B13001'), ('323', 'B32501'),
+          ('200', 'C20601'), ('300', 'E90001'), ('400', 'D99001'), ('500', 'X1')]
+
+
+def csv_original(caminho_json, saida, registro):
+    """Laço original da etapa 04 sobre viagens_processadas.json (referência da saída)."""
+    with open(saida, 'w', newline='') as f:
+        csv.writer(f).writerow(['viacao', 'linha', 'carro', 'kilometragem', 'duracao', 'velocidade media'])
+    with open(caminho_json, 'rb') as f:
+        for viagem in ijson.items(f, 'item'):
+            if len(viagem[2]) < 20:
+                continue
+            ii = 5
+            kil = 0
+            for i in range(0, len(viagem[2]) - ii, ii):
+                kil += great_circle(
+                    (viagem[2][i + ii]['latitude'], viagem[2][i + ii]['longitude']),
+                    (viagem[2][i]['latitude'], viagem[2][i]['longitude'])
+                ).kilometers
+            tempotot = viagem[2][-1]['datahora'] - viagem[2][0]['datahora']
+            velmed = kil * 3600000 / tempotot
+            viacao = registro.achar_viacao(viagem[0], viagem[1])
+            with open(saida, 'a', newline='') as f:
+                csv.writer(f).writerow([viacao, viagem[0], viagem[1], round(kil), round(tempotot / 1000),
+                                        round(velmed)])
+
+
+def lotes_viagens():
+    """Lotes de viagens de tamanhos variados (de 1 a 200 registros, inclusive 19, 20 e 21) por carro."""
+    rng = np.random.default_rng(17)
+    lotes = []
+    t = 1_761_966_000_000
+    for linha, prefixo in CARROS:
+        tamanhos = [int(n) for n in rng.integers(1, 200, 6)] + [19, 20, 21]
+        lat = np.cumsum(rng.normal(0, 1e-3, sum(tamanhos))) - 22.9
+        lon = np.cumsum(rng.normal(0, 1e-3, sum(tamanhos))) - 43.2
+        passos = rng.integers(0, 60_000, sum(tamanhos))
+        passos[0] = 0
+        offsets = np.zeros(len(tamanhos) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(tamanhos)
+        lotes.append(LoteViagens(prefixo=prefixo, linhas=[linha] * len(tamanhos), offsets=offsets,
+                                 datahora=t + np.cumsum(passos), latitude=lat, longitude=lon,
+                                 vel=rng.uniform(0, 60, sum(tamanhos))))
+        t += 7 * 24 * 3600_000
+    return lotes
+
+
+@pytest.fixture
+def etapa04(tmp_path, monkeypatch, importar_script):
+    (tmp_path / 'equivalencias.json').write_text(json.dumps(EQUIVALENCIAS))
+    (tmp_path / 'viacoes.csv').write_text(''.join(f'{c},{v}\n' for c, v in VIACOES))
+    monkeypatch.chdir(tmp_path)
+    return importar_script('src/04_converter_para_csv.py')
+
+
+def test_csv_igual_ao_laco_original(etapa04, tmp_path):
+    lotes = lotes_viagens()
+    # Binário com lotes que não coincidem com os carros, e o JSON equivalente
+    with EscritorViagens(tmp_path / 'viagens_processadas.bin', viagens_por_lote=7) as escritor:
+        for lote in lotes:
+            escritor.adicionar(lote)
+    exportar_json(tmp_path / 'viagens_processadas.bin', tmp_path / 'viagens_processadas.json')
+
+    csv_original(tmp_path / 'viagens_processadas.json', tmp_path / 'original.csv',
+                 RegistroLinhas(arq_viacoes=str(tmp_path / 'viacoes.csv')))
+    original = (tmp_path / 'original.csv').read_bytes()
+    assert original.count(b'\r\n') > 50
+
+    for entrada in ('viagens_processadas.bin', 'viagens_processadas.json'):
+        etapa04.converter(entrada)
+        assert (tmp_path / 'viagens.csv').read_bytes() == original, entrada
@@ -0,0 +1,142 @@
+"""
+Paridade do cálculo vetorizado de distâncias (src/distancias.py) e da
+segmentação da etapa 03 com o cálculo ponto a ponto do geopy usado antes.
+"""
+import json
+import numpy as np
+import pytest
+from geopy.distance import great_circle
+
+from distancias import VEL_MAX, VEL_MIN, great_circle_km, trilha_para_arrays, velocidades
+
+# Dois pontos finais da linha 100, a cerca de 10 km um do outro
+TERMINAL_A = (-22.90, -43.20)
+TERMINAL_B = (-22.90, -43.10)
+PONTOS_FINAIS = {'100': [list(TERMINAL_A), list(TERMINAL_B)]}
+EQUIVALENCIAS = [['LECD100', '100']]
+
+
+def analisar_carro_geopy(carro, prefixo, pontos_finais, outronome, verdnome, distponto=0.5):
+    """Laço original da etapa 03, registro a registro com o geopy (referência da segmentação)."""
+    def terminais(linha):
+        if linha in pontos_finais:
+            return pontos_finais[linha]
+        return pontos_finais.get(outronome(linha), [])
+
+    llat = float(carro[0]['latitude'].replace(',', '.'))
+    llon = float(carro[0]['longitude'].replace(',', '.'))
+    lt = int(carro[0]['datahora'])
+    llinha = carro[0]['linha']
+    pf = terminais(llinha)
+
+    viagens = []
+    viagem = []
+    for i in carro:
+        lat = float(i['latitude'].replace(',', '.'))
+        lon = float(i['longitude'].replace(',', '.'))
+        t = int(i['datahora'])
+
+        dist = great_circle((llat, llon), (lat, lon)).kilometers
+        vel = dist * 3600000 / (t - lt) if t != lt else 0.0
+        if vel < 2 or vel > 200:
+            vel = 0.0
+
+        if i['linha'] != llinha:
+            pf = terminais(i['linha'])
+        d_pontos = [great_circle(p, (lat, lon)).kilometers for p in pf]
+        mindist = min(d_pontos) if d_pontos else 0.0
+
+        if len(viagem) > 0 and ((vel == 0.0 and mindist < distponto) or len(d_pontos) == 0):
+            viagens.append((verdnome(llinha), prefixo, viagem))
+            viagem = []
+        if len(viagem) > 0 or (vel > 0.0 and mindist > distponto):
+            viagem.append({'datahora': t, 'latitude': lat, 'longitude': lon, 'vel': vel})
+
+        llat, llon, lt, llinha = lat, lon, t, i['linha']
+
+    return viagens[1:]
+
+
+def registro(lat, lon, t, linha):
+    return {'latitude': f'{lat:.6f}'.replace('.', ','), 'longitude': f'{lon:.6f}'.replace('.', ','),
+            'datahora': str(t), 'linha': linha}
+
+
+def trilha_fixa():
+    """
+    Trilha de um carro indo e voltando entre os terminais da linha 100, com
+    paradas nos terminais, ruído de GPS, pings repetidos no mesmo instante, um
+    trecho como LECD100 (equivalente à 100) e outro numa linha sem pontos finais.
+    """
+    rng = np.random.default_rng(7)
+    t = 1_761_966_000_000
+    carro = []
+    trechos = [('100', TERMINAL_A, TERMINAL_B), ('100', TERMINAL_B, TERMINAL_A),
+               ('LECD100', TERMINAL_A, TERMINAL_B), ('200', TERMINAL_B, TERMINAL_A),
+               ('100', TERMINAL_A, TERMINAL_B), ('100', TERMINAL_B, TERMINAL_A)]
+    for linha, origem, destino in trechos:
+        # Parado no terminal de origem
+        for _ in range(4):
+            carro.append(registro(origem[0], origem[1], t, linha))
+            t += 30_000
+        # Em movimento até o outro terminal (~25 km/h), com ruído
+        for f in np.linspace(0, 1, 50)[1:]:
+            lat = origem[0] + f * (destino[0] - origem[0]) + rng.normal(0, 2e-4)
+            lon = origem[1] + f * (destino[1] - origem[1]) + rng.normal(0, 2e-4)
+            carro.append(registro(lat, lon, t, linha))
+            if rng.random() < 0.05:
+                carro.append(registro(lat, lon, t, linha))  # ping repetido
+            t += 30_000
+    for _ in range(4):
+        carro.append(registro(TERMINAL_A[0], TERMINAL_A[1], t, '100'))
+        t += 30_000
+    return carro
+
+
+@pytest.fixture
+def etapa03(tmp_path, monkeypatch, importar_script):
+    """Etapa 03 importada com os pontos finais e as equivalências de teste na pasta corrente."""
+    (tmp_path / 'terminais_coordenadas.json').write_text(json.dumps(PONTOS_FINAIS))
+    (tmp_path / 'equivalencias.json').write_text(json.dumps(EQUIVALENCIAS))
+    monkeypatch.chdir(tmp_path)
+    return importar_script('src/03_processar_viagens_carro.py')
+
+
+def test_great_circle_igual_ao_geopy():
+    rng = np.random.default_rng(0)
+    lat1, lat2 = rng.uniform(-23.1, -22.7, (2, 500))
+    lon1, lon2 = rng.uniform(-43.8, -43.1, (2, 500))
+    esperado = [great_circle((a, b), (c, d)).kilometers for a, b, c, d in zip(lat1, lon1, lat2, lon2)]
+    np.testing.assert_allclose(great_circle_km(lat1, lon1, lat2, lon2), esperado, rtol=1e-12, atol=1e-12)
+
+
+def test_great_circle_broadcasting():
+    pontos = np.array([[-22.9, -43.2], [-22.8, -43.3], [-23.0, -43.5]])
+    d = great_circle_km(pontos[:, 0][:, np.newaxis], pontos[:, 1][:, np.newaxis],
+                        pontos[:, 0][np.newaxis, :], pontos[:, 1][np.newaxis, :])
+    for i, p in enumerate(pontos):
+        for j, q in enumerate(pontos):
+            assert d[i, j] == pytest.approx(great_circle(p, q).kilometers, abs=1e-12)
+
+
+def test_velocidades_iguais_ao_laco_original():
+    lat, lon, t, _ = trilha_para_arrays(trilha_fixa())
+    esperado = [0.0]
+    for k in range(1, len(t)):
+        dist = great_circle((lat[k - 1], lon[k - 1]), (lat[k], lon[k])).kilometers
+        vel = dist * 3600000 / (t[k] - t[k - 1]) if t[k] != t[k - 1] else 0.0
+        esperado.append(0.0 if vel < VEL_MIN or vel > VEL_MAX else vel)
+    np.testing.assert_allclose(velocidades(lat, lon, t), esperado, rtol=1e-12, atol=1e-12)
+
+
+def test_limites_de_viagem_iguais_ao_laco_original(etapa03):
+    carro = trilha_fixa()
+    esperado = analisar_carro_geopy(carro, 'A12345', PONTOS_FINAIS, etapa03.outronome, etapa03.verdnome)
+    obtido = etapa03.analisar_carro(carro, 'A12345')
+
+    assert len(esperado) >= 3
+    assert [(l, p, [r['datahora'] for r in v]) for l, p, v in obtido] == \
+           [(l, p, [r['datahora'] for r in v]) for l, p, v in esperado]
+    for (_, _, v_obtida), (_, _, v_esperada) in zip(obtido, esperado):
+        np.testing.assert_allclose([r['vel'] for r in v_obtida], [r['vel'] for r in v_esperada],
+                                   rtol=1e-12, atol=1e-12)
@@ -0,0 +1,99 @@
+"""
+Segmentação online (src/segmentacao_online.py): sobre os mesmos registros, as
+viagens gravadas são as da segmentação em lote da etapa 03 (antes da
+filtragem), convertidas como na etapa 04.
+"""
+import json
+import numpy as np
+import pytest
+
+from registro_linhas import RegistroLinhas
+from segmentacao_online import SegmentadorOnline
+from viagens_csv import linhas_csv
+
+PONTOS_FINAIS = {
+    '100': [[-22.90, -43.20], [-22.90, -43.10]],
+    '300': [[-22.85, -43.30], [-22.95, -43.25]],
+}
+EQUIVALENCIAS = [['LECD100', '100']]
+VIACOES = [['10000', 'Viação Um'], ['20000', 'Viação Dois'], ['30000', 'Viação Três']]
+
+INICIO = 1_761_966_000_000
+
+
+def registro(ordem, linha, lat, lon, t):
+    return {'ordem': ordem, 'linha': linha, 'latitude': f'{lat:.6f}'.replace('.', ','),
+            'longitude': f'{lon:.6f}'.replace('.', ','), 'datahora': str(t)}
+
+
+def trilha(rng, ordem, linha, t, fim):
+    """
+    Registros da API de um carro indo e voltando entre os pontos finais da
+    linha, com pings repetidos (cópias idênticas e, às vezes, outra posição
+    no mesmo instante).
+    """
+    terminais = PONTOS_FINAIS['100' if linha == 'LECD100' else linha]
+    registros = []
+    k = 0
+    while t < fim:
+        origem, destino = terminais[k % 2], terminais[1 - k % 2]
+        pontos = [origem] * int(rng.integers(3, 10))
+        for f in np.linspace(0, 1, rng.integers(30, 80))[1:]:
+            pontos.append((origem[0] + f * (destino[0] - origem[0]) + rng.normal(0, 2e-4),
+                           origem[1] + f * (destino[1] - origem[1]) + rng.normal(0, 2e-4)))
+        for lat, lon in pontos:
+            registros.append(registro(ordem, linha, lat, lon, t))
+            sorteio = rng.random()
+            if sorteio < 0.05:
+                registros.append(registro(ordem, linha, lat, lon, t))
+            elif sorteio < 0.07:
+                registros.append(registro(ordem, linha, lat + 1e-4, lon, t))
+            t += 30_000
+        k += 1
+    return registros
+
+
+@pytest.fixture
+def referencias(tmp_path, monkeypatch):
+    (tmp_path / 'terminais_coordenadas.json').write_text(json.dumps(PONTOS_FINAIS))
+    (tmp_path / 'equivalencias.json').write_text(json.dumps(EQUIVALENCIAS))
+    (tmp_path / 'viacoes.csv').write_text(''.join(f'{c},{v}\n' for c, v in VIACOES))
+    monkeypatch.chdir(tmp_path)
+
+
+def linhas_lote(etapa03, registros, registro_linhas):
+    """Linhas do CSV da segmentação em lote (etapa 03 sem filtragem, etapa 04) de todos os carros."""
+    carros = {}
+    for r in sorted(registros, key=lambda r: int(r['datahora'])):
+        carros.setdefault(r['ordem'], []).append(r)
+    ret = []
+    for ordem, carro in carros.items():
+        lote = etapa03.segmentar_carro(carro, ordem)
+        ret += linhas_csv(lote.linhas, [ordem] * len(lote.linhas), lote.offsets, lote.latitude,
+                          lote.longitude, lote.datahora, registro_linhas)
+    return ret
+
+
+def test_online_igual_ao_lote_com_pings_repetidos(referencias, importar_script):
+    etapa03 = importar_script('src/03_processar_viagens_carro.py')
+    rng = np.random.default_rng(5)
+    registros = (trilha(rng, 'A10001', '100', INICIO, INICIO + 8 * 3600_000)
+                 + trilha(rng, 'B20002', '300', INICIO + 1800_000, INICIO + 8 * 3600_000)
+                 + trilha(rng, 'C30003', 'LECD100', INICIO + 3600_000, INICIO + 8 * 3600_000))
+    registros.sort(key=lambda r: int(r['datahora']))
+
+    # Snapshots de uma hora; o terceiro chega primeiro incompleto, cortado entre
+    # duas cópias de um ping, e depois inteiro, e o quinto chega duas vezes
+    horas = [[r for r in registros if INICIO + h * 3600_000 <= int(r['datahora']) < INICIO + (h + 1) * 3600_000]
+             for h in range(9)]
+    terceiro = horas[2]
+    corte = next(k for k in range(1, len(terceiro)) if terceiro[k] == terceiro[k - 1])
+    entregas = horas[:2] + [terceiro[:corte], terceiro] + horas[3:5] + [horas[4]] + horas[5:]
+
+    online = SegmentadorOnline(RegistroLinhas())
+    obtidas = [linha for snapshot in entregas for linha in online.processar(snapshot)]
+    esperadas = linhas_lote(etapa03, registros, RegistroLinhas())
+
+    assert len(esperadas) > 20
+    assert online.ignorados == corte + len(horas[4])
+    assert sorted(obtidas) == sorted(esperadas)
@@ -0,0 +1,145 @@
+"""
+Relatório (analysis/gerar_relatório.py): o filtro de outliers por grupo
+vetorizado comparado com o laço original, e o modo streaming, com esboços de
+quantis juntados por partes e rankings comparados com o modo exato.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+ERRO = 0.005
+QUANTIS = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+@pytest.fixture(scope='module')
+def relatorio(importar_script):
+    return importar_script('analysis/gerar_relatório.py')
+
+
+@pytest.fixture(scope='module')
+def viagens_csv(tmp_path_factory):
+    """
+    viagens.csv pequeno e fixo, no formato da etapa 04: 30 linhas com medianas
+    de quilometragem e velocidade bem separadas (os rankings não dependem do
+    erro dos esboços) e alguns outliers longe dos limites do IQR.
+    """
+    rng = np.random.default_rng(42)
+    linhas = []
+    for i in range(30):
+        viacao = f'Viação {i % 7}'
+        km_base = 5 + 1.7 * i
+        vel_base = 12 + ((i * 11) % 30)
+        for k in range(40 + 3 * i):
+            km = rng.uniform(0.9, 1.1) * km_base
+            vel = rng.uniform(0.95, 1.05) * vel_base
+            duracao = km / vel * 3600
+            carro = f'C{(i * 131 + k) % 97:05d}'
+            linhas.append([viacao, str(100 + i), carro, round(km, 2), round(duracao), round(vel, 2)])
+        # Outliers claros (removidos nos dois modos)
+        linhas.append([viacao, str(100 + i), 'C99999', round(km_base * 8, 2), round(km_base * 8 / vel_base * 3600),
+                       round(vel_base, 2)])
+    # Linhas com menos de 4 viagens: sem filtro IQR
+    linhas.append(['Viação 0', '999', 'C00001', 12.0, 1800, 24.0])
+    linhas.append(['Viação 0', '999', 'C00002', 14.0, 1900, 26.5])
+
+    caminho = tmp_path_factory.mktemp('relatorio') / 'viagens.csv'
+    pd.DataFrame(linhas, columns=['viacao', 'linha', 'carro', 'kilometragem', 'duracao', 'velocidade media']) \
+        .to_csv(caminho, index=False)
+    return caminho
+
+
+def iqr_filter_original(df, group_col, cols_to_check, k=1.5):
+    """Filtro de outliers original, grupo a grupo com Series.quantile (referência)."""
+    mask_keep = pd.Series(True, index=df.index)
+    for _, group in df.groupby(group_col):
+        for col in cols_to_check:
+            series = group[col].dropna().astype(float)
+            if series.shape[0] < 4:
+                continue
+            q1 = series.quantile(0.25)
+            q3 = series.quantile(0.75)
+            iqr = q3 - q1
+            outlier_idx = series[(series < q1 - k * iqr) | (series > q3 + k * iqr)].index
+            mask_keep.loc[outlier_idx] = False
+    return df[mask_keep].copy()
+
+
+@pytest.mark.parametrize('semente', [0, 1, 2])
+def test_iqr_vetorizado_igual_ao_original(relatorio, semente):
+    rng = np.random.default_rng(semente)
+    # Grupos de 1 a 300 viagens; valores inteiros com muitos empates, para os
+    # limites caírem exatamente sobre valores, e outros contínuos
+    tamanhos = [1, 2, 3, 4, 5, 6, 7, 8, 9, 12, 25, 60, 300]
+    linhas = np.repeat([f'L{g}' for g in range(len(tamanhos))], tamanhos)
+    n = len(linhas)
+    df = pd.DataFrame({
+        'Linha': linhas,
+        'Quilometragem': rng.integers(5, 12, n).astype(float),
+        'Velocidade_Media': rng.lognormal(2.8, 0.4, n),
+        'Duracao': rng.integers(0, 5, n) * 600.0,
+    })
+    # Outliers, valores ausentes (o grupo de 5 fica com menos de 4 válidos) e linhas sem grupo
+    df.loc[rng.choice(n, 20, replace=False), 'Quilometragem'] = rng.uniform(30, 90, 20)
+    df.loc[rng.choice(n, 30, replace=False), 'Velocidade_Media'] = np.nan
+    df.loc[df['Linha'] == 'L4', 'Duracao'] = [600.0, np.nan, 1200.0, np.nan, 9000.0]
+    df.loc[rng.choice(n, 10, replace=False), 'Linha'] = np.nan
+    df = df.sample(frac=1, random_state=semente)
+
+    colunas = ['Quilometragem', 'Velocidade_Media', 'Duracao']
+    esperado = iqr_filter_original(df, 'Linha', colunas)
+    obtido = relatorio.iqr_filter_groupwise(df, 'Linha', colunas)
+
+    assert 0 < len(esperado) < len(df)
+    pd.testing.assert_frame_equal(obtido, esperado)
+
+
+def test_esboco_juntado_por_partes(relatorio):
+    rng = np.random.default_rng(1)
+    n = 60_000
+    grupos = pd.Series(rng.integers(0, 25, n).astype(str))
+    valores = pd.Series(rng.lognormal(2.5, 0.8, n))
+    valores[rng.random(n) < 0.01] = np.nan
+
+    # Um esboço por parte, juntados depois (e compactados várias vezes no caminho)
+    juntado = relatorio.GroupedQuantileSketch(ERRO, compact_every=500)
+    for inicio in range(0, n, 7_000):
+        parte = relatorio.GroupedQuantileSketch(ERRO, compact_every=500)
+        parte.add(grupos[inicio:inicio + 7_000], valores[inicio:inicio + 7_000])
+        juntado.merge(parte)
+
+    obtido = juntado.quantiles(QUANTIS)
+    validos = valores.notna()
+    for grupo, v in valores[validos].groupby(grupos[validos]):
+        np.testing.assert_allclose(obtido.loc[grupo].to_numpy(), np.quantile(v, QUANTIS), rtol=ERRO, atol=0)
+        assert juntado.counts()[grupo] == len(v)
+
+
+def test_esboco_com_erro_diferente_nao_junta(relatorio):
+    with pytest.raises(ValueError):
+        relatorio.GroupedQuantileSketch(0.01).merge(relatorio.GroupedQuantileSketch(0.02))
+
+
+def test_rankings_streaming_iguais_ao_modo_exato(relatorio, viagens_csv):
+    exato, contagens_exato = relatorio.exact_cube(viagens_csv)
+    aproximado, contagens, notas = relatorio.streaming_cube(viagens_csv, chunksize=300, rel_error=ERRO)
+
+    assert len(exato['Linha']) == 31 and exato['Linha']['mediana_km'].notna().all()
+
+    # Nenhuma viagem perto dos limites do IQR: contagens e somas exatas
+    assert notas[1].endswith(': 0')
+    assert contagens == contagens_exato
+    for dim in relatorio.CUBE_DIMENSIONS:
+        e, a = exato[dim], aproximado[dim].reindex(exato[dim].index)
+        assert (a['viagens'] == e['viagens']).all()
+        np.testing.assert_allclose(a['soma_km'], e['soma_km'], rtol=1e-12)
+        for metrica in ('mediana_km', 'mediana_vel'):
+            np.testing.assert_allclose(a[metrica], e[metrica], rtol=ERRO, atol=0)
+
+    # Top 10 de cada ranking do relatório: mesmas chaves na mesma ordem
+    for dim in ('Linha', 'Viacao'):
+        for metrica in ('mediana_km', 'mediana_vel', 'viagens', 'soma_km'):
+            for crescente in (False, True):
+                e = exato[dim][metrica].sort_values(ascending=crescente, kind='stable').head(10)
+                a = aproximado[dim][metrica].sort_values(ascending=crescente, kind='stable').head(10)
+                assert list(a.index) == list(e.index), (dim, metrica, crescente)
+                np.testing.assert_allclose(a.to_numpy(), e.to_numpy(), rtol=ERRO)
@@ -0,0 +1,132 @@
+"""
+Pontos finais da etapa 01: os índices montados uma vez (indexar_gtfs) dão os
+mesmos terminais da busca original, linha a linha sobre os DataFrames.
+"""
+import pandas as pd
+import pytest
+
+from cache_gtfs import carregar_gtfs
+
+# Feed pequeno com os casos da busca: nomes repetidos (vale a primeira rota),
+# linha achada pelo route_desc, rota sem viagens, rota só com a direção 1,
+# viagem sem direção, viagens fora de ordem, stop_sequence fora de ordem,
+# viagem de amostra sem stop_times, parada ausente de stops.txt e stop_id repetido
+ROUTES = '''route_id,agency_id,route_short_name,route_long_name,route_desc,route_type
+R1,1,100,Centro - Barra,,700
+R2,1,200,Méier - Penha,LECD200,700
+R3,1,100,Centro - Barra (variante),,700
+R4,1,300,Sem viagens,,700
+R5,1,400,Só volta,,700
+R6,1,500,Sem stop_times,,700
+R7,1,600,Parada ausente,SV600,700
+'''
+TRIPS = '''trip_id,route_id,service_id,direction_id
+T2b,R2,U,1
+T1a,R1,U,0
+T2a,R2,U,0
+T1b,R1,U,1
+T1c,R1,U,0
+T3a,R3,U,0
+T5a,R5,U,1
+T5x,R5,U,
+T6a,R6,U,0
+T6b,R6,U,0
+T7a,R7,U,0
+T7b,R7,U,1
+'''
+STOP_TIMES = '''trip_id,arrival_time,departure_time,stop_id,stop_sequence
+T1a,06:00:00,06:00:00,S2,2
+T1a,05:50:00,05:50:00,S1,1
+T1a,06:10:00,06:10:00,S3,3
+T1b,07:00:00,07:00:00,S3,1
+T1b,07:10:00,07:10:00,S1,2
+T1c,08:00:00,08:00:00,S4,1
+T2a,06:00:00,06:00:00,S5,5
+T2a,05:00:00,05:00:00,S4,10
+T2b,06:00:00,06:00:00,S6,3
+T2b,06:05:00,06:05:00,S2,4
+T3a,06:00:00,06:00:00,S6,1
+T5a,06:00:00,06:00:00,S5,1
+T5x,06:00:00,06:00:00,S1,0
+T6b,06:00:00,06:00:00,S1,1
+T7a,06:00:00,06:00:00,S9,1
+T7b,06:00:00,06:00:00,S4,1
+'''
+STOPS = '''stop_id,stop_name,stop_lat,stop_lon
+S1,Um,-22.90,-43.20
+S2,Dois,-22.91,-43.21
+S3,Três,-22.92,-43.22
+S4,Quatro,-22.93,-43.23
+S5,Cinco,-22.94,-43.24
+S6,Seis,-22.95,-43.25
+S4,Quatro repetida,-22.99,-43.29
+'''
+
+# Nomes procurados: os route_short_name (como na etapa 01), os que só existem
+# no route_desc e um desconhecido
+NOMES = ['100', '200', '300', '400', '500', '600', 'LECD200', 'SV600', '999']
+
+
+def analisar_terminais_original(route_name, routes_df, trips_df, stop_times_df, stops_df):
+    """Busca original da etapa 01, filtrando os DataFrames a cada linha (referência)."""
+    coordenadas_terminais = []
+    route_info = routes_df[routes_df['route_short_name'].astype(str) == str(route_name)]
+    if route_info.empty:
+        route_info = routes_df[routes_df['route_desc'].astype(str) == str(route_name)]
+    if route_info.empty:
+        return []
+    my_route_id = route_info.iloc[0]['route_id']
+
+    viagens_da_linha = trips_df[trips_df['route_id'] == my_route_id]
+    if viagens_da_linha.empty:
+        return []
+    for direcao in [0, 1]:
+        trips_in_direction = viagens_da_linha[viagens_da_linha['direction_id'] == direcao]
+        if trips_in_direction.empty:
+            continue
+        sample_trip_id = trips_in_direction.iloc[0]['trip_id']
+        trip_stops = stop_times_df[stop_times_df['trip_id'] == sample_trip_id]
+        if trip_stops.empty:
+            continue
+        first_stop_id = trip_stops.sort_values('stop_sequence', ascending=True).iloc[0]['stop_id']
+        terminal_stop_info = stops_df[stops_df['stop_id'] == first_stop_id]
+        if terminal_stop_info.empty:
+            continue
+        stop_details = terminal_stop_info.iloc[0]
+        coordenadas_terminais.append([stop_details['stop_lat'], stop_details['stop_lon']])
+    return coordenadas_terminais
+
+
+@pytest.fixture
+def gtfs(tmp_path):
+    for nome, conteudo in [('routes', ROUTES), ('trips', TRIPS), ('stop_times', STOP_TIMES), ('stops', STOPS)]:
+        (tmp_path / f'{nome}.txt').write_text(conteudo, encoding='utf-8')
+    return tmp_path
+
+
+@pytest.mark.parametrize('leitura', ['tipada', 'read_csv'])
+def test_indice_igual_a_busca_original(gtfs, importar_script, leitura):
+    etapa01 = importar_script('src/01_gerar_terminais_gtfs.py')
+    nomes = ['stops', 'stop_times', 'trips', 'routes']
+    if leitura == 'tipada':
+        tabelas = carregar_gtfs(nomes, pasta=gtfs)
+    else:
+        tabelas = {nome: pd.read_csv(gtfs / f'{nome}.txt', low_memory=False) for nome in nomes}
+    routes_df = tabelas['routes']
+    # Como em gerar_terminais
+    routes_df['route_short_name_str'] = routes_df['route_short_name'].astype(str)
+    routes_df['route_desc_str'] = routes_df['route_desc'].astype(str)
+
+    indice = etapa01.indexar_gtfs(routes_df, tabelas['trips'], tabelas['stop_times'], tabelas['stops'])
+    for nome in NOMES:
+        esperado = analisar_terminais_original(nome, routes_df, tabelas['trips'], tabelas['stop_times'],
+                                               tabelas['stops'])
+        assert etapa01.analisar_terminais_da_linha(nome, indice) == esperado, nome
+
+    # Alguns casos conferidos à mão
+    assert etapa01.analisar_terminais_da_linha('100', indice) == [[-22.90, -43.20], [-22.92, -43.22]]
+    assert etapa01.analisar_terminais_da_linha('LECD200', indice) == [[-22.94, -43.24], [-22.95, -43.25]]
+    assert etapa01.analisar_terminais_da_linha('400', indice) == [[-22.94, -43.24]]
+    assert etapa01.analisar_terminais_da_linha('600', indice) == [[-22.93, -43.23]]
+    assert etapa01.analisar_terminais_da_linha('300', indice) == []
+    assert etapa01.analisar_terminais_da_linha('999', indice) == []
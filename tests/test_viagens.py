@@ -0,0 +1,204 @@
+"""
+Segmentação e filtragem da etapa 03: os quartis por linha calculados de uma
+vez são os de statistics.quantiles, a execução em paralelo grava o mesmo
+arquivo que a em série, e o modo incremental (dia a dia, com o estado salvo)
+dá as mesmas viagens do processamento completo do período.
+"""
+from argparse import Namespace
+import json
+import statistics
+import numpy as np
+import pytest
+
+from armazem_viagens import LoteViagens
+from faixas_linhas import ResumosViagens, quartis_agrupados
+from trilhas import EscritorTrilhas
+from viagens_binario import ler_lotes
+
+# Pontos finais de duas linhas, a cerca de 10 km entre si
+PONTOS_FINAIS = {
+    '100': [[-22.90, -43.20], [-22.90, -43.10]],
+    '300': [[-22.85, -43.30], [-22.95, -43.25]],
+}
+EQUIVALENCIAS = [['LECD100', '100']]
+
+INICIO = 1_761_966_000_000  # 2025-11-01 00:00 (-03)
+DIA = 24 * 3600 * 1000
+
+
+def registro(lat, lon, t, linha):
+    return {'latitude': f'{lat:.6f}'.replace('.', ','), 'longitude': f'{lon:.6f}'.replace('.', ','),
+            'datahora': str(t), 'linha': linha}
+
+
+def trilha(rng, t, fim, linha):
+    """
+    Carro indo e voltando entre os pontos finais de `linha` de `t` até `fim`
+    (ms), com paradas de duração variável, velocidades diferentes a cada
+    viagem, ruído de GPS e pings repetidos no mesmo instante.
+    """
+    terminais = PONTOS_FINAIS['100' if linha == 'LECD100' else linha]
+    carro = []
+    k = 0
+    while t < fim:
+        origem, destino = terminais[k % 2], terminais[1 - k % 2]
+        for _ in range(rng.integers(3, 12)):
+            carro.append(registro(*origem, t, linha))
+            t += 30_000
+        for f in np.linspace(0, 1, rng.integers(30, 80))[1:]:
+            lat = origem[0] + f * (destino[0] - origem[0]) + rng.normal(0, 2e-4)
+            lon = origem[1] + f * (destino[1] - origem[1]) + rng.normal(0, 2e-4)
+            carro.append(registro(lat, lon, t, linha))
+            if rng.random() < 0.03:
+                carro.append(registro(lat, lon, t, linha))
+            t += 30_000
+        k += 1
+    return carro
+
+
+def frota():
+    """
+    Carros de três dias: D só aparece no segundo dia e C para logo depois da
+    meia-noite do primeiro e só volta no terceiro. As viagens atravessam a
+    meia-noite, então ficam abertas de um dia para o outro.
+    """
+    rng = np.random.default_rng(3)
+    return {
+        'A': trilha(rng, INICIO + 5 * 3600_000, INICIO + 3 * DIA, '100'),
+        'B': trilha(rng, INICIO + 6 * 3600_000, INICIO + 3 * DIA, '300'),
+        'C': (trilha(rng, INICIO + 7 * 3600_000, INICIO + DIA, 'LECD100')
+              + trilha(rng, INICIO + 2 * DIA, INICIO + 3 * DIA, '100')),
+        'D': trilha(rng, INICIO + DIA + 8 * 3600_000, INICIO + 3 * DIA, '300'),
+    }
+
+
+def gravar_trilhas(caminho, carros, prefixos, inicio=0, fim=INICIO + 10 * DIA):
+    """Arquivo de trilhas (etapa 02) com os registros de [inicio, fim) dos carros, na ordem de `prefixos`."""
+    with EscritorTrilhas(caminho) as escritor:
+        for p in prefixos:
+            registros = [r for r in carros[p] if inicio <= int(r['datahora']) < fim]
+            if registros:
+                escritor.adicionar(p, registros)
+
+
+def viagens(caminho):
+    """Viagens de um arquivo binário da etapa 03 como tuplas comparáveis."""
+    ret = []
+    for lote in ler_lotes(caminho):
+        for k in range(len(lote.linhas)):
+            a, b = lote.offsets[k], lote.offsets[k + 1]
+            ret.append((lote.linhas[k], lote.prefixos[k], lote.datahora[a:b].tolist(),
+                        lote.latitude[a:b].tolist(), lote.longitude[a:b].tolist(), lote.vel[a:b].tolist()))
+    return ret
+
+
+@pytest.fixture
+def etapa03(tmp_path, monkeypatch, importar_script):
+    """Etapa 03 importada com os pontos finais e as equivalências de teste na pasta corrente."""
+    (tmp_path / 'terminais_coordenadas.json').write_text(json.dumps(PONTOS_FINAIS))
+    (tmp_path / 'equivalencias.json').write_text(json.dumps(EQUIVALENCIAS))
+    monkeypatch.chdir(tmp_path)
+    return importar_script('src/03_processar_viagens_carro.py')
+
+
+def test_quartis_agrupados_iguais_a_statistics():
+    rng = np.random.default_rng(11)
+    # Grupos vazios, de uma, duas e três viagens e maiores, fora de ordem
+    tamanhos = [0, 1, 2, 3, 4, 5, 7, 1, 2, 50, 101, 0]
+    codigos = np.repeat(np.arange(len(tamanhos)), tamanhos)
+    perm = rng.permutation(len(codigos))
+    codigos = codigos[perm]
+    duracoes = rng.integers(10, 40, len(codigos)) * 60_000  # com muitos empates
+    distancias = rng.uniform(5.0, 15.0, len(codigos))
+
+    for valores in (duracoes, distancias):
+        quartis = quartis_agrupados(codigos, valores, len(tamanhos))
+        assert quartis.shape == (len(tamanhos), 3)
+        for g, n in enumerate(tamanhos):
+            if n < 2:
+                assert np.isnan(quartis[g]).all()
+            else:
+                esperado = statistics.quantiles(valores[codigos == g].tolist(), n=4)
+                np.testing.assert_allclose(quartis[g], esperado, rtol=1e-12)
+
+
+def lote(prefixo, linhas, duracoes_min, km):
+    """LoteViagens com uma viagem por linha de `linhas`, com a duração (min) e a distância (km) dadas."""
+    n = len(linhas)
+    t = np.zeros(2 * n, dtype=np.int64)
+    t[1::2] = np.asarray(duracoes_min) * 60_000
+    lon = np.full(2 * n, -43.20)
+    lon[1::2] += np.asarray(km) / 102.5  # ~102.5 km por grau de longitude nessa latitude
+    return LoteViagens(prefixo=prefixo, linhas=list(linhas), offsets=np.arange(0, 2 * n + 1, 2),
+                       datahora=t, latitude=np.full(2 * n, -22.90), longitude=lon, vel=np.zeros(2 * n))
+
+
+def test_linhas_com_menos_de_duas_viagens_nao_tem_aceitas(etapa03):
+    resumos = ResumosViagens()
+    resumos.adicionar(lote('A1', ['1', '2', '3', '3', '3'], [30, 30, 30, 32, 34], [10, 10, 10, 10.5, 11]))
+    resumos.adicionar(lote('A2', ['2', '3', '3', '3', '3'], [31, 31, 33, 35, 90], [10.5, 9.5, 10, 11, 10.2]))
+    faixas = etapa03.dados_linhas(resumos)
+    aceitas = etapa03.filtrar_viagens(resumos, faixas).tolist()
+
+    # Filtragem original, linha a linha com statistics.quantiles
+    codigos, duracoes, distancias = resumos.arrays()
+    esperadas = []
+    for c, d, km in zip(codigos.tolist(), duracoes.tolist(), distancias.tolist()):
+        t = duracoes[codigos == c].tolist()
+        k = distancias[codigos == c].tolist()
+        if len(t) < 2:
+            esperadas.append(False)
+            continue
+        t_qs, d_qs = statistics.quantiles(t, n=4), statistics.quantiles(k, n=4)
+        t_iqr, d_iqr = t_qs[2] - t_qs[0], d_qs[2] - d_qs[0]
+        esperadas.append(t_qs[0] - 0.5 * t_iqr < d < t_qs[2] + 0.5 * t_iqr
+                         and d_qs[0] - 0.3 * d_iqr < km < d_qs[2] + 0.3 * d_iqr)
+
+    assert etapa03.intervalos_por_linha(faixas)['1'] is None
+    assert aceitas == esperadas
+    # A linha 1 tem uma viagem só e não aceita nenhuma; as outras aceitam a maioria
+    assert aceitas[0] is False and sum(aceitas) >= 6
+
+
+@pytest.mark.parametrize('entrada', ['trilhas', 'carros'])
+def test_paralelo_igual_ao_serie(etapa03, tmp_path, entrada):
+    carros = frota()
+    if entrada == 'trilhas':
+        gravar_trilhas(tmp_path / 'periodo.trilhas', carros, ['A', 'B', 'C', 'D'])
+        trilhas = str(tmp_path / 'periodo.trilhas')
+    else:
+        (tmp_path / 'carros').mkdir()
+        for p, registros in carros.items():
+            (tmp_path / 'carros' / f'{p}.json').write_text(json.dumps(registros))
+        trilhas = None
+
+    # Em série e em dois processos, com um carro por tarefa e com o bloco padrão
+    saidas = []
+    for processos, bloco in [(1, None), (2, 1), (2, None)]:
+        saida = tmp_path / f'viagens_{processos}_{bloco}.bin'
+        etapa03.processar_completo(Namespace(trilhas=trilhas, bloco=bloco, saida=str(saida), json=False), processos)
+        saidas.append(saida.read_bytes())
+
+    assert len(viagens(tmp_path / 'viagens_1_None.bin')) > 50
+    assert saidas[1] == saidas[0]
+    assert saidas[2] == saidas[0]
+
+
+def test_incremental_igual_ao_completo(etapa03, tmp_path):
+    carros = frota()
+    gravar_trilhas(tmp_path / 'periodo.trilhas', carros, ['A', 'B', 'C', 'D'])
+    etapa03.processar_completo(Namespace(trilhas=str(tmp_path / 'periodo.trilhas'), bloco=None,
+                                         saida=str(tmp_path / 'completo.bin'), json=False), 1)
+
+    # Cada dia com os carros em outra ordem, como podem vir da etapa 02
+    ordens = [['A', 'B', 'C'], ['D', 'C', 'B', 'A'], ['C', 'D', 'B', 'A']]
+    for d, ordem in enumerate(ordens):
+        dia = tmp_path / f'dia{d}.trilhas'
+        gravar_trilhas(dia, carros, ordem, INICIO + d * DIA, INICIO + (d + 1) * DIA)
+        etapa03.processar_incremental(Namespace(trilhas=str(dia), bloco=None, incremental=str(tmp_path / 'estado'),
+                                                saida=str(tmp_path / 'incremental.bin'), json=False), 1)
+
+    completo = viagens(tmp_path / 'completo.bin')
+    assert len(completo) > 50
+    assert {v[1] for v in completo} == {'A', 'B', 'C', 'D'}
+    assert viagens(tmp_path / 'incremental.bin') == completo
@@ -0,0 +1,179 @@
+"""
+Benchmark das compressões dos snapshots do SPPO (ver src/snapshots_sppo.py).
+
+Toma uma amostra de snapshots da pasta, grava cada um em cada compressão pedida
+(numa pasta temporária) e mede, por compressão: a razão de tamanho, a vazão da
+compressão, a da descompressão e a da leitura completa como na etapa 02
+(json.load e, em streaming, ijson), sempre em MB de JSON descomprimido por
+segundo. Com --repeticoes N vale o melhor dos N tempos.
+
+Os arquivos recém-gravados estão no cache do sistema, então as leituras medem
+só a CPU. O custo do disco é estimado para cada banda de --banda (MB/s): o
+tempo para ingerir 1 GB de JSON é o da leitura do arquivo comprimido mais o da
+decodificação. Com --frio, o cache de cada arquivo é descartado antes de lê-lo
+(posix_fadvise) e a leitura inclui o disco de verdade.
+
+Uso:
+    python tools/benchmark_compressao.py sppo
+    python tools/benchmark_compressao.py sppo -n 8 --compressoes gzip:1 gzip xz zstd:3 --banda 50 200 --frio
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import ijson
+
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from snapshots_sppo import NIVEIS, abrir_snapshot, disponivel, gravar_snapshot, listar_snapshots, nome_snapshot
+
+COMPRESSOES = ['nenhuma', 'gzip:1', 'gzip', 'xz:1', 'xz', 'zstd:3', 'zstd']
+BANDAS = [100, 500]
+
+
+def ler_compressao(texto):
+    """'nome' ou 'nome:nível' em (compressão, nível); 'nenhuma' é None."""
+    nome, _, nivel = texto.partition(':')
+    compressao = None if nome == 'nenhuma' else nome
+    if compressao not in NIVEIS and compressao is not None:
+        raise argparse.ArgumentTypeError(f'compressão desconhecida: {nome}')
+    return compressao, int(nivel) if nivel else NIVEIS.get(compressao)
+
+
+def descartar_cache(caminho):
+    """Tira o arquivo do cache de páginas, para a próxima leitura vir do disco."""
+    fd = os.open(caminho, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def cronometrar(funcao, caminhos, repeticoes, frio):
+    """Melhor tempo (s) de `funcao` aplicada a todos os caminhos."""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        if frio:
+            for c in caminhos:
+                descartar_cache(c)
+        inicio = time.perf_counter()
+        for c in caminhos:
+            funcao(c)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def descomprimir(caminho):
+    with abrir_snapshot(caminho) as f:
+        while f.read(1 << 20):
+            pass
+
+
+def carregar(caminho):
+    with abrir_snapshot(caminho) as f:
+        json.load(f)
+
+
+def carregar_streaming(caminho):
+    with abrir_snapshot(caminho) as f:
+        for _ in ijson.items(f, 'item'):
+            pass
+
+
+def medir(amostra, compressao, nivel, pasta, args):
+    """Resultados de uma compressão sobre os dados (bytes JSON) da amostra."""
+    bruto = sum(len(d) for _, d in amostra)
+    caminhos = []
+    inicio = time.perf_counter()
+    for (dia, hora), dados in amostra:
+        caminho = pasta / nome_snapshot(dia, hora, compressao)
+        gravar_snapshot(caminho, dados, compressao, nivel)
+        caminhos.append(caminho)
+    t_compressao = time.perf_counter() - inicio
+    tamanho = sum(c.stat().st_size for c in caminhos)
+
+    t_descompressao = cronometrar(descomprimir, caminhos, args.repeticoes, args.frio)
+    t_json = cronometrar(carregar, caminhos, args.repeticoes, args.frio)
+    t_ijson = cronometrar(carregar_streaming, caminhos, args.repeticoes, args.frio) if args.streaming else None
+    for c in caminhos:
+        c.unlink()
+
+    mb = bruto / 1e6
+    # Segundos para ingerir 1 GB de JSON com json.load: a leitura (medida com --frio,
+    # senão estimada para cada banda) mais a decodificação
+    por_gb = 1e3 / mb
+    if args.frio:
+        ingestao = {'disco': por_gb * t_json}
+    else:
+        ingestao = {f'{b:g}': por_gb * (tamanho / 1e6 / b + t_json) for b in args.banda}
+    return {
+        'compressao': compressao or 'nenhuma',
+        'nivel': nivel,
+        'razao': tamanho / bruto,
+        'compressao_mb_s': mb / t_compressao,
+        'descompressao_mb_s': mb / t_descompressao,
+        'json_mb_s': mb / t_json,
+        'ijson_mb_s': mb / t_ijson if t_ijson else None,
+        'ingestao_s_por_gb': ingestao,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara as compressões dos snapshots do SPPO.')
+    parser.add_argument('pasta', nargs='?', default='sppo', help='pasta dos snapshots (padrão: sppo/)')
+    parser.add_argument('-n', '--amostra', type=int, default=4,
+                        help='snapshots da amostra, espaçados ao longo da pasta (padrão: 4)')
+    parser.add_argument('--compressoes', nargs='+', type=ler_compressao, default=None,
+                        help=f'compressões comparadas, nome ou nome:nível (padrão: {" ".join(COMPRESSOES)}; '
+                             'zstd só com o pacote zstandard)')
+    parser.add_argument('--banda', nargs='+', type=float, default=BANDAS,
+                        help=f'vazões do disco (MB/s) para estimar a ingestão (padrão: {" ".join(map(str, BANDAS))})')
+    parser.add_argument('--repeticoes', type=int, default=3, help='repetições de cada leitura (padrão: 3)')
+    parser.add_argument('--frio', action='store_true', help='descarta o cache de cada arquivo antes de lê-lo')
+    parser.add_argument('--streaming', action='store_true', help='mede também a leitura com ijson (mais lenta)')
+    parser.add_argument('--saida', default=None, help='grava os resultados em JSON')
+    args = parser.parse_args()
+
+    compressoes = args.compressoes or [ler_compressao(c) for c in COMPRESSOES if disponivel(ler_compressao(c)[0])]
+    for c, _ in compressoes:
+        if not disponivel(c):
+            parser.error(f'a compressão {c} requer o pacote zstandard')
+
+    snapshots = sorted(listar_snapshots(args.pasta).items())
+    if not snapshots:
+        print(f'Nenhum snapshot em {args.pasta}')
+        sys.exit(1)
+    passo = max(len(snapshots) // args.amostra, 1)
+    amostra = []
+    for chave, caminho in snapshots[::passo][:args.amostra]:
+        with abrir_snapshot(caminho) as f:
+            amostra.append((chave, f.read()))
+    print(f'Amostra: {len(amostra)} snapshots, {sum(len(d) for _, d in amostra) / 1e6:.1f} MB de JSON')
+
+    resultados = []
+    with tempfile.TemporaryDirectory(dir=args.pasta) as temporaria:
+        for compressao, nivel in compressoes:
+            resultados.append(medir(amostra, compressao, nivel, Path(temporaria), args))
+
+    bandas = f'{"s/GB (disco)":>17}' if args.frio else ''.join(f'{f"s/GB a {b:g} MB/s":>17}' for b in args.banda)
+    print(f'{"compressão":<12}{"razão":>7}{"comp MB/s":>11}{"desc MB/s":>11}{"json MB/s":>11}'
+          f'{"ijson MB/s":>12}{bandas}')
+    for r in resultados:
+        nome = r['compressao'] + (f":{r['nivel']}" if r['nivel'] is not None else '')
+        ijson_mb_s = f"{r['ijson_mb_s']:12.1f}" if r['ijson_mb_s'] else f'{"-":>12}'
+        print(f"{nome:<12}{r['razao']:7.3f}{r['compressao_mb_s']:11.1f}{r['descompressao_mb_s']:11.1f}"
+              f"{r['json_mb_s']:11.1f}{ijson_mb_s}"
+              + ''.join(f'{s:17.1f}' for s in r['ingestao_s_por_gb'].values()))
+
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            json.dump({'amostra': [f'{d} {h:02d}h' for (d, h), _ in amostra], 'resultados': resultados}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Benchmark das etapas 01 a 04 e do relatório sobre cargas sintéticas (ver gerar_carga_sppo.py).
+
+Para cada escala (carros x dias) gera a carga uma vez, em <trabalho>/<escala>/,
+e executa cada etapa em sequência, sem cache, medindo o tempo de parede e de
+CPU e o pico de memória, com o tempo das fases internas de cada etapa (ver
+src/metricas.py). A vazão de cada etapa é medida na unidade que ela processa: linhas do
+stop_times (01), rotas (equivalências), registros SPPO (02 e 03) e viagens
+(04 e relatório). Com --repeticoes N vale o melhor dos N tempos.
+
+Os resultados vão para <trabalho>/resultado.json. Com uma baseline gravada
+(--salvar-baseline), o benchmark falha (código 1) se a vazão de alguma etapa
+cair mais que --tolerancia em relação a ela.
+
+Uso:
+    python tools/benchmark_pipeline.py --escalas 100x1 300x2 --salvar-baseline
+    python tools/benchmark_pipeline.py --escalas 100x1 300x2
+"""
+from datetime import date, timedelta
+from pathlib import Path
+import argparse
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(RAIZ / 'src'))
+
+from executar_pipeline import etapas_pipeline
+from gerar_carga_sppo import gerar
+
+ESCALAS = ['100x1', '300x2']
+INICIO = date(2025, 11, 1)
+CONSORCIOS = ['A', 'B', 'C', 'D', 'E']
+
+
+def contar_linhas(caminho):
+    """Linhas de dados (sem o cabeçalho) de um arquivo de texto."""
+    with open(caminho, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def preparar_carga(pasta, carros, dias, semente):
+    """Gera a carga da escala, a menos que a pasta já tenha uma com os mesmos parâmetros."""
+    arquivo = pasta / 'carga.json'
+    if arquivo.exists():
+        with open(arquivo, 'r') as f:
+            resumo = json.load(f)
+        p = resumo['parametros']
+        if (p['carros'], p['dias'], p['semente'], p['inicio']) == (carros, dias, semente, INICIO.isoformat()):
+            return resumo
+        shutil.rmtree(pasta)
+    print(f'Gerando carga de {carros} carros x {dias} dias em {pasta}')
+    return gerar(pasta, RAIZ / 'data' / 'gtfs', RAIZ / 'data_input' / 'pontos_finais.json',
+                 carros, dias, INICIO, 30.0, 10.0, semente)
+
+
+def executar(etapa, pasta):
+    """
+    Executa a etapa na pasta da escala; retorna (segundos de parede, segundos de
+    CPU, métricas gravadas pela própria etapa).
+    """
+    logs = pasta / '.benchmark'
+    logs.mkdir(exist_ok=True)
+    arquivo_metricas = (logs / f'{etapa.nome}.json').resolve()
+    antes = resource.getrusage(resource.RUSAGE_CHILDREN)
+    inicio = time.perf_counter()
+    with open(logs / f'{etapa.nome}.log', 'w') as f:
+        retorno = subprocess.run([sys.executable, str(etapa.script), *etapa.argumentos,
+                                  '--metricas', str(arquivo_metricas)],
+                                 cwd=pasta, stdout=f, stderr=subprocess.STDOUT).returncode
+    parede = time.perf_counter() - inicio
+    depois = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if retorno != 0:
+        raise RuntimeError(f'{etapa.nome} falhou (código {retorno}), veja {logs / etapa.nome}.log')
+    cpu = (depois.ru_utime - antes.ru_utime) + (depois.ru_stime - antes.ru_stime)
+    with open(arquivo_metricas, 'r') as f:
+        metricas = json.load(f)
+    return parede, cpu, metricas
+
+
+def unidades(nome, pasta, resumo):
+    """Quantidade processada pela etapa, na unidade da sua vazão."""
+    if nome == 'terminais':
+        return contar_linhas(pasta / 'gtfs' / 'stop_times.txt')
+    if nome == 'equivalencias':
+        return contar_linhas(pasta / 'gtfs' / 'routes.txt')
+    if nome in ('agregar', 'viagens'):
+        return resumo['registros']
+    return contar_linhas(pasta / 'viagens.csv')
+
+
+def medir_escala(pasta, resumo, processos, repeticoes):
+    """Executa todas as etapas `repeticoes` vezes e retorna as medidas de cada uma."""
+    fim = (INICIO + timedelta(days=resumo['parametros']['dias'] - 1)).isoformat()
+    etapas = etapas_pipeline('gtfs', INICIO.isoformat(), fim, CONSORCIOS, processos)
+    medidas = {}
+    for _ in range(repeticoes):
+        # sem o cache binário do GTFS, a etapa 01 mede a leitura completa do feed
+        shutil.rmtree(pasta / 'gtfs' / '.cache', ignore_errors=True)
+        for etapa in etapas:
+            parede, cpu, metricas = executar(etapa, pasta)
+            n = unidades(etapa.nome, pasta, resumo)
+            if etapa.nome not in medidas or parede < medidas[etapa.nome]['segundos']:
+                medidas[etapa.nome] = {
+                    'segundos': round(parede, 3),
+                    'cpu': round(cpu, 3),
+                    'rss_pico_mb': max(metricas['rss_pico_mb'], metricas['rss_pico_filhos_mb']),
+                    'unidades': n,
+                    'por_segundo': round(n / parede, 1) if parede > 0 else None,
+                    'fases': {nome: f['segundos'] for nome, f in metricas['fases'].items()},
+                }
+    return medidas
+
+
+def regressoes(resultado, baseline, tolerancia):
+    """Lista de (escala, etapa, vazão, vazão da baseline) que caíram mais que a tolerância."""
+    lista = []
+    for escala, dados in resultado['escalas'].items():
+        base = baseline.get('escalas', {}).get(escala)
+        if base is None:
+            continue
+        for nome, m in dados['etapas'].items():
+            b = base['etapas'].get(nome)
+            if b is None or not b['por_segundo'] or m['por_segundo'] is None:
+                continue
+            if m['por_segundo'] < b['por_segundo'] * (1 - tolerancia):
+                lista.append((escala, nome, m['por_segundo'], b['por_segundo']))
+    return lista
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mede a vazão das etapas da pipeline sobre cargas sintéticas.')
+    parser.add_argument('--escalas', nargs='+', default=ESCALAS,
+                        help=f'escalas no formato CARROSxDIAS (padrão: {" ".join(ESCALAS)})')
+    parser.add_argument('--trabalho', default=str(RAIZ / '.benchmark'),
+                        help='pasta das cargas geradas e dos resultados (padrão: .benchmark/)')
+    parser.add_argument('--baseline', default=None,
+                        help='arquivo da baseline (padrão: <trabalho>/baseline.json)')
+    parser.add_argument('--salvar-baseline', action='store_true',
+                        help='grava o resultado desta execução como nova baseline')
+    parser.add_argument('--tolerancia', type=float, default=0.25,
+                        help='queda de vazão aceita em relação à baseline (padrão: 0.25)')
+    parser.add_argument('-p', '--processos', type=int, default=1,
+                        help='processos da etapa 03 (0 = todos os núcleos)')
+    parser.add_argument('--repeticoes', type=int, default=1,
+                        help='execuções de cada escala; vale o melhor tempo (padrão: 1)')
+    parser.add_argument('--semente', type=int, default=0, help='semente das cargas geradas (padrão: 0)')
+    args = parser.parse_args()
+
+    trabalho = Path(args.trabalho)
+    baseline_arq = Path(args.baseline) if args.baseline else trabalho / 'baseline.json'
+
+    resultado = {
+        'maquina': {'python': platform.python_version(), 'sistema': platform.platform(),
+                    'processador': platform.processor() or platform.machine()},
+        'processos': args.processos,
+        'escalas': {},
+    }
+    for escala in args.escalas:
+        carros, dias = (int(x) for x in escala.lower().split('x'))
+        pasta = trabalho / escala
+        resumo = preparar_carga(pasta, carros, dias, args.semente)
+        medidas = medir_escala(pasta, resumo, args.processos, args.repeticoes)
+        resultado['escalas'][escala] = {'registros': resumo['registros'], 'etapas': medidas}
+
+        print(f'\nEscala {escala} ({resumo["registros"]} registros)')
+        for nome, m in medidas.items():
+            print(f'  {nome:<14} {m["segundos"]:8.2f} s  {m["cpu"]:8.2f} s CPU  {m["rss_pico_mb"]:7.0f} MB'
+                  f'  {m["por_segundo"]:>12} /s')
+
+    trabalho.mkdir(parents=True, exist_ok=True)
+    with open(trabalho / 'resultado.json', 'w') as f:
+        json.dump(resultado, f, indent=2)
+
+    if args.salvar_baseline:
+        with open(baseline_arq, 'w') as f:
+            json.dump(resultado, f, indent=2)
+        print(f'\nBaseline gravada em {baseline_arq}')
+        return
+
+    if not baseline_arq.exists():
+        print(f'\nSem baseline em {baseline_arq}; use --salvar-baseline para gravar uma.')
+        return
+    with open(baseline_arq, 'r') as f:
+        baseline = json.load(f)
+    lista = regressoes(resultado, baseline, args.tolerancia)
+    if lista:
+        print(f'\nRegressões de vazão (mais de {args.tolerancia:.0%} abaixo da baseline):')
+        for escala, nome, atual, base in lista:
+            print(f'  {escala} {nome}: {atual} /s (baseline {base} /s)')
+        sys.exit(1)
+    print('\nSem regressões em relação à baseline.')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Gera uma carga sintética de snapshots SPPO, reproduzível, para testar e medir a pipeline.
+
+A partir do feed GTFS (stops, trips, routes, frequencies) e dos pontos finais
+de cada linha (pontos_finais.json), monta um trajeto por linha ligando os
+pontos finais pelas paradas que ficam no caminho entre eles, distribui a
+frota entre as linhas pela demanda do frequencies.txt e simula cada carro
+indo e voltando entre os pontos finais (com pausas nos terminais e ruído de
+GPS) nas horas em que a linha precisa dele.
+
+Pasta gerada:
+    sppo/registros_AAAA-MM-DD-HH.json   um arquivo por hora (mesmo layout lido pela etapa 02)
+    viacoes.csv                         prefixo -> viação dos carros gerados
+    gtfs/                               cópia do feed, com um stop_times.txt dos trajetos gerados
+    carga.json                          parâmetros e totais da carga
+
+Os registros seguem o formato da API: coordenadas com vírgula decimal e
+datahora em milissegundos (texto). O mesmo conjunto de parâmetros (incluindo
+a semente) gera sempre os mesmos arquivos.
+"""
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import argparse
+import json
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(RAIZ / 'src'))
+
+from snapshots_sppo import FUSO, nome_snapshot
+
+# Metros por grau (aproximação local, suficiente para montar os trajetos)
+M_LAT = 110_540.0
+M_LON = 111_320.0
+
+# Largura do corredor (m) em que as paradas entram no trajeto e distância mínima entre elas
+LARGURA_CORREDOR = 400.0
+ESPACO_PARADAS = 300.0
+
+# Velocidade média (km/h) fora e dentro dos horários de pico
+VELOCIDADE_LIVRE = 22.0
+VELOCIDADE_PICO = 15.0
+HORAS_PICO = frozenset([6, 7, 8, 17, 18, 19])
+
+# Pausa nos pontos finais (minutos)
+PAUSA_MIN, PAUSA_MAX = 3.0, 12.0
+
+# Consórcios (primeira letra da ordem) e número de empresas sintéticas
+CONSORCIOS = 'ABCD'
+EMPRESAS = 24
+
+
+def plano(lat, lon, lat0):
+    """Coordenadas em metros num plano local (x para leste, y para norte)."""
+    return np.asarray(lon) * M_LON * np.cos(np.radians(lat0)), np.asarray(lat) * M_LAT
+
+
+def trajeto_entre(a, b, paradas, lat0):
+    """
+    Paradas (índices em `paradas`) no caminho de a até b: as que ficam no
+    corredor entre os dois pontos, em ordem de avanço, com espaçamento mínimo.
+    """
+    ax, ay = plano(a[0], a[1], lat0)
+    bx, by = plano(b[0], b[1], lat0)
+    dx, dy = bx - ax, by - ay
+    comp = np.hypot(dx, dy)
+    if comp < 1:
+        return np.zeros(0, dtype=np.int64)
+    # projeção ao longo do segmento (m) e distância ao segmento
+    ao_longo = ((paradas['x'] - ax) * dx + (paradas['y'] - ay) * dy) / comp
+    lateral = np.abs((paradas['x'] - ax) * dy - (paradas['y'] - ay) * dx) / comp
+    dentro = np.flatnonzero((ao_longo > ESPACO_PARADAS) & (ao_longo < comp - ESPACO_PARADAS)
+                            & (lateral < LARGURA_CORREDOR))
+    dentro = dentro[np.argsort(ao_longo[dentro], kind='stable')]
+    escolhidas, ultimo = [], 0.0
+    for k in dentro:
+        if ao_longo[k] - ultimo >= ESPACO_PARADAS:
+            escolhidas.append(k)
+            ultimo = ao_longo[k]
+    return np.asarray(escolhidas, dtype=np.int64)
+
+
+def montar_trajetos(pontos_finais, stops, rng):
+    """
+    Trajeto de ida de cada linha como (ids das paradas, lat, lon). Linhas com
+    dois pontos finais vão de um ao outro; linhas com um só vão até uma parada
+    a 6-12 km dele e voltam.
+    """
+    lat0 = float(stops['stop_lat'].mean())
+    x, y = plano(stops['stop_lat'].to_numpy(), stops['stop_lon'].to_numpy(), lat0)
+    paradas = {'x': x, 'y': y}
+    por_coordenada = {(round(a, 6), round(b, 6)): s for s, a, b in
+                      zip(stops['stop_id'], stops['stop_lat'], stops['stop_lon'])}
+
+    trajetos = {}
+    for linha in sorted(pontos_finais):
+        pf = pontos_finais[linha]
+        if not pf:
+            continue
+        a = pf[0]
+        if len(pf) >= 2:
+            b = pf[1]
+        else:
+            ax, ay = plano(a[0], a[1], lat0)
+            dist = np.hypot(x - ax, y - ay)
+            candidatas = np.flatnonzero((dist > 6000) & (dist < 12000))
+            if not len(candidatas):
+                continue
+            k = candidatas[rng.integers(len(candidatas))]
+            b = [float(stops['stop_lat'].iat[k]), float(stops['stop_lon'].iat[k])]
+        meio = trajeto_entre(a, b, paradas, lat0)
+        ids = ([por_coordenada.get((round(a[0], 6), round(a[1], 6)))]
+               + stops['stop_id'].to_numpy()[meio].tolist()
+               + [por_coordenada.get((round(b[0], 6), round(b[1], 6)))])
+        lat = np.concatenate([[a[0]], stops['stop_lat'].to_numpy()[meio], [b[0]]])
+        lon = np.concatenate([[a[1]], stops['stop_lon'].to_numpy()[meio], [b[1]]])
+        trajetos[linha] = (ids, lat, lon)
+    return trajetos
+
+
+def segundos_gtfs(hora):
+    """'25:30:00' -> segundos desde o início do dia de serviço."""
+    h, m, s = (int(p) for p in hora.split(':'))
+    return h * 3600 + m * 60 + s
+
+
+def partidas_por_hora(gtfs, linhas):
+    """Partidas por hora do dia (array 24) de cada linha, pelo frequencies.txt."""
+    rotas = pd.read_csv(gtfs / 'routes.txt', dtype=str, usecols=['route_id', 'route_short_name'])
+    viagens = pd.read_csv(gtfs / 'trips.txt', dtype=str, usecols=['trip_id', 'route_id'])
+    freq = pd.read_csv(gtfs / 'frequencies.txt', dtype={'trip_id': str})
+    freq = freq.merge(viagens, on='trip_id').merge(rotas, on='route_id')
+
+    partidas = {linha: np.zeros(24) for linha in linhas}
+    for linha, ini, fim, intervalo in zip(freq['route_short_name'], freq['start_time'],
+                                          freq['end_time'], freq['headway_secs']):
+        if linha not in partidas or intervalo <= 0:
+            continue
+        s0, s1 = segundos_gtfs(ini), segundos_gtfs(fim)
+        for h in range(s0 // 3600, (s1 + 3599) // 3600):
+            sobreposicao = min(s1, (h + 1) * 3600) - max(s0, h * 3600)
+            if sobreposicao > 0:
+                partidas[linha][h % 24] += sobreposicao / intervalo
+    return partidas
+
+
+def distribuir_frota(carros, partidas, rng):
+    """Número de carros de cada linha, proporcional às partidas na hora de pico."""
+    linhas = sorted(partidas)
+    # linhas sem frequências recebem o peso da mediana
+    pico = np.array([partidas[l].max() for l in linhas])
+    pico[pico == 0] = np.median(pico[pico > 0]) if (pico > 0).any() else 1.0
+    if carros < len(linhas):
+        # frota menor que o número de linhas: sorteia as linhas atendidas pelo peso
+        atendidas = rng.choice(len(linhas), size=carros, replace=False, p=pico / pico.sum())
+        frota = np.zeros(len(linhas), dtype=np.int64)
+        frota[atendidas] = 1
+    else:
+        # maiores restos, com pelo menos um carro por linha
+        cota = 1 + pico / pico.sum() * (carros - len(linhas))
+        frota = np.floor(cota).astype(np.int64)
+        frota[np.argsort(frota - cota, kind='stable')[:carros - frota.sum()]] += 1
+    return dict(zip(linhas, frota.tolist()))
+
+
+def horas_ativas(partidas_linha, n_carros):
+    """Matriz (carros x 24) das horas em que cada carro da linha circula."""
+    if partidas_linha.max() == 0:
+        ativos = np.where((np.arange(24) >= 5) & (np.arange(24) < 23), n_carros, 0)
+    else:
+        ativos = np.ceil(n_carros * partidas_linha / partidas_linha.max()).astype(np.int64)
+    return np.arange(n_carros)[:, None] < ativos[None, :]
+
+
+def simular_turno(inicio, fim, trajeto, sentido, intervalo, ruido, rng):
+    """
+    Registros (datahora em s, lat, lon, velocidade) de um carro circulando de
+    `inicio` a `fim` (s), partindo do ponto final `sentido` (0 ou 1).
+    """
+    _, lat, lon = trajeto
+    lat0 = float(lat.mean())
+    x, y = plano(lat, lon, lat0)
+    distancias = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+    comprimento = max(distancias[-1], 1.0)
+
+    # Linha do tempo de pausas e percursos, como (instante, posição na volta em m)
+    tempos, posicoes, velocidades = [inicio], [0.0], []
+    t, s = inicio, 0.0
+    while t < fim:
+        pausa = rng.uniform(PAUSA_MIN, PAUSA_MAX) * 60
+        hora = datetime.fromtimestamp(t, FUSO).hour
+        media = VELOCIDADE_PICO if hora in HORAS_PICO else VELOCIDADE_LIVRE
+        v = float(np.clip(rng.normal(media, 3), 8, 40))
+        t += pausa
+        tempos.append(t); posicoes.append(s); velocidades.append(0.0)
+        t += comprimento / (v / 3.6)
+        s += comprimento
+        tempos.append(t); posicoes.append(s); velocidades.append(v)
+    tempos, posicoes, velocidades = np.array(tempos), np.array(posicoes), np.array(velocidades)
+
+    # Instantes dos envios de GPS
+    n = int((fim - inicio) / intervalo) + 1
+    instantes = inicio + np.cumsum(np.full(n, float(intervalo)) + rng.uniform(-0.2, 0.2, n) * intervalo)
+    instantes = instantes[instantes < fim]
+
+    s = np.interp(instantes, tempos, posicoes)
+    trecho = np.clip(np.searchsorted(tempos, instantes, side='right') - 1, 0, len(velocidades) - 1)
+    # pernas pares vão de um ponto final ao outro, as ímpares voltam
+    perna = np.floor(s / comprimento).astype(np.int64)
+    d = s - perna * comprimento
+    d = np.where((perna + sentido) % 2 == 0, d, comprimento - d)
+
+    px = np.interp(d, distancias, x) + rng.normal(0, ruido, len(d))
+    py = np.interp(d, distancias, y) + rng.normal(0, ruido, len(d))
+    v = velocidades[trecho]
+    vel = np.where(v > 0, np.maximum(0, v + rng.normal(0, 5, len(d))), 0.0)
+    return instantes, py / M_LAT, px / (M_LON * np.cos(np.radians(lat0))), vel
+
+
+def registros_json(ordens, linhas, datahora, lat, lon, vel, envio, servidor):
+    """Texto JSON (lista de objetos no formato da API) dos registros dados."""
+    return '[' + ', '.join(
+        f'{{"ordem": "{o}", "latitude": "{a}", "longitude": "{b}", "datahora": "{t}", '
+        f'"velocidade": "{v}", "linha": "{l}", "datahoraenvio": "{e}", "datahoraservidor": "{s}"}}'
+        for o, l, t, a, b, v, e, s in zip(
+            ordens, linhas, datahora.tolist(),
+            np.char.replace(np.char.mod('%.6f', lat), '.', ','),
+            np.char.replace(np.char.mod('%.6f', lon), '.', ','),
+            vel.tolist(), envio.tolist(), servidor.tolist())
+    ) + ']'
+
+
+def empresas_dos_carros(frota, rng):
+    """
+    Ordem (prefixo) de cada carro de cada linha e a tabela de viações.
+    Cada linha é operada por uma empresa; a empresa NN usa as ordens
+    <consórcio>NN000 a <consórcio>NN999.
+    """
+    empresas = [(CONSORCIOS[k % len(CONSORCIOS)], 10 + k) for k in range(EMPRESAS)]
+    usados = [0] * EMPRESAS
+    ordens = {}
+    for linha in sorted(frota):
+        k = int(rng.integers(EMPRESAS))
+        letra, codigo = empresas[k]
+        ordens[linha] = []
+        for _ in range(frota[linha]):
+            ordens[linha].append(f'{letra}{codigo:02d}{usados[k] % 1000:03d}')
+            usados[k] += 1
+    viacoes = [(f'{codigo:02d}{metade}', f'Viação Sintética {codigo:02d}')
+               for _, codigo in empresas for metade in ('000', '500')]
+    return ordens, viacoes
+
+
+def gravar_gtfs(origem, destino, trajetos):
+    """Copia o feed e grava um stop_times.txt com os trajetos gerados (ida na direção 0, volta na 1)."""
+    destino.mkdir(parents=True, exist_ok=True)
+    for arquivo in origem.glob('*.txt'):
+        if arquivo.name != 'stop_times.txt':
+            shutil.copyfile(arquivo, destino / arquivo.name)
+
+    rotas = pd.read_csv(origem / 'routes.txt', dtype=str, usecols=['route_id', 'route_short_name'])
+    viagens = pd.read_csv(origem / 'trips.txt', dtype={'trip_id': str, 'route_id': str})
+    viagens = viagens.merge(rotas, on='route_id')
+    with open(destino / 'stop_times.txt', 'w', newline='') as f:
+        f.write('trip_id,arrival_time,departure_time,stop_id,stop_sequence\n')
+        for trip, linha, direcao in zip(viagens['trip_id'], viagens['route_short_name'], viagens['direction_id']):
+            if linha not in trajetos:
+                continue
+            ids = [s for s in trajetos[linha][0] if s is not None]
+            if direcao == 1:
+                ids = ids[::-1]
+            f.write(''.join(f'{trip},00:00:00,00:00:00,{s},{k}\n' for k, s in enumerate(ids, 1)))
+
+
+def gerar(saida, gtfs, pontos_finais, carros, dias, inicio, intervalo, ruido, semente):
+    """Gera a carga em `saida` e retorna o resumo gravado em carga.json."""
+    saida = Path(saida)
+    gtfs = Path(gtfs)
+    rng = np.random.default_rng(semente)
+
+    stops = pd.read_csv(gtfs / 'stops.txt', dtype={'stop_id': str}, usecols=['stop_id', 'stop_lat', 'stop_lon'])
+    with open(pontos_finais, 'r') as f:
+        pf = json.load(f)
+    trajetos = montar_trajetos(pf, stops, rng)
+    partidas = partidas_por_hora(gtfs, trajetos)
+    frota = distribuir_frota(carros, partidas, rng)
+    ordens, viacoes = empresas_dos_carros(frota, rng)
+
+    gravar_gtfs(gtfs, saida / 'gtfs', trajetos)
+    with open(saida / 'viacoes.csv', 'w', newline='') as f:
+        f.write(''.join(f'{codigo},{nome}\n' for codigo, nome in viacoes))
+
+    pasta = saida / 'sppo'
+    pasta.mkdir(parents=True, exist_ok=True)
+    total = 0
+    for dia in range(dias):
+        data = inicio + timedelta(days=dia)
+        meia_noite = datetime(data.year, data.month, data.day, tzinfo=FUSO).timestamp()
+        partes = []
+        for linha in sorted(ordens):
+            ativas = horas_ativas(partidas[linha], len(ordens[linha]))
+            for c, ordem in enumerate(ordens[linha]):
+                # cada trecho contínuo de horas ativas é um turno, partindo de um ponto final
+                horas = np.flatnonzero(np.diff(np.concatenate([[0], ativas[c].astype(np.int8), [0]])))
+                for h0, h1 in zip(horas[::2], horas[1::2]):
+                    t, lat, lon, vel = simular_turno(meia_noite + h0 * 3600, meia_noite + h1 * 3600,
+                                                     trajetos[linha], (c + h0) % 2, intervalo, ruido, rng)
+                    partes.append((np.full(len(t), ordem, dtype=object), np.full(len(t), linha, dtype=object),
+                                   t, lat, lon, vel))
+        if not partes:
+            continue
+        ordem_, linha_, t, lat, lon, vel = (np.concatenate(c) for c in zip(*partes))
+        datahora = np.round(t * 1000).astype(np.int64)
+        envio = datahora + rng.integers(0, 3000, len(t))
+        servidor = envio + rng.integers(200, 60_000, len(t))
+        hora = ((datahora // 1000 - int(meia_noite)) // 3600).clip(0, 23)
+
+        # cada arquivo horário vem na ordem de chegada ao servidor
+        for h in range(24):
+            idx = np.flatnonzero(hora == h)
+            idx = idx[np.argsort(servidor[idx], kind='stable')]
+            with open(pasta / nome_snapshot(data, h, compressao=None), 'w') as f:
+                f.write(registros_json(ordem_[idx], linha_[idx], datahora[idx], lat[idx], lon[idx],
+                                       np.round(vel[idx]).astype(np.int64), envio[idx], servidor[idx]))
+        total += len(t)
+        print(f'{data}: {len(t)} registros')
+
+    resumo = {
+        'parametros': {
+            'carros': carros, 'dias': dias, 'inicio': inicio.isoformat(), 'intervalo': intervalo,
+            'ruido': ruido, 'semente': semente,
+        },
+        'fim': (inicio + timedelta(days=dias - 1)).isoformat(),
+        'linhas': sum(1 for n in frota.values() if n),
+        'carros': sum(frota.values()),
+        'registros': total,
+    }
+    with open(saida / 'carga.json', 'w') as f:
+        json.dump(resumo, f, indent=2)
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera snapshots SPPO sintéticos a partir do GTFS.')
+    parser.add_argument('saida', help='pasta de trabalho gerada (sppo/, viacoes.csv, gtfs/)')
+    parser.add_argument('--gtfs', default=str(RAIZ / 'data' / 'gtfs'), help='feed GTFS (padrão: data/gtfs)')
+    parser.add_argument('--pontos-finais', default=str(RAIZ / 'data_input' / 'pontos_finais.json'),
+                        help='pontos finais de cada linha (padrão: data_input/pontos_finais.json)')
+    parser.add_argument('--carros', type=int, default=300, help='tamanho da frota (padrão: 300)')
+    parser.add_argument('--dias', type=int, default=1, help='número de dias (padrão: 1)')
+    parser.add_argument('--inicio', type=date.fromisoformat, default=date(2025, 11, 1),
+                        help='primeiro dia, AAAA-MM-DD (padrão: 2025-11-01)')
+    parser.add_argument('--intervalo', type=float, default=30.0,
+                        help='intervalo médio entre envios de GPS de um carro, em s (padrão: 30)')
+    parser.add_argument('--ruido', type=float, default=10.0, help='desvio do ruído de GPS, em m (padrão: 10)')
+    parser.add_argument('--semente', type=int, default=0, help='semente do gerador aleatório (padrão: 0)')
+    args = parser.parse_args()
+
+    resumo = gerar(args.saida, args.gtfs, args.pontos_finais, args.carros, args.dias, args.inicio,
+                   args.intervalo, args.ruido, args.semente)
+    print(f"{resumo['carros']} carros em {resumo['linhas']} linhas, {resumo['registros']} registros gravados em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
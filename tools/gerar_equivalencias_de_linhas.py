@@ -1,26 +1,29 @@
-import pandas as pd
+import argparse
 import json
-import time
 import warnings
+import sys
+from pathlib import Path
 
-def criar_mapeamento_desc():
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from cache_gtfs import carregar_tabela
+from metricas import Metricas, adicionar_argumentos, fase
+
+def criar_mapeamento_desc(pasta=".", output_filename="mapeamento_route_desc.json"):
     """
-    Analisa o 'routes.txt' e cria um mapeamento (lista de listas)
+    Analisa o 'routes.txt' (em `pasta`) e cria um mapeamento (lista de listas)
     entre 'route_short_name' e 'route_desc' para todas as linhas
     onde 'route_desc' não é uma string vazia.
     """
-    # Inicia timer para medir tempo de execução
-    inicio_script = time.perf_counter()
-    
     warnings.simplefilter(action='ignore', category=FutureWarning)
     
-    output_filename = "mapeamento_route_desc.json"
-    
     try:
         # Carrega o arquivo de rotas do GTFS
         print("Carregando 'gtfs/routes.txt'...")
-        # Carregamos tudo como string para evitar problemas de tipo
-        routes_df = pd.read_csv("routes.txt", low_memory=False, dtype=str)
+        # Nomes de linha são lidos como string (ver DTYPES em src/cache_gtfs.py)
+        with fase('carregar'):
+            routes_df = carregar_tabela("routes", pasta=pasta)
         print(f"Total de rotas carregadas: {len(routes_df)}")
 
     except FileNotFoundError:
@@ -51,7 +54,7 @@ def criar_mapeamento_desc():
 
         # Salva resultado em arquivo JSON
         print(f"Salvando resultados em '{output_filename}'...")
-        with open(output_filename, 'w', encoding='utf-8') as f:
+        with fase('gravar'), open(output_filename, 'w', encoding='utf-8') as f:
             json.dump(lista_de_mapeamento, f, indent=2, ensure_ascii=False)
         print(f"Sucesso! Mapeamento salvo.")
         
@@ -64,16 +67,22 @@ def criar_mapeamento_desc():
     except Exception as e:
         print(f"Ocorreu um erro durante o processamento: {e}")
 
-    # Finaliza timer e mostra tempo total
-    fim_script = time.perf_counter()
-    tempo_total = fim_script - inicio_script
-    print("\n" + "="*40)
-    print(f"Tempo total de execução: {tempo_total:.4f} segundos")
-    print("="*40)
+    return len(routes_df)
 
 # Executa a função principal quando o script é rodado
 def main():
-    criar_mapeamento_desc()
+    parser = argparse.ArgumentParser(description="Cria o mapeamento entre 'route_short_name' e 'route_desc' do GTFS.")
+    parser.add_argument('--gtfs', default='.', help="pasta com o routes.txt (padrão: pasta atual)")
+    parser.add_argument('--saida', default='mapeamento_route_desc.json',
+                        help='arquivo JSON gerado (padrão: mapeamento_route_desc.json)')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    # Mede o tempo de execução (resumo no fim e, com --metricas, em JSON)
+    with Metricas('equivalencias', args) as metricas:
+        metricas.lidos(Path(args.gtfs) / 'routes.txt')
+        metricas.gravados(args.saida)
+        metricas.registros = criar_mapeamento_desc(args.gtfs, args.saida)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
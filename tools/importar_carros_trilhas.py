@@ -0,0 +1,45 @@
+from pathlib import Path
+import argparse
+import json
+import sys
+import tarfile
+
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from metricas import progresso
+from trilhas import EscritorTrilhas
+
+
+# Percorre os carros de um carros.tgz (ou de uma pasta carros/) como (prefixo, registros)
+def ler_carros(origem):
+    origem = Path(origem)
+    if origem.is_dir():
+        for i in sorted(origem.glob('*.json')):
+            with open(i, 'r') as f:
+                yield i.stem, json.load(f)
+        return
+
+    with tarfile.open(origem, 'r:*') as tar:
+        for membro in tar:
+            if not membro.isfile() or not membro.name.endswith('.json'):
+                continue
+            with tar.extractfile(membro) as f:
+                yield Path(membro.name).stem, json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converte carros.tgz (ou a pasta carros/) para o arquivo colunar de trilhas.')
+    parser.add_argument('origem', help='carros.tgz ou pasta com <prefixo>.json')
+    parser.add_argument('destino', nargs='?', default='carros.trilhas', help='arquivo de trilhas (padrão: carros.trilhas)')
+    args = parser.parse_args()
+
+    with EscritorTrilhas(args.destino) as escritor:
+        for prefixo, registros in progresso(ler_carros(args.origem), 'Carros'):
+            escritor.adicionar(prefixo, registros)
+
+    print(f"{len(escritor.carros)} carros e {escritor.offsets[-1]} registros gravados em {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Converte os snapshots de uma pasta do SPPO para outra compressão.
+
+Cada arquivo que ainda não está no formato pedido é descomprimido, gravado de
+novo (registros_AAAA-MM-DD-HH.json, .json.gz, .json.xz ou .json.zst, ver
+src/snapshots_sppo.py) e conferido: o novo arquivo é lido de volta e só
+substitui o original se o conteúdo for idêntico. Os arquivos são convertidos
+em paralelo. As entradas do manifesto da verificação que descreviam o arquivo
+original passam a descrever o novo, sem precisar verificar de novo a pasta.
+
+Com --manter os originais ficam na pasta; enquanto existirem os dois formatos,
+a etapa 02 lê o de maior preferência (zstd, depois xz, gzip e sem compressão).
+
+Uso:
+    python tools/recomprimir_sppo.py sppo --compressao xz
+    python tools/recomprimir_sppo.py dados/sppo --compressao zstd --nivel 19 -p 4
+"""
+from datetime import date
+from pathlib import Path
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sys
+
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from metricas import Metricas, adicionar_argumentos, progresso
+from snapshots_sppo import (ERROS_LEITURA, EXTENSOES, abrir_snapshot, chave_hora, compressao, disponivel,
+                            gravar_manifesto, gravar_snapshot, ler_manifesto, listar_snapshots, nome_snapshot)
+
+# Nome da opção de linha de comando de cada compressão
+NOMES = {'nenhuma': None, 'gzip': 'gzip', 'xz': 'xz', 'zstd': 'zstd'}
+
+
+def recomprimir(tarefa):
+    """
+    Converte um snapshot: `tarefa` é ((dia, hora), caminho, compressão, nível,
+    manter). Retorna (chave, caminho original, novo caminho, bytes antes, bytes depois).
+    """
+    (dia, hora), caminho, destino_compressao, nivel, manter = tarefa
+    caminho = Path(caminho)
+    try:
+        with abrir_snapshot(caminho) as f:
+            dados = f.read()
+    except ERROS_LEITURA as e:
+        raise RuntimeError(f'{caminho.name}: {e}') from None
+    destino = caminho.with_name(nome_snapshot(dia, hora, destino_compressao))
+    gravar_snapshot(destino, dados, destino_compressao, nivel)
+
+    # Confere o arquivo gravado antes de apagar o original
+    with abrir_snapshot(destino) as f:
+        if hashlib.sha256(f.read()).digest() != hashlib.sha256(dados).digest():
+            destino.unlink()
+            raise RuntimeError(f'{destino.name}: conteúdo diferente do original após a conversão')
+    antes = caminho.stat().st_size
+    if not manter:
+        caminho.unlink()
+    return (dia, hora), str(caminho), str(destino), antes, destino.stat().st_size
+
+
+def atualizar_manifesto(pasta, convertidos):
+    """
+    Passa as entradas do manifesto dos arquivos originais para os convertidos,
+    só quando o convertido é o arquivo lido pela etapa 02 (com --manter, um
+    original de maior preferência continua sendo o lido e fica com a entrada).
+    """
+    manifesto = ler_manifesto(pasta)
+    horas = manifesto.get('horas', {})
+    lidos = listar_snapshots(pasta)
+    atualizadas = 0
+    for (dia, hora), original, destino, antes, _ in convertidos:
+        if lidos.get((dia, hora)) != Path(destino):
+            continue
+        entrada = horas.get(chave_hora(dia, hora))
+        # O original pode já ter sido apagado: compara com o que o manifesto registrou
+        if entrada is None or entrada.get('arquivo') != Path(original).name or entrada.get('tamanho') != antes:
+            continue
+        st = os.stat(destino)
+        entrada.update(arquivo=Path(destino).name, tamanho=st.st_size, mtime_ns=st.st_mtime_ns)
+        atualizadas += 1
+    if atualizadas:
+        gravar_manifesto(pasta, manifesto)
+    return atualizadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converte os snapshots do SPPO para outra compressão.')
+    parser.add_argument('pasta', nargs='?', default='sppo', help='pasta dos snapshots (padrão: sppo/)')
+    parser.add_argument('--compressao', choices=list(NOMES), required=True, help='compressão dos novos arquivos')
+    parser.add_argument('--nivel', type=int, default=None,
+                        help='nível da compressão (padrão: o da coleta, ver snapshots_sppo.NIVEIS)')
+    parser.add_argument('--inicio', type=date.fromisoformat, default=None, help='primeiro dia convertido, AAAA-MM-DD')
+    parser.add_argument('--fim', type=date.fromisoformat, default=None, help='último dia convertido, AAAA-MM-DD')
+    parser.add_argument('-p', '--processos', type=int, default=0,
+                        help='número de processos (padrão: 0, todos os núcleos)')
+    parser.add_argument('--manter', action='store_true', help='não apaga os arquivos originais')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    destino_compressao = NOMES[args.compressao]
+    if not disponivel(destino_compressao):
+        parser.error(f'a compressão {args.compressao} requer o pacote zstandard')
+
+    pasta = Path(args.pasta)
+    tarefas = [(chave, str(caminho), destino_compressao, args.nivel, args.manter)
+               for chave, caminho in sorted(listar_snapshots(pasta).items())
+               if compressao(caminho) != destino_compressao
+               and (args.inicio is None or chave[0] >= args.inicio) and (args.fim is None or chave[0] <= args.fim)]
+    if not tarefas:
+        print(f'Nenhum snapshot a converter para {args.compressao} em {pasta}')
+        return
+
+    # Com --manter, o novo arquivo só é lido no lugar do original se tiver preferência maior
+    preferencia = list(EXTENSOES)
+    if args.manter and any(preferencia.index(compressao(t[1])) > preferencia.index(destino_compressao)
+                           for t in tarefas):
+        print('Aviso: os originais em formatos de maior preferência continuam sendo os lidos pela etapa 02',
+              file=sys.stderr)
+
+    processos = args.processos or os.cpu_count()
+    convertidos = []
+    falhas = 0
+    with Metricas('recompressao', args) as metricas:
+        metricas.gravados(pasta)
+        with multiprocessing.Pool(min(processos, len(tarefas))) as pool:
+            resultados = pool.imap_unordered(recomprimir, tarefas)
+            for _ in progresso(range(len(tarefas)), 'Arquivos'):
+                try:
+                    convertidos.append(next(resultados))
+                except Exception as e:
+                    print(f'Falhou: {e}', file=sys.stderr)
+                    falhas += 1
+
+    antes = sum(c[3] for c in convertidos)
+    depois = sum(c[4] for c in convertidos)
+    if convertidos:
+        print(f'{len(convertidos)} arquivos convertidos para {args.compressao}: '
+              f'{antes / 1e6:.1f} MB -> {depois / 1e6:.1f} MB ({depois / antes:.1%})')
+    atualizadas = atualizar_manifesto(pasta, convertidos)
+    if atualizadas:
+        print(f'{atualizadas} entradas do manifesto atualizadas')
+    if falhas:
+        print(f'{falhas} arquivos não foram convertidos', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Servidor local que imita a API do SPPO a partir de snapshots gravados.
+
+Responde GET /gps/sppo?dataInicial=AAAA-MM-DD HH:MM:SS&dataFinal=... com os
+registros dos snapshots da pasta (qualquer formato lido pela etapa 02) cuja
+datahora está entre as duas datas (dataFinal inclusive até o fim do segundo),
+em horário de Brasília. Mantém as conexões abertas (HTTP/1.1) e comprime a
+resposta com gzip quando o cliente aceita.
+
+Para testar as novas tentativas do coletor, --falhas faz uma fração das
+requisições responder 503 (ou 429 com Retry-After) e --lento atrasa cada
+resposta.
+
+Uso:
+    python tools/servidor_sppo_stub.py --pasta gravados/sppo --porta 8000 --falhas 0.2
+    python src/00_coletar_sppo.py --url http://127.0.0.1:8000/gps/sppo --inicio 2025-11-01 --fim 2025-11-01
+"""
+from datetime import datetime
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import gzip
+import json
+import random
+import sys
+import threading
+import time
+
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from snapshots_sppo import FUSO, abrir_snapshot, listar_snapshots
+
+
+class Gravados:
+    """Registros dos snapshots da pasta, carregados por hora sob demanda."""
+
+    def __init__(self, pasta):
+        self.snapshots = listar_snapshots(pasta)
+        # Cache de cada instância (um lru_cache no método seria compartilhado e prenderia as instâncias)
+        self.hora = lru_cache(maxsize=48)(self._ler_hora)
+
+    def _ler_hora(self, dia, hora):
+        caminho = self.snapshots.get((dia, hora))
+        if caminho is None:
+            return []
+        with abrir_snapshot(caminho) as f:
+            return json.load(f)
+
+    def entre(self, inicio, fim):
+        """Registros com datahora (ms) em [inicio, fim]."""
+        # Um registro pode ter sido gravado no arquivo da hora anterior ou seguinte à da sua datahora
+        hora = datetime.fromtimestamp(inicio / 1000, FUSO).replace(minute=0, second=0, microsecond=0).timestamp()
+        registros = []
+        t = hora - 3600
+        while t <= fim / 1000 + 3600:
+            h = datetime.fromtimestamp(t, FUSO)
+            registros += [r for r in self.hora(h.date(), h.hour) if inicio <= int(r['datahora']) <= fim]
+            t += 3600
+        return sorted(registros, key=lambda r: int(r['datahora']))
+
+
+def criar_servidor(pasta, porta, falhas=0.0, lento=0.0, semente=0):
+    gravados = Gravados(pasta)
+    sorteio = random.Random(semente)
+    trava = threading.Lock()
+    contagem = {'requisicoes': 0, 'falhas': 0, 'conexoes': 0}
+
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with trava:
+                contagem['conexoes'] += 1
+
+        def responder(self, status, corpo=b'', cabecalhos=()):
+            self.send_response(status)
+            for nome, valor in cabecalhos:
+                self.send_header(nome, valor)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_GET(self):
+            partes = urlsplit(self.path)
+            with trava:
+                contagem['requisicoes'] += 1
+                falhar = sorteio.random() < falhas
+            if lento:
+                time.sleep(lento)
+            if partes.path.rstrip('/') != '/gps/sppo':
+                self.responder(404)
+                return
+            if falhar:
+                with trava:
+                    contagem['falhas'] += 1
+                if sorteio.random() < 0.5:
+                    self.responder(503)
+                else:
+                    self.responder(429, cabecalhos=[('Retry-After', '1')])
+                return
+
+            q = parse_qs(partes.query)
+            try:
+                inicio, fim = (datetime.strptime(q[c][0], '%Y-%m-%d %H:%M:%S').replace(tzinfo=FUSO)
+                               for c in ('dataInicial', 'dataFinal'))
+            except (KeyError, ValueError):
+                self.responder(400)
+                return
+            registros = gravados.entre(int(inicio.timestamp() * 1000), int(fim.timestamp() * 1000) + 999)
+            corpo = json.dumps(registros).encode()
+            cabecalhos = [('Content-Type', 'application/json')]
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                corpo = gzip.compress(corpo, compresslevel=1)
+                cabecalhos.append(('Content-Encoding', 'gzip'))
+            self.responder(200, corpo, cabecalhos)
+
+        def log_message(self, *_):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), Manipulador)
+    servidor.contagem = contagem
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local que imita a API do SPPO a partir de snapshots gravados.')
+    parser.add_argument('--pasta', default='sppo', help='pasta com os snapshots gravados (padrão: sppo/)')
+    parser.add_argument('--porta', type=int, default=8000, help='porta local (padrão: 8000)')
+    parser.add_argument('--falhas', type=float, default=0.0,
+                        help='fração das requisições respondidas com 503 ou 429 (padrão: 0)')
+    parser.add_argument('--lento', type=float, default=0.0, help='segundos de atraso em cada resposta')
+    parser.add_argument('--semente', type=int, default=0, help='semente do sorteio das falhas')
+    args = parser.parse_args()
+
+    servidor = criar_servidor(args.pasta, args.porta, args.falhas, args.lento, args.semente)
+    print(f'Servindo {len(listar_snapshots(args.pasta))} snapshots em http://127.0.0.1:{args.porta}/gps/sppo')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        c = servidor.contagem
+        print(f"{c['requisicoes']} requisições ({c['falhas']} com falha) em {c['conexoes']} conexões")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,258 @@
+"""
+Verifica a integridade dos snapshots do SPPO, registro a registro.
+
+Lê cada arquivo da pasta (com ou sem compressão) em streaming, em paralelo, e
+conta por hora: registros, carros distintos, pings duplicados (mesma ordem e
+datahora), coordenadas inválidas (ilegíveis ou fora da região do Rio),
+registros com datahora fora da hora do arquivo e a maior lacuna (s) sem
+nenhum registro dentro da hora. Cada hora fica:
+
+    ok          sem problemas
+    suspeita    lacuna longa, muitas coordenadas inválidas ou duplicados, ou
+                poucos carros em relação à mediana da mesma hora nos outros dias
+    vazia       arquivo sem registros
+    corrompida  arquivo ilegível (compressão ou JSON truncados)
+
+O resultado vai para o manifesto da pasta (ver snapshots_sppo.py), que a
+etapa 02 usa com --manifesto para pular as horas ruins. Arquivos que não
+mudaram desde a verificação anterior não são lidos de novo.
+
+Uso:
+    python tools/verificar_dados_sppo.py
+    python tools/verificar_dados_sppo.py dados/sppo --inicio 2025-11-01 --fim 2025-11-07 -p 4
+"""
+from datetime import date, datetime, timedelta
 from pathlib import Path
+import argparse
+import math
+import multiprocessing
+import os
+import statistics
+import sys
+import ijson
 
-dir = Path('sppo')
-
-# Inicializa contadores para cada dia de outubro e novembro
-oct = [0 for _ in range(0, 31)]
-nov = [0 for _ in range(0, 30)]
-
-# Conta arquivos por dia e mês
-for i in dir.iterdir():
-    mes = int(str(i)[20:22])
-    dia = int(str(i)[23:25])
-    if mes == 10:
-        oct[dia - 1] += 1
-    elif mes == 11:
-        nov[dia - 1] += 1
-
-# Verifica se todos os dias de outubro têm 24 arquivos (um por hora)
-for i in range(0, 31):
-    if oct[i] == 24:
-        print('oct', i + 1)
-    else:
-        print('------------')
-    
-# Verifica se todos os dias de novembro têm 24 arquivos (um por hora)
-for i in range(0, 30):
-    if nov[i] == 24:
-        print('nov', i + 1)
+# Permite importar os módulos da pipeline em src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from metricas import Metricas, adicionar_argumentos, progresso
+from snapshots_sppo import (ERROS_LEITURA, FUSO, abrir_snapshot, chave_hora, entrada_atual, gravar_manifesto,
+                            ler_manifesto, listar_snapshots)
+
+# Região aceita para as coordenadas (graus), com folga em volta do município
+LATITUDE = (-23.2, -22.6)
+LONGITUDE = (-43.9, -43.0)
+
+# Limites acima (ou abaixo) dos quais a hora é marcada como suspeita
+LACUNA_MAX_S = 300
+FRACAO_INVALIDAS = 0.01
+FRACAO_DUPLICADOS = 0.05
+COBERTURA_MIN = 0.5
+
+
+def coordenada(texto):
+    """Coordenada da API (texto com vírgula decimal) em float, ou None se ilegível."""
+    try:
+        valor = float(str(texto).replace(',', '.'))
+    except ValueError:
+        return None
+    return valor if math.isfinite(valor) else None
+
+
+def examinar(item):
+    """
+    Estatísticas de um snapshot: `item` é ((dia, hora), caminho). Os registros
+    são lidos um a um (ijson), sem carregar o arquivo inteiro.
+    """
+    (dia, hora), caminho = item
+    st = os.stat(caminho)
+    inicio = int(datetime(dia.year, dia.month, dia.day, hora, tzinfo=FUSO).timestamp() * 1000)
+    fim = inicio + 3600 * 1000
+
+    registros = duplicados = invalidas = fora = 0
+    carros = set()
+    vistos = set()
+    instantes = []
+    erro = None
+    try:
+        with abrir_snapshot(caminho) as f:
+            for r in ijson.items(f, 'item'):
+                registros += 1
+                ordem = r.get('ordem')
+                try:
+                    datahora = int(r.get('datahora'))
+                except (TypeError, ValueError):
+                    datahora = None
+                chave = (ordem, datahora)
+                if chave in vistos:
+                    duplicados += 1
+                    continue
+                vistos.add(chave)
+                carros.add(ordem)
+
+                lat, lon = coordenada(r.get('latitude')), coordenada(r.get('longitude'))
+                if (lat is None or lon is None or not LATITUDE[0] <= lat <= LATITUDE[1]
+                        or not LONGITUDE[0] <= lon <= LONGITUDE[1]):
+                    invalidas += 1
+                if datahora is None or not inicio <= datahora < fim:
+                    fora += 1
+                else:
+                    instantes.append(datahora)
+    except (ijson.JSONError, *ERROS_LEITURA) as e:
+        erro = f'{type(e).__name__}: {e}'
+
+    # Maior intervalo sem registros dentro da hora, contando o começo e o fim
+    instantes.sort()
+    bordas = [inicio] + instantes + [fim]
+    lacuna = max(b - a for a, b in zip(bordas, bordas[1:])) / 1000
+
+    return chave_hora(dia, hora), {
+        'arquivo': Path(caminho).name,
+        'tamanho': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'registros': registros,
+        'carros': len(carros),
+        'duplicados': duplicados,
+        'coordenadas_invalidas': invalidas,
+        'fora_da_hora': fora,
+        'maior_lacuna_s': round(lacuna, 1),
+        'erro': erro,
+    }
+
+
+def classificar(horas):
+    """Preenche a situação e os motivos de cada hora (a cobertura depende de todas)."""
+    # Carros de cada hora do dia, entre as horas legíveis
+    carros_por_hora = {}
+    for chave, e in horas.items():
+        if e['erro'] is None and e['registros']:
+            carros_por_hora.setdefault(chave[-2:], []).append(e['carros'])
+
+    for chave, e in horas.items():
+        motivos = []
+        if e['erro'] is not None:
+            situacao = 'corrompida'
+            motivos.append(e['erro'])
+        elif e['registros'] == 0:
+            situacao = 'vazia'
+        else:
+            n = e['registros']
+            if e['maior_lacuna_s'] > LACUNA_MAX_S:
+                motivos.append(f"lacuna de {e['maior_lacuna_s']:.0f} s")
+            if e['coordenadas_invalidas'] > FRACAO_INVALIDAS * n:
+                motivos.append(f"{e['coordenadas_invalidas']} coordenadas inválidas")
+            if e['duplicados'] > FRACAO_DUPLICADOS * n:
+                motivos.append(f"{e['duplicados']} duplicados")
+            # Comparada só com os outros dias, para uma hora ruim não puxar a própria referência
+            outros = list(carros_por_hora[chave[-2:]])
+            outros.remove(e['carros'])
+            mediana = statistics.median(outros) if outros else 0
+            if e['carros'] < COBERTURA_MIN * mediana:
+                motivos.append(f"{e['carros']} carros, mediana da hora {mediana:.0f}")
+            situacao = 'suspeita' if motivos else 'ok'
+        e['situacao'] = situacao
+        e['motivos'] = motivos
+
+
+def verificar(args):
+    pasta = Path(args.pasta)
+    snapshots = listar_snapshots(pasta)
+    if args.inicio or args.fim:
+        snapshots = {k: c for k, c in snapshots.items()
+                     if (args.inicio is None or k[0] >= args.inicio) and (args.fim is None or k[0] <= args.fim)}
+    if not snapshots:
+        print(f'Nenhum snapshot em {pasta}')
+        sys.exit(1)
+
+    # Reaproveita as entradas de arquivos que não mudaram desde a última verificação
+    manifesto_anterior = ler_manifesto(pasta).get('horas', {})
+    anterior = {} if args.refazer else manifesto_anterior
+    horas = {}
+    pendentes = []
+    for (dia, hora), caminho in sorted(snapshots.items()):
+        entrada = anterior.get(chave_hora(dia, hora))
+        if entrada is not None and entrada_atual(entrada, caminho):
+            horas[chave_hora(dia, hora)] = entrada
+        else:
+            pendentes.append(((dia, hora), str(caminho)))
+
+    processos = args.processos or os.cpu_count()
+    print(f'{len(pendentes)} arquivos a verificar ({len(horas)} sem mudanças), {processos} processos')
+    if processos > 1 and len(pendentes) > 1:
+        with multiprocessing.Pool(min(processos, len(pendentes))) as pool:
+            for chave, entrada in progresso(pool.imap_unordered(examinar, pendentes), 'Arquivos',
+                                            total=len(pendentes)):
+                horas[chave] = entrada
     else:
-        print('------------')
+        for chave, entrada in progresso(map(examinar, pendentes), 'Arquivos', total=len(pendentes)):
+            horas[chave] = entrada
+
+    # Horas fora do período verificado continuam no manifesto enquanto o arquivo
+    # existir; as do período sem arquivo (apagado) saem dele
+    for chave, entrada in manifesto_anterior.items():
+        dia = date.fromisoformat(chave[:10])
+        fora = (args.inicio is not None and dia < args.inicio) or (args.fim is not None and dia > args.fim)
+        if fora and (pasta / entrada['arquivo']).exists():
+            horas[chave] = entrada
+    classificar(horas)
+
+    manifesto = {
+        'versao': 1,
+        'criterios': {
+            'latitude': LATITUDE, 'longitude': LONGITUDE, 'lacuna_max_s': LACUNA_MAX_S,
+            'fracao_invalidas': FRACAO_INVALIDAS, 'fracao_duplicados': FRACAO_DUPLICADOS,
+            'cobertura_min': COBERTURA_MIN,
+        },
+        'horas': dict(sorted(horas.items())),
+    }
+    gravar_manifesto(pasta, manifesto)
+    return manifesto, snapshots
+
+
+def descrever(hora, entrada):
+    """Linha do relatório de uma hora que falta ou não está ok."""
+    if entrada is None:
+        return f'{hora:02d}h faltando'
+    texto = f"{hora:02d}h {entrada['situacao']}"
+    if entrada['motivos']:
+        texto += f" ({'; '.join(entrada['motivos'])})"
+    return texto
+
+
+def relatar(manifesto, snapshots):
+    """Uma linha por dia do período, com as horas que faltam ou têm problemas."""
+    horas = manifesto['horas']
+    dias = sorted({d for d, _ in snapshots})
+    dia = dias[0]
+    while dia <= dias[-1]:
+        entradas = [horas.get(chave_hora(dia, h)) for h in range(24)]
+        presentes = [e for e in entradas if e is not None]
+        registros = sum(e['registros'] for e in presentes)
+        carros = max((e['carros'] for e in presentes), default=0)
+        problemas = [descrever(h, e) for h, e in enumerate(entradas) if e is None or e['situacao'] != 'ok']
+        marca = '' if not problemas else '------------ '
+        print(f'{marca}{dia}: {len(presentes)}/24 horas, {registros} registros, até {carros} carros')
+        for p in problemas:
+            print(f'    {p}')
+        dia += timedelta(days=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica os snapshots do SPPO e grava o manifesto da pasta.')
+    parser.add_argument('pasta', nargs='?', default='sppo', help='pasta dos snapshots (padrão: sppo/)')
+    parser.add_argument('--inicio', type=date.fromisoformat, default=None, help='primeiro dia verificado, AAAA-MM-DD')
+    parser.add_argument('--fim', type=date.fromisoformat, default=None, help='último dia verificado, AAAA-MM-DD')
+    parser.add_argument('-p', '--processos', type=int, default=0,
+                        help='número de processos (padrão: 0, todos os núcleos)')
+    parser.add_argument('--refazer', action='store_true',
+                        help='verifica de novo todos os arquivos, mesmo os que não mudaram')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    with Metricas('verificacao', args) as metricas:
+        manifesto, snapshots = verificar(args)
+        metricas.registros = sum(manifesto['horas'][chave_hora(*k)]['registros'] for k in snapshots)
+    relatar(manifesto, snapshots)
+
+
+if __name__ == "__main__":
+    main()